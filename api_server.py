@@ -0,0 +1,359 @@
+"""
+Headless HTTP API for programmatic compliance checks
+
+Endpoints:
+    GET  /health           Service status, backend connectivity, load, rerank gate and per-endpoint stats
+    POST /analyze          {"feature": "...", "max_chunks": 5, "rerank": true} -> audit record + evidence
+    POST /analyze/stream   Same body; server-sent events: "section" per parsed section, then "result"
+    POST /rerank           {"query": "...", "evidence": [...], "max_chunks": 5} -> reranked evidence
+    GET  /costs            Token / cost totals per day and analysis mode
+    GET  /decisions        Aggregates over stored decisions (?metric=, group_by= and filters)
+
+Every response carries X-Request-ID (taken from the request header or generated).
+"X-Profile: 1" or "?profile=1" (or PROFILE_SAMPLE_RATE) samples the request's stacks
+into profiles/<request_id>.collapsed, named in the X-Profile-File header.
+
+The RAGFlow client and reranker are shared by all requests; blocking SDK calls run
+on a bounded thread pool and a request-level semaphore limits concurrent analyses.
+
+Usage:
+    python api_server.py --port 8080 --max-concurrency 8
+    python api_server.py --stub --token-delay 0.02     # local stubs, for load tests
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Dict, List, Any, Optional
+
+from aiohttp import web
+
+from cassette import create_clients, get_cassette
+from cost_accounting import UsageMeter, get_ledger
+from decision_store import get_decision_store, record_decision
+from profiler import profile_path, profile_request, should_profile
+from stub_backends import create_stub_clients
+
+MAX_CHUNKS_LIMIT = 50
+
+SECTION_HEADERS = ('CLASSIFICATION', 'CONFIDENCE', 'REASONING', 'REGULATIONS', 'EVIDENCE')
+SECTION_PATTERN = re.compile(r'^\s*(' + '|'.join(SECTION_HEADERS) + r'):', re.MULTILINE)
+
+
+class SectionStreamer:
+    """Turns cumulative streamed content into completed sections, each emitted once"""
+
+    def __init__(self, ragflow_client):
+        self.ragflow_client = ragflow_client
+        self.emitted = set()
+
+    def feed(self, content: str, final: bool = False) -> List[Dict[str, str]]:
+        headers = [match.group(1) for match in SECTION_PATTERN.finditer(content)]
+        # A section is complete once a later header has started (or the stream ended)
+        complete = headers if final else headers[:-1]
+        parsed = self.ragflow_client._parse_sections(content)
+
+        sections = []
+        for header in complete:
+            if header in self.emitted or header == 'EVIDENCE':
+                continue
+            self.emitted.add(header)
+            sections.append({'section': header.lower(), 'value': parsed[header.lower()]})
+        return sections
+
+
+class ComplianceAPI:
+    def __init__(self, ragflow_client, reranker, max_concurrency: int = 8, queue_timeout: float = 5.0,
+                 heartbeat_seconds: float = 15.0):
+        self.ragflow_client = ragflow_client
+        self.reranker = reranker
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.heartbeat_seconds = heartbeat_seconds
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='analysis')
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.started_at = time.time()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get('/health', self.health)
+        app.router.add_post('/analyze', self.analyze)
+        app.router.add_post('/analyze/stream', self.analyze_stream)
+        app.router.add_post('/rerank', self.rerank)
+        app.router.add_get('/costs', self.costs)
+        app.router.add_get('/decisions', self.decisions)
+        app.on_startup.append(self._on_startup)
+        app.on_cleanup.append(self._on_cleanup)
+        return app
+
+    async def _on_startup(self, app):
+        # Created inside the running loop
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    async def _on_cleanup(self, app):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    @asynccontextmanager
+    async def _slot(self):
+        """Acquire a concurrency slot or reject with 503 when the queue wait is too long"""
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise web.HTTPServiceUnavailable(
+                text=json.dumps({'error': 'Too many concurrent requests'}),
+                content_type='application/json',
+                headers={'Retry-After': '1'}
+            )
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+            self._semaphore.release()
+
+    def _profiling(self, request: web.Request):
+        """Request ID and whether this request is profiled (header, query param or sampling rate)"""
+        request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex[:16]
+        flag = request.headers.get('X-Profile') or request.query.get('profile') or ''
+        return request_id, should_profile(flag.lower() in ('1', 'true', 'yes'))
+
+    def _tracing_headers(self, request_id: str, profiled: bool) -> Dict[str, str]:
+        headers = {'X-Request-ID': request_id}
+        if profiled:
+            headers['X-Profile-File'] = profile_path(request_id)
+        return headers
+
+    async def _run_blocking(self, func, *args, sampler=None):
+        """Run func on the thread pool; with a sampler, the worker thread is profiled for the call"""
+        if sampler is not None:
+            func = sampler.wrap(func)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def _read_body(self, request: web.Request, required: str) -> Dict[str, Any]:
+        """JSON body with the required text field and validated optional fields (defaults filled in)"""
+        def bad_request(message: str):
+            return web.HTTPBadRequest(text=json.dumps({'error': message}), content_type='application/json')
+
+        try:
+            body = await request.json()
+        except ValueError:
+            raise bad_request('Body must be JSON')
+        if not isinstance(body, dict):
+            raise bad_request('Body must be a JSON object')
+
+        value = body.get(required)
+        if not isinstance(value, str) or not value.strip():
+            raise bad_request(f"'{required}' must be a non-empty string")
+        body[required] = value.strip()
+
+        max_chunks = body.setdefault('max_chunks', 5)
+        if isinstance(max_chunks, bool) or not isinstance(max_chunks, int) or \
+                not 1 <= max_chunks <= MAX_CHUNKS_LIMIT:
+            raise bad_request(f"'max_chunks' must be an integer from 1 to {MAX_CHUNKS_LIMIT}")
+        if not isinstance(body.setdefault('rerank', True), bool):
+            raise bad_request("'rerank' must be true or false")
+
+        # The gate reads similarity_score, the key /analyze returns; it may be absent or null
+        evidence = body.setdefault('evidence', [])
+        if not isinstance(evidence, list) or not all(
+                isinstance(chunk, dict) and isinstance(chunk.get('content', ''), str) and
+                self._is_score(chunk.get('similarity_score')) for chunk in evidence):
+            raise bad_request("'evidence' must be a list of objects with string 'content' and numeric "
+                              "'similarity_score' (optional)")
+        return body
+
+    @staticmethod
+    def _is_score(value) -> bool:
+        return value is None or (isinstance(value, (int, float)) and not isinstance(value, bool))
+
+    def _build_result(self, feature: str, result: Dict[str, Any], max_chunks: int, rerank: bool,
+                      meter: UsageMeter) -> Dict[str, Any]:
+        """Rerank, audit and cost a raw analysis result (runs on the thread pool)"""
+        if rerank:
+            evidence, gate = self.reranker.rerank_evidence_gated(feature, result['evidence'], max_chunks=max_chunks,
+                                                                 meter=meter)
+        else:
+            evidence, gate = result['evidence'][:max_chunks], None
+        usage = meter.summary()
+        audit_record = self.ragflow_client.process_compliance_response(
+            result['answer'], result['evidence'], usage=usage, analysis_mode=result.get('analysis_mode')
+        )
+        get_ledger().record(usage, result.get('analysis_mode'))
+        record_decision(audit_record)
+        return {
+            'feature': feature,
+            'mode': result.get('mode'),
+            'analysis_mode': result.get('analysis_mode'),
+            'latency_seconds': result.get('latency_seconds'),
+            'audit_record': audit_record,
+            'evidence': evidence,
+            'rerank_gate': gate
+        }
+
+    async def health(self, request: web.Request) -> web.Response:
+        connected = self.ragflow_client.is_connected()
+        return web.json_response({
+            'status': 'ok' if connected else 'degraded',
+            'ragflow_connected': connected,
+            'reranker_enabled': self.reranker.client is not None,
+            'analysis_mode': self.ragflow_client.analysis_mode,
+            'in_flight': self.in_flight,
+            'max_concurrency': self.max_concurrency,
+            'completed': self.completed,
+            'rejected': self.rejected,
+            'uptime_seconds': round(time.time() - self.started_at, 1),
+            'rerank_gate': self.reranker.get_gate_stats(),
+            'endpoints': self.ragflow_client.get_endpoint_stats()
+        }, status=200 if connected else 503)
+
+    async def analyze(self, request: web.Request) -> web.Response:
+        body = await self._read_body(request, 'feature')
+        feature, max_chunks, rerank = body['feature'], body['max_chunks'], body['rerank']
+        request_id, profiled = self._profiling(request)
+        headers = self._tracing_headers(request_id, profiled)
+        meter = UsageMeter()
+
+        async with self._slot():
+            # The event loop thread is shared by all requests; only the executor calls are sampled
+            with profile_request(request_id, enabled=profiled, attach_current_thread=False) as sampler:
+                result = await self._run_blocking(self.ragflow_client.run_analysis, feature, None, meter,
+                                                  sampler=sampler)
+                if result['mode'] == 'error':
+                    return web.json_response({'error': result['answer'], 'feature': feature}, status=502,
+                                             headers=headers)
+                payload = await self._run_blocking(self._build_result, feature, result, max_chunks, rerank, meter,
+                                                   sampler=sampler)
+        return web.json_response(payload, headers=headers)
+
+    async def analyze_stream(self, request: web.Request) -> web.StreamResponse:
+        body = await self._read_body(request, 'feature')
+        feature, max_chunks, rerank = body['feature'], body['max_chunks'], body['rerank']
+        request_id, profiled = self._profiling(request)
+        meter = UsageMeter()
+
+        async with self._slot():
+            with profile_request(request_id, enabled=profiled, attach_current_thread=False) as sampler:
+                response = web.StreamResponse(headers={
+                    'Content-Type': 'text/event-stream',
+                    'Cache-Control': 'no-cache',
+                    'Connection': 'keep-alive',
+                    'X-Accel-Buffering': 'no',
+                    **self._tracing_headers(request_id, profiled)
+                })
+                await response.prepare(request)
+
+                loop = asyncio.get_running_loop()
+                updates: asyncio.Queue = asyncio.Queue()
+                streamer = SectionStreamer(self.ragflow_client)
+
+                def on_content(content: str):
+                    loop.call_soon_threadsafe(updates.put_nowait, content)
+
+                analysis = asyncio.ensure_future(
+                    self._run_blocking(self.ragflow_client.run_analysis, feature, on_content, meter, sampler=sampler)
+                )
+                # Content callbacks are queued before the result, so None marks the end of the stream
+                analysis.add_done_callback(lambda _: updates.put_nowait(None))
+
+                while True:
+                    try:
+                        content = await asyncio.wait_for(updates.get(), timeout=self.heartbeat_seconds)
+                    except asyncio.TimeoutError:
+                        await response.write(b': keep-alive\n\n')
+                        continue
+                    if content is None:
+                        break
+                    for section in streamer.feed(content):
+                        await self._send_event(response, 'section', section)
+
+                result = await analysis
+                if result['mode'] == 'error':
+                    await self._send_event(response, 'error', {'error': result['answer'], 'feature': feature})
+                else:
+                    for section in streamer.feed(result['answer'], final=True):
+                        await self._send_event(response, 'section', section)
+                    payload = await self._run_blocking(self._build_result, feature, result, max_chunks, rerank,
+                                                       meter, sampler=sampler)
+                    await self._send_event(response, 'result', payload)
+
+                await response.write_eof()
+        return response
+
+    async def _send_event(self, response: web.StreamResponse, event: str, data: Dict[str, Any]):
+        await response.write(f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n".encode('utf-8'))
+
+    async def rerank(self, request: web.Request) -> web.Response:
+        body = await self._read_body(request, 'query')
+        evidence, max_chunks = body['evidence'], body['max_chunks']
+        request_id, profiled = self._profiling(request)
+        meter = UsageMeter()
+
+        async with self._slot():
+            with profile_request(request_id, enabled=profiled, attach_current_thread=False) as sampler:
+                reranked, gate = await self._run_blocking(
+                    self.reranker.rerank_evidence_gated, body['query'], evidence, max_chunks, meter, sampler=sampler
+                )
+        usage = meter.summary()
+        get_ledger().record(usage, 'rerank_only')
+        return web.json_response({'evidence': reranked, 'rerank_gate': gate, 'usage': usage},
+                                 headers=self._tracing_headers(request_id, profiled))
+
+    async def costs(self, request: web.Request) -> web.Response:
+        return web.json_response(get_ledger().totals())
+
+    async def decisions(self, request: web.Request) -> web.Response:
+        store = get_decision_store()
+        if store is None:
+            return web.json_response({'error': 'DECISION_STORE_PATH is not set'}, status=404)
+        params = request.query
+        filters = [params.get(name) for name in ('classification', 'regulation', 'analysis_mode', 'start', 'end')]
+
+        def count_and_query():
+            # len() flushes and takes the store lock too, so it stays off the event loop
+            return len(store), store.query(params.get('metric', 'count'), params.get('group_by'), *filters)
+
+        try:
+            records, result = await self._run_blocking(count_and_query)
+        except ValueError as e:
+            return web.json_response({'error': str(e)}, status=400)
+        return web.json_response({'records': records, 'result': result})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default=os.getenv('API_HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('API_PORT', '8080')))
+    parser.add_argument('--max-concurrency', type=int, default=int(os.getenv('API_MAX_CONCURRENCY', '8')))
+    parser.add_argument('--queue-timeout', type=float, default=float(os.getenv('API_QUEUE_TIMEOUT', '5')),
+                        help='Seconds a request may wait for a slot before a 503')
+    parser.add_argument('--heartbeat', type=float, default=15.0, help='SSE keep-alive interval in seconds')
+    parser.add_argument('--keepalive-timeout', type=float, default=75.0, help='HTTP keep-alive timeout in seconds')
+    parser.add_argument('--stub', action='store_true', help='Serve from local stub backends (load testing)')
+    parser.add_argument('--token-delay', type=float, default=0.0, help='Stub delay per streamed message')
+    args = parser.parse_args()
+
+    if args.stub:
+        ragflow_client, reranker = create_stub_clients(token_delay=args.token_delay)
+    else:
+        ragflow_client, reranker = create_clients(get_cassette())
+
+    api = ComplianceAPI(ragflow_client, reranker, max_concurrency=args.max_concurrency,
+                        queue_timeout=args.queue_timeout, heartbeat_seconds=args.heartbeat)
+    print(f"🚀 Compliance API on http://{args.host}:{args.port} (max concurrency {args.max_concurrency})")
+    web.run_app(api.build_app(), host=args.host, port=args.port, keepalive_timeout=args.keepalive_timeout,
+                print=None)
+
+
+if __name__ == "__main__":
+    main()
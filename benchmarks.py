@@ -0,0 +1,268 @@
+"""
+Latency / token benchmarks for the compliance pipeline
+
+Usage:
+    python benchmarks.py fanout "Feature description" ["Another feature" ...]
+    python benchmarks.py rerank --sizes 10 50 200 --repeats 5
+    python benchmarks.py loadtest --url http://localhost:8080 --requests 200 --concurrency 16
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import itertools
+import json
+import random
+import re
+import statistics
+import time
+from types import SimpleNamespace
+from typing import Dict, List, Any, Optional
+
+import aiohttp
+
+from ragflow_client import RAGFlowClient
+from reranking_utils import EvidenceReranker
+
+
+def benchmark_fanout(features: List[str], repeats: int = 1) -> Dict[str, Any]:
+    """Compare the monolithic prompt against per-regulation fan-out on the same features"""
+    client = RAGFlowClient()
+    rows = []
+
+    for feature in features:
+        for _ in range(repeats):
+            monolithic = client.analyze_feature(feature)
+            fanout = client.analyze_feature_fanout(feature)
+            rows.append({
+                'feature': feature,
+                'monolithic': monolithic,
+                'fanout': fanout
+            })
+
+    summary = {}
+    for mode in ('monolithic', 'fanout'):
+        ok = [row[mode] for row in rows if row[mode]['mode'] != 'error']
+        summary[mode] = {
+            'runs': len(rows),
+            'errors': len(rows) - len(ok),
+            'mean_latency_seconds': statistics.mean(r['latency_seconds'] for r in ok) if ok else None,
+            'mean_generated_chars': statistics.mean(r['generated_chars'] for r in ok) if ok else None,
+            'mean_estimated_tokens': statistics.mean(r['estimated_tokens'] for r in ok) if ok else None,
+        }
+    summary['early_exits'] = sum(
+        1 for row in rows
+        if any(b['status'] == 'cancelled' for b in row['fanout'].get('branches', []))
+    )
+    summary['rows'] = rows
+    return summary
+
+
+def _fmt(value, width: int, decimals: int = 0) -> str:
+    if value is None:
+        return 'n/a'.rjust(width)
+    return f"{value:>{width}.{decimals}f}"
+
+
+def _print_fanout(summary: Dict[str, Any]):
+    print(f"\n{'mode':<12} {'runs':>5} {'errors':>7} {'latency (s)':>12} {'gen chars':>10} {'est tokens':>11}")
+    for mode in ('monolithic', 'fanout'):
+        s = summary[mode]
+        print(f"{mode:<12} {s['runs']:>5} {s['errors']:>7} {_fmt(s['mean_latency_seconds'], 12, 2)} "
+              f"{_fmt(s['mean_generated_chars'], 10)} {_fmt(s['mean_estimated_tokens'], 11)}")
+    print(f"\nFan-out early exits: {summary['early_exits']}")
+    for row in summary['rows']:
+        verdicts = ', '.join(
+            f"{b['regulation_id']}={b['classification'] or b['status']}"
+            for b in row['fanout'].get('branches', [])
+        )
+        print(f"- {row['feature'][:60]}: {verdicts}")
+
+
+class SimulatedListwiseRanker:
+    """
+    Offline stand-in for the ranking LLM. Each chunk carries a hidden relevance; the
+    simulated model ranks by relevance plus noise that grows with the list length,
+    takes longer for longer prompts, and stops listing after max_listed ranks (long
+    lists lose the tail) or when its output reaches max_tokens, whichever comes first.
+    """
+
+    def __init__(self, seed: int, time_scale: float = 0.1, noise: float = 0.05, max_listed: int = 40):
+        self.seed = seed
+        self.time_scale = time_scale
+        self.noise = noise
+        self.max_listed = max_listed
+        self.calls = 0
+        self.truncated = 0
+        self.chat = SimpleNamespace(completions=self)
+
+    def create(self, model: str = '', messages: Optional[List] = None, max_tokens: int = 100, **kwargs):
+        self.calls += 1
+        prompt = messages[-1]['content']
+        relevances = [float(r) for r in re.findall(r'^Evidence \d+: \[relevance=([\d.]+)\]', prompt, flags=re.MULTILINE)]
+        count = len(relevances)
+
+        # Prefill grows with the prompt, decoding with the number of ranks emitted
+        time.sleep(self.time_scale * (0.3 + 0.01 * count + 0.005 * count))
+
+        rng = random.Random(f"{self.seed}:{prompt}")
+        noise = self.noise * (1 + count / 20)
+        scored = [(relevance + rng.gauss(0, noise), i + 1) for i, relevance in enumerate(relevances)]
+        ranking = [rank for _, rank in sorted(scored, reverse=True)]
+        # Roughly 3 characters per token for "12, "
+        content = json.dumps(ranking[:self.max_listed])[:max_tokens * 3]
+        if len(content) < len(json.dumps(ranking)):
+            self.truncated += 1
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=None)
+
+
+def benchmark_reranking(sizes: List[int], repeats: int = 5, top_k: int = 5, time_scale: float = 0.1,
+                        max_listed: int = 40) -> List[Dict[str, Any]]:
+    """Latency, accuracy and run-to-run stability of single-prompt vs windowed reranking"""
+    rows = []
+    for size in sizes:
+        rng = random.Random(size)
+        relevance = {str(i): round(rng.random(), 4) for i in range(size)}
+        chunks = [
+            {
+                'content': f"[relevance={relevance[chunk_id]}] Regulatory text {chunk_id}",
+                'source': 'benchmark',
+                'chunk_id': chunk_id,
+                'similarity_score': 0.5
+            }
+            for chunk_id in relevance
+        ]
+        true_top = set(sorted(relevance, key=relevance.get, reverse=True)[:top_k])
+
+        for strategy in ('single', 'windowed'):
+            latencies, tops, calls, truncated = [], [], 0, 0
+            for run in range(repeats):
+                ranker = SimulatedListwiseRanker(seed=run, time_scale=time_scale, max_listed=max_listed)
+                reranker = EvidenceReranker(client=ranker)
+                reranker.gating_enabled = False
+                if strategy == 'single':
+                    reranker.window_size = max(size, 1)
+
+                start_time = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    result = reranker.rerank_evidence('benchmark query', chunks, max_chunks=top_k)
+                latencies.append(time.perf_counter() - start_time)
+                tops.append({c['chunk_id'] for c in result})
+                calls += ranker.calls
+                truncated += ranker.truncated
+
+            pairs = list(itertools.combinations(tops, 2))
+            rows.append({
+                'chunks': size,
+                'strategy': strategy,
+                'mean_latency_seconds': statistics.mean(latencies),
+                'llm_calls_per_run': calls / repeats,
+                'truncated_calls_per_run': truncated / repeats,
+                'recall_at_k': statistics.mean(len(top & true_top) / top_k for top in tops),
+                'stability': statistics.mean(len(a & b) / len(a | b) for a, b in pairs) if pairs else 1.0
+            })
+    return rows
+
+
+def _print_reranking(rows: List[Dict[str, Any]]):
+    print(f"\n{'chunks':>6} {'strategy':<9} {'latency (s)':>12} {'calls':>6} {'truncated':>10} "
+          f"{'recall@k':>9} {'stability':>10}")
+    for row in rows:
+        print(f"{row['chunks']:>6} {row['strategy']:<9} {_fmt(row['mean_latency_seconds'], 12, 3)} "
+              f"{_fmt(row['llm_calls_per_run'], 6, 1)} {_fmt(row['truncated_calls_per_run'], 10, 1)} "
+              f"{_fmt(row['recall_at_k'], 9, 2)} {_fmt(row['stability'], 10, 2)}")
+
+    # Windowing trades latency (sequential tournament rounds) for recall; say which way it went
+    by_size = {}
+    for row in rows:
+        by_size.setdefault(row['chunks'], {})[row['strategy']] = row['mean_latency_seconds']
+    for size, latency in sorted(by_size.items()):
+        if latency.get('single') and latency.get('windowed') is not None and size > 0:
+            ratio = latency['windowed'] / latency['single']
+            verdict = 'slower' if ratio > 1.05 else 'faster' if ratio < 0.95 else 'within noise'
+            print(f"{size} chunks: windowed is {ratio:.2f}x the single-prompt latency ({verdict})")
+
+
+async def _load_test(url: str, features: List[str], total: int, concurrency: int, stream: bool) -> Dict[str, Any]:
+    endpoint = f"{url.rstrip('/')}/analyze/stream" if stream else f"{url.rstrip('/')}/analyze"
+    latencies, statuses = [], {}
+    queue: asyncio.Queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(features[i % len(features)])
+
+    async def worker(session):
+        while not queue.empty():
+            feature = queue.get_nowait()
+            start_time = time.perf_counter()
+            try:
+                async with session.post(endpoint, json={'feature': feature}) as response:
+                    await response.read()
+                    status = response.status
+            except aiohttp.ClientError:
+                status = 'connection_error'
+            latencies.append(time.perf_counter() - start_time)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    start_time = time.perf_counter()
+    # One keep-alive connection pool shared by all workers
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=300)) as session:
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start_time
+
+    latencies.sort()
+    return {
+        'requests': total,
+        'concurrency': concurrency,
+        'elapsed_seconds': elapsed,
+        'throughput_rps': total / elapsed if elapsed else None,
+        'p50_seconds': latencies[len(latencies) // 2] if latencies else None,
+        'p95_seconds': latencies[int(0.95 * (len(latencies) - 1))] if latencies else None,
+        'statuses': statuses
+    }
+
+
+LOADTEST_FEATURES = [
+    "Feature reads user location to enforce France's copyright rules (download blocking)",
+    "Age gates specific to Indonesia's Child Protection Law",
+    "Geofences feature rollout in US for market testing",
+    "Video filter feature available globally except KR",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    fanout_parser = subparsers.add_parser('fanout', help='Monolithic prompt vs per-regulation fan-out')
+    fanout_parser.add_argument('features', nargs='+', help='Feature descriptions to analyze')
+    fanout_parser.add_argument('--repeats', type=int, default=1)
+
+    rerank_parser = subparsers.add_parser('rerank', help='Single-prompt vs windowed reranking (simulated LLM)')
+    rerank_parser.add_argument('--sizes', type=int, nargs='+', default=[10, 50, 200])
+    rerank_parser.add_argument('--repeats', type=int, default=5)
+    rerank_parser.add_argument('--top-k', type=int, default=5)
+    rerank_parser.add_argument('--time-scale', type=float, default=0.1, help='Scale simulated LLM latency')
+    rerank_parser.add_argument('--max-listed', type=int, default=40,
+                               help='Ranks the simulated LLM emits before dropping the tail')
+
+    load_parser = subparsers.add_parser('loadtest', help='Load test a running api_server.py')
+    load_parser.add_argument('--url', default='http://localhost:8080')
+    load_parser.add_argument('--requests', type=int, default=100)
+    load_parser.add_argument('--concurrency', type=int, default=8)
+    load_parser.add_argument('--stream', action='store_true', help='Use the SSE endpoint')
+
+    args = parser.parse_args()
+
+    if args.command == 'fanout':
+        _print_fanout(benchmark_fanout(args.features, repeats=args.repeats))
+    elif args.command == 'rerank':
+        _print_reranking(benchmark_reranking(args.sizes, repeats=args.repeats, top_k=args.top_k,
+                                             time_scale=args.time_scale, max_listed=args.max_listed))
+    elif args.command == 'loadtest':
+        summary = asyncio.run(_load_test(args.url, LOADTEST_FEATURES, args.requests, args.concurrency, args.stream))
+        print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,424 @@
+"""
+Record/replay layer for RAGFlow and OpenAI traffic
+
+In record mode the live RAGFlow assistant and OpenAI client are wrapped so every
+streamed answer (with references and inter-message timing) and every chat
+completion is written to a gzipped JSON-lines cassette, keyed by a hash of the request.
+In replay mode they are replaced by network-free fakes that serve the cassette back.
+
+Recorded interactions are buffered and appended as one gzip member per flush
+(every FLUSH_EVERY interactions and at exit), so recording never rewrites the
+file. Streams closed before their last message are not recorded.
+
+Usage:
+    CASSETTE_MODE=record CASSETTE_PATH=cassettes/today.json.gz streamlit run fixed_tiktok_app.py
+    python cassette.py replay cassettes/today.json.gz --features features.txt --workers 8
+    python cassette.py info cassettes/today.json.gz
+"""
+
+import argparse
+import atexit
+import gzip
+import hashlib
+import json
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from types import SimpleNamespace
+from typing import Dict, List, Any, Optional, Tuple
+
+from cost_accounting import BatchBudget, UsageMeter
+from ragflow_client import RAGFlowClient
+from reranking_utils import EvidenceReranker
+
+CASSETTE_VERSION = 1
+FLUSH_EVERY = 50
+CASSETTE_MODES = ('off', 'record', 'replay')
+TIMING_MODES = ('recorded', 'compressed', 'none')
+
+
+class CassetteMiss(KeyError):
+    """Raised in replay mode when a request was never recorded"""
+
+
+def request_hash(kind: str, payload: Any) -> str:
+    """Stable key for a request: kind + canonical JSON of its payload"""
+    canonical = json.dumps([kind, payload], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:20]
+
+
+class Cassette:
+    def __init__(self, path: str, mode: str = 'replay', timing: str = 'compressed', time_scale: float = 0.1):
+        if mode not in CASSETTE_MODES:
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        if timing not in TIMING_MODES:
+            raise ValueError(f"Unknown cassette timing: {timing}")
+
+        self.path = path
+        self.mode = mode
+        self.timing = timing
+        self.time_scale = time_scale
+        self.interactions: Dict[str, List[Dict]] = {}
+        self._replay_counters: Dict[str, int] = {}
+        self._pending: List[Tuple[str, Dict]] = []
+        # A new file gets its header written with the first flush
+        self._rewrite = not os.path.exists(path)
+        self._lock = threading.Lock()
+
+        if os.path.exists(path):
+            self._load()
+            print(f"📼 Loaded cassette {path} ({self.size()} interactions)")
+        elif mode == 'replay':
+            raise FileNotFoundError(f"Cassette not found: {path}")
+        if mode == 'record':
+            atexit.register(self.close)
+
+    def _load(self):
+        with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+            header = json.loads(f.readline())
+            if header.get('version') != CASSETTE_VERSION:
+                raise ValueError(f"Unsupported cassette version {header.get('version')} in {self.path}")
+            for line in f:
+                if line.strip():
+                    item = json.loads(line)
+                    self.interactions.setdefault(item['key'], []).append(item['entry'])
+
+    def size(self) -> int:
+        return sum(len(entries) for entries in self.interactions.values())
+
+    def record(self, key: str, entry: Dict):
+        """Add an interaction; it is written to disk with the next flush"""
+        with self._lock:
+            self.interactions.setdefault(key, []).append(entry)
+            self._pending.append((key, entry))
+            if len(self._pending) >= FLUSH_EVERY:
+                self._flush_locked()
+
+    def lookup(self, key: str) -> Dict:
+        """Next recorded interaction for a key; repeated requests cycle through the recordings"""
+        with self._lock:
+            entries = self.interactions.get(key)
+            if not entries:
+                raise CassetteMiss(key)
+            index = self._replay_counters.get(key, 0)
+            self._replay_counters[key] = index + 1
+            return entries[index % len(entries)]
+
+    def wait(self, seconds: float):
+        """Sleep for a recorded delay according to the timing mode"""
+        if self.timing == 'recorded':
+            delay = seconds
+        elif self.timing == 'compressed':
+            delay = seconds * self.time_scale
+        else:
+            delay = 0
+        if delay > 0:
+            time.sleep(delay)
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def close(self):
+        self.flush()
+
+    def _flush_locked(self):
+        if not self._pending and not self._rewrite:
+            return
+        if self._rewrite:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+                f.write(json.dumps({'version': CASSETTE_VERSION}) + '\n')
+                for key, entries in self.interactions.items():
+                    for entry in entries:
+                        f.write(self._line(key, entry))
+            os.replace(tmp_path, self.path)
+            self._rewrite = False
+        else:
+            # Appending opens a new gzip member; readers see one continuous stream
+            with gzip.open(self.path, 'at', encoding='utf-8') as f:
+                for key, entry in self._pending:
+                    f.write(self._line(key, entry))
+        self._pending.clear()
+
+    @staticmethod
+    def _line(key: str, entry: Dict) -> str:
+        return json.dumps({'key': key, 'entry': entry}, separators=(',', ':'), ensure_ascii=False) + '\n'
+
+
+def _reference_to_dict(ref) -> Dict:
+    """References may be dicts or SDK objects; keep the fields the client reads"""
+    if isinstance(ref, dict):
+        return ref
+    return {
+        'content': getattr(ref, 'content', ''),
+        'document_name': getattr(ref, 'document_name', 'Unknown'),
+        'id': getattr(ref, 'id', ''),
+        'similarity': getattr(ref, 'similarity', 0.0)
+    }
+
+
+# ---------------------------------------------------------------------------
+# RAGFlow
+# ---------------------------------------------------------------------------
+
+class RecordingSession:
+    """Wraps a live RAGFlow session and records each streamed answer"""
+
+    def __init__(self, session, cassette: Cassette):
+        self._session = session
+        self._cassette = cassette
+        self.id = session.id
+
+    def ask(self, question: str = "", stream: bool = False, **kwargs):
+        start_time = time.time()
+        last_offset = 0.0
+        previous_content = ""
+        messages = []
+        last_message = None
+        complete = False
+
+        try:
+            for message in self._session.ask(question, stream=stream, **kwargs):
+                now = time.time() - start_time
+                content = getattr(message, 'content', '') or ''
+                # Content is cumulative; store only what was appended (or the full text if it was rewritten)
+                if content.startswith(previous_content):
+                    messages.append([round(now - last_offset, 4), content[len(previous_content):], 0])
+                else:
+                    messages.append([round(now - last_offset, 4), content, 1])
+                previous_content = content
+                last_offset = now
+                last_message = message
+                yield message
+            complete = True
+        finally:
+            # A stream closed early (fan-out cancellation, error, consumer break) would
+            # replay as a truncated answer, so only complete streams are recorded
+            if complete:
+                reference = getattr(last_message, 'reference', None) if last_message is not None else None
+                self._cassette.record(request_hash('ragflow.ask', question), {
+                    'kind': 'ragflow.ask',
+                    'messages': messages,
+                    'reference': [_reference_to_dict(ref) for ref in reference] if reference else None
+                })
+
+
+class RecordingAssistant:
+    """Wraps a live RAGFlow chat assistant so its sessions are recorded"""
+
+    def __init__(self, assistant, cassette: Cassette):
+        self._assistant = assistant
+        self._cassette = cassette
+        self.name = assistant.name
+
+    def create_session(self, **kwargs):
+        return RecordingSession(self._assistant.create_session(**kwargs), self._cassette)
+
+
+class ReplaySession:
+    """Serves recorded streamed answers back without touching the network"""
+
+    def __init__(self, session_id: str, cassette: Cassette):
+        self.id = session_id
+        self._cassette = cassette
+
+    def ask(self, question: str = "", stream: bool = False, **kwargs):
+        entry = self._cassette.lookup(request_hash('ragflow.ask', question))
+        content = ""
+        messages = entry['messages']
+
+        for i, (delay, text, is_full) in enumerate(messages):
+            self._cassette.wait(delay)
+            content = text if is_full else content + text
+            # Only the final message carries references, matching what the client reads
+            reference = entry['reference'] if i == len(messages) - 1 else None
+            yield SimpleNamespace(content=content, reference=reference, role='assistant')
+
+
+class ReplayAssistant:
+    """Drop-in replacement for the RAGFlow chat assistant in replay mode"""
+
+    def __init__(self, cassette: Cassette):
+        self._cassette = cassette
+        self._session_count = 0
+        self._lock = threading.Lock()
+        self.name = f"cassette:{os.path.basename(cassette.path)}"
+
+    def create_session(self, **kwargs):
+        with self._lock:
+            self._session_count += 1
+            session_id = f"replay-{self._session_count}"
+        return ReplaySession(session_id, self._cassette)
+
+
+# ---------------------------------------------------------------------------
+# OpenAI
+# ---------------------------------------------------------------------------
+
+def _chat_key(kwargs: Dict) -> str:
+    return request_hash('openai.chat', kwargs)
+
+
+class _RecordingCompletions:
+    def __init__(self, client, cassette: Cassette):
+        self._client = client
+        self._cassette = cassette
+
+    def create(self, **kwargs):
+        start_time = time.time()
+        response = self._client.chat.completions.create(**kwargs)
+        usage = getattr(response, 'usage', None)
+        self._cassette.record(_chat_key(kwargs), {
+            'kind': 'openai.chat',
+            'content': response.choices[0].message.content,
+            'usage': {
+                'prompt_tokens': usage.prompt_tokens,
+                'completion_tokens': usage.completion_tokens
+            } if usage else None,
+            'latency': round(time.time() - start_time, 4)
+        })
+        return response
+
+
+class _ReplayCompletions:
+    def __init__(self, cassette: Cassette):
+        self._cassette = cassette
+
+    def create(self, **kwargs):
+        entry = self._cassette.lookup(_chat_key(kwargs))
+        self._cassette.wait(entry.get('latency', 0))
+        usage = entry.get('usage')
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(role='assistant', content=entry['content']))],
+            usage=SimpleNamespace(
+                prompt_tokens=usage['prompt_tokens'],
+                completion_tokens=usage['completion_tokens'],
+                total_tokens=usage['prompt_tokens'] + usage['completion_tokens']
+            ) if usage else None
+        )
+
+
+class RecordingOpenAI:
+    """Wraps an OpenAI client; only chat.completions.create is recorded"""
+
+    def __init__(self, client, cassette: Cassette):
+        self.chat = SimpleNamespace(completions=_RecordingCompletions(client, cassette))
+
+
+class ReplayOpenAI:
+    """Drop-in replacement for the OpenAI client in replay mode"""
+
+    def __init__(self, cassette: Cassette):
+        self.chat = SimpleNamespace(completions=_ReplayCompletions(cassette))
+
+
+# ---------------------------------------------------------------------------
+# Wiring
+# ---------------------------------------------------------------------------
+
+@lru_cache(maxsize=None)
+def get_cassette() -> Optional[Cassette]:
+    """Process-wide cassette configured from CASSETTE_* env vars (None when off)"""
+    mode = os.getenv('CASSETTE_MODE', 'off')
+    if mode == 'off':
+        return None
+    return Cassette(
+        os.getenv('CASSETTE_PATH', 'cassettes/default.json.gz'),
+        mode=mode,
+        timing=os.getenv('CASSETTE_TIMING', 'compressed'),
+        time_scale=float(os.getenv('CASSETTE_TIME_SCALE', '0.1'))
+    )
+
+
+def create_clients(cassette: Optional[Cassette] = None) -> Tuple[RAGFlowClient, EvidenceReranker]:
+    """Build the pipeline clients, wrapped for recording or replaced by fakes for replay"""
+    if cassette is None or cassette.mode == 'off':
+        return RAGFlowClient(), EvidenceReranker()
+
+    if cassette.mode == 'replay':
+        return (RAGFlowClient(assistant=ReplayAssistant(cassette)),
+                EvidenceReranker(client=ReplayOpenAI(cassette)))
+
+    ragflow_client = RAGFlowClient()
+    reranker = EvidenceReranker()
+    if ragflow_client.assistant:
+        ragflow_client.assistant = RecordingAssistant(ragflow_client.assistant, cassette)
+    if ragflow_client.router is not None:
+        ragflow_client.router.set_assistant_wrapper(lambda assistant: RecordingAssistant(assistant, cassette))
+    if reranker.client:
+        reranker.client = RecordingOpenAI(reranker.client, cassette)
+    return ragflow_client, reranker
+
+
+def replay_traffic(cassette: Cassette, features: List[str], workers: int = 4) -> Dict[str, Any]:
+    """Run the full pipeline over features against a replay cassette and measure throughput"""
+    ragflow_client, reranker = create_clients(cassette)
+    budget = BatchBudget()
+
+    def run_one(feature: str) -> Tuple[float, str]:
+        start_time = time.time()
+        meter = UsageMeter(batch=budget)
+        result = ragflow_client.run_analysis(feature, meter=meter)
+        reranker.rerank_evidence(feature, result['evidence'], max_chunks=5, meter=meter)
+        ragflow_client.process_compliance_response(result['answer'], result['evidence'], usage=meter.summary())
+        return time.time() - start_time, result['mode']
+
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        outcomes = list(executor.map(run_one, features))
+    elapsed = time.time() - start_time
+
+    latencies = sorted(latency for latency, _ in outcomes)
+    return {
+        'requests': len(features),
+        'errors': sum(1 for _, mode in outcomes if mode == 'error'),
+        'elapsed_seconds': round(elapsed, 3),
+        'throughput_rps': round(len(features) / elapsed, 2) if elapsed else None,
+        'p50_seconds': round(statistics.median(latencies), 3) if latencies else None,
+        'p95_seconds': round(latencies[int(0.95 * (len(latencies) - 1))], 3) if latencies else None,
+        'cost_usd': round(budget.spent, 6)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    info_parser = subparsers.add_parser('info', help='Summarize a cassette')
+    info_parser.add_argument('path')
+
+    replay_parser = subparsers.add_parser('replay', help='Replay traffic through the pipeline')
+    replay_parser.add_argument('path')
+    replay_parser.add_argument('--features', required=True, help='File with one feature description per line')
+    replay_parser.add_argument('--workers', type=int, default=4)
+    replay_parser.add_argument('--timing', choices=TIMING_MODES, default='compressed')
+    replay_parser.add_argument('--time-scale', type=float, default=0.1)
+
+    args = parser.parse_args()
+
+    if args.command == 'info':
+        cassette = Cassette(args.path, mode='replay')
+        kinds: Dict[str, int] = {}
+        for entries in cassette.interactions.values():
+            for entry in entries:
+                kinds[entry['kind']] = kinds.get(entry['kind'], 0) + 1
+        print(f"{len(cassette.interactions)} request keys, {cassette.size()} interactions")
+        for kind, count in sorted(kinds.items()):
+            print(f"  {kind}: {count}")
+
+    elif args.command == 'replay':
+        cassette = Cassette(args.path, mode='replay', timing=args.timing, time_scale=args.time_scale)
+        with open(args.features, encoding='utf-8') as f:
+            features = [line.strip() for line in f if line.strip()]
+        print(json.dumps(replay_traffic(cassette, features, workers=args.workers), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""
+Token and cost accounting per analysis and per stage
+
+Each request gets a UsageMeter. The stages record prompt and completion tokens:
+- OpenAI stages (rerank, explanation) use the response's `usage`.
+- RAGFlow reports no usage, so the analysis stage is estimated at ~4 chars per
+  token. The estimate covers our prompt, the retrieved chunks RAGFlow injects
+  into it, and the answer.
+The meter's summary is attached to the audit record. CostLedger aggregates
+finished requests into per-day / per-mode totals and, with COST_LEDGER_PATH set,
+appends one JSON line per request.
+
+Ceilings: COST_CEILING_PER_REQUEST_USD caps a single request and a BatchBudget
+(COST_CEILING_PER_BATCH_USD) caps a scan, replay or evaluation run. When a
+ceiling would be exceeded, optional stages are downgraded:
+- LLM reranking shrinks to the head of the list or falls back to similarity order.
+- Shadow reranks and relevance explanations are skipped.
+- Once the budget is spent, fan-out analysis falls back to the single prompt.
+
+Usage:
+    python cost_accounting.py report cost_ledger.jsonl
+"""
+
+import argparse
+import json
+import os
+import threading
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, List, Any, Optional
+
+from env_settings import env_float
+
+# USD per million (prompt, completion) tokens; the RAGFlow defaults assume a gpt-4o-mini class chat model
+PRICES_PER_1M = {
+    'openai': (env_float('OPENAI_PROMPT_PRICE_PER_1M', 0.15),
+               env_float('OPENAI_COMPLETION_PRICE_PER_1M', 0.60)),
+    'ragflow': (env_float('RAGFLOW_PROMPT_PRICE_PER_1M', 0.15),
+                env_float('RAGFLOW_COMPLETION_PRICE_PER_1M', 0.60)),
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (~4 chars per token) for backends that don't report usage"""
+    return (len(text) + 3) // 4
+
+
+def token_cost(backend: str, prompt_tokens: int, completion_tokens: int) -> float:
+    prompt_price, completion_price = PRICES_PER_1M[backend]
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+
+class BatchBudget:
+    """Cost ceiling shared by all requests of one batch run (scan, replay, evaluation)"""
+
+    def __init__(self, ceiling: Optional[float] = None):
+        self.ceiling = ceiling if ceiling is not None else env_float('COST_CEILING_PER_BATCH_USD', None)
+        self.spent = 0.0
+        self._lock = threading.Lock()
+
+    def charge(self, cost: float):
+        with self._lock:
+            self.spent += cost
+
+    def remaining(self) -> float:
+        return float('inf') if self.ceiling is None else self.ceiling - self.spent
+
+
+class UsageMeter:
+    """Token usage and cost of one request, broken down by stage"""
+
+    def __init__(self, ceiling: Optional[float] = None, batch: Optional[BatchBudget] = None):
+        self.ceiling = ceiling if ceiling is not None else env_float('COST_CEILING_PER_REQUEST_USD', None)
+        self.batch = batch
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self.downgrades: List[Dict[str, str]] = []
+        self.cost = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, backend: str, prompt_tokens: int, completion_tokens: int,
+               estimated: bool = False) -> float:
+        cost = token_cost(backend, prompt_tokens, completion_tokens)
+        with self._lock:
+            entry = self.stages.setdefault(stage, {
+                'backend': backend, 'calls': 0, 'prompt_tokens': 0, 'completion_tokens': 0,
+                'cost_usd': 0.0, 'estimated': False
+            })
+            entry['calls'] += 1
+            entry['prompt_tokens'] += prompt_tokens
+            entry['completion_tokens'] += completion_tokens
+            entry['cost_usd'] += cost
+            entry['estimated'] = entry['estimated'] or estimated
+            self.cost += cost
+        if self.batch is not None:
+            self.batch.charge(cost)
+        return cost
+
+    def record_response(self, stage: str, response, prompt: str) -> float:
+        """Record an OpenAI chat completion, estimating when the response carries no usage"""
+        usage = getattr(response, 'usage', None)
+        if usage is not None and getattr(usage, 'prompt_tokens', None) is not None:
+            return self.record(stage, 'openai', usage.prompt_tokens, usage.completion_tokens)
+        content = response.choices[0].message.content or ''
+        return self.record(stage, 'openai', estimate_tokens(prompt), estimate_tokens(content), estimated=True)
+
+    def record_downgrade(self, stage: str, change: str):
+        with self._lock:
+            self.downgrades.append({'stage': stage, 'change': change})
+        print(f"💸 Cost ceiling: {stage} {change}")
+
+    def remaining(self) -> float:
+        """Budget left before the request or batch ceiling (inf without ceilings)"""
+        request_remaining = float('inf') if self.ceiling is None else self.ceiling - self.cost
+        batch_remaining = self.batch.remaining() if self.batch is not None else float('inf')
+        return min(request_remaining, batch_remaining)
+
+    def allows(self, estimated_cost: float) -> bool:
+        return estimated_cost <= self.remaining()
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            stages = {stage: dict(entry, cost_usd=round(entry['cost_usd'], 8)) for stage, entry in self.stages.items()}
+            downgrades = list(self.downgrades)
+        prompt_tokens = sum(entry['prompt_tokens'] for entry in stages.values())
+        completion_tokens = sum(entry['completion_tokens'] for entry in stages.values())
+        return {
+            'stages': stages,
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens,
+            'cost_usd': round(sum(entry['cost_usd'] for entry in stages.values()), 8),
+            'estimated': any(entry['estimated'] for entry in stages.values()),
+            'ceiling_usd': self.ceiling,
+            'downgrades': downgrades
+        }
+
+
+class CostLedger:
+    """Per-day / per-mode totals of finished requests, optionally persisted as JSONL"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._totals: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, usage: Dict[str, Any], mode: Optional[str], timestamp: Optional[str] = None):
+        timestamp = timestamp or datetime.now().isoformat()
+        mode = mode or 'unknown'
+        with self._lock:
+            self._add(timestamp[:10], mode, usage)
+            if self.path:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps({'timestamp': timestamp, 'mode': mode, 'usage': usage}) + '\n')
+
+    def _add(self, day: str, mode: str, usage: Dict[str, Any]):
+        totals = self._totals.setdefault(day, {}).setdefault(mode, {
+            'requests': 0, 'prompt_tokens': 0, 'completion_tokens': 0, 'cost_usd': 0.0,
+            'downgrades': 0, 'stages': {}
+        })
+        totals['requests'] += 1
+        totals['prompt_tokens'] += usage['prompt_tokens']
+        totals['completion_tokens'] += usage['completion_tokens']
+        totals['cost_usd'] += usage['cost_usd']
+        totals['downgrades'] += len(usage['downgrades'])
+        for stage, entry in usage['stages'].items():
+            stage_totals = totals['stages'].setdefault(stage, {'calls': 0, 'tokens': 0, 'cost_usd': 0.0})
+            stage_totals['calls'] += entry['calls']
+            stage_totals['tokens'] += entry['prompt_tokens'] + entry['completion_tokens']
+            stage_totals['cost_usd'] += entry['cost_usd']
+
+    def totals(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        with self._lock:
+            return json.loads(json.dumps(self._totals))
+
+    @classmethod
+    def load(cls, path: str) -> 'CostLedger':
+        """Rebuild totals from a JSONL ledger file"""
+        ledger = cls()
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    ledger._add(entry['timestamp'][:10], entry['mode'], entry['usage'])
+        return ledger
+
+
+@lru_cache(maxsize=1)
+def get_ledger() -> CostLedger:
+    """Process-wide ledger configured from COST_LEDGER_PATH"""
+    return CostLedger(os.getenv('COST_LEDGER_PATH') or None)
+
+
+def _print_report(totals: Dict[str, Dict[str, Dict[str, Any]]]):
+    for day in sorted(totals):
+        print(f"\n📅 {day}")
+        for mode, mode_totals in sorted(totals[day].items()):
+            requests = mode_totals['requests']
+            tokens = mode_totals['prompt_tokens'] + mode_totals['completion_tokens']
+            print(f"  {mode:<12} {requests:>6} requests  {tokens:>10} tokens  "
+                  f"${mode_totals['cost_usd']:.4f}  (${mode_totals['cost_usd'] / requests:.6f}/request, "
+                  f"{mode_totals['downgrades']} downgrades)")
+            for stage, stage_totals in sorted(mode_totals['stages'].items()):
+                print(f"    {stage:<14} {stage_totals['calls']:>6} calls  {stage_totals['tokens']:>10} tokens  "
+                      f"${stage_totals['cost_usd']:.4f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    report_parser = subparsers.add_parser('report', help='Per-day / per-mode totals from a ledger file')
+    report_parser.add_argument('path', nargs='?', default=os.getenv('COST_LEDGER_PATH'))
+    args = parser.parse_args()
+
+    if args.command == 'report':
+        if not args.path:
+            parser.error('no ledger path given and COST_LEDGER_PATH is not set')
+        _print_report(CostLedger.load(args.path).totals())
+
+
+if __name__ == "__main__":
+    main()
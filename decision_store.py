@@ -0,0 +1,621 @@
+"""
+Columnar analytics store for historical compliance decisions
+
+Audit records from process_compliance_response() are appended to a directory of
+memory-mapped NumPy columns:
+
+    timestamp       int64    seconds since 1970-01-01 (audit timestamps are local wall clock)
+    month           uint16   months since 1970-01, for month grouping without date math
+    classification  uint8    dictionary code (YES / NO / UNCERTAIN / UNKNOWN)
+    confidence      int8     1-10, -1 when missing
+    analysis_mode   uint8    dictionary code (monolithic / fanout / ...)
+    cost_usd        float64  from the record's usage, NaN when missing
+    reg_offsets     int64    row -> slice of reg_codes (CSR layout, one extra entry)
+    reg_codes       uint16   dictionary codes of the regulations a record cites
+
+Regulation IDs are derived from the free-text REGULATIONS section (REGULATION_PATTERNS).
+meta.json holds the row count, the dictionaries and monthly rollups (count, confidence
+and cost per month x classification x regulation), updated on every append. Queries on
+whole months are answered from the rollups; anything else is a vectorized column scan.
+
+Requests add records with add(), which only buffers them; the buffer is written
+as one append every FLUSH_ROWS records, FLUSH_SECONDS after the first buffered
+record, before any query from the same instance, and at exit.
+
+Several processes (app, API server, scanner) may share a store: appends take an
+exclusive fcntl lock on <store>/.lock and reload meta.json before writing, and
+queries take a shared lock. Without fcntl (Windows) keep a single writer process.
+
+Usage:
+    python decision_store.py ingest decisions/ compliance_manifest.json audit_records.jsonl
+    python decision_store.py query decisions/ --metric count --classification YES --regulation UT_MINORS \\
+        --start 2026-07-01 --end 2026-10-01
+    python decision_store.py query decisions/ --metric mean_confidence --group-by regulation
+    python decision_store.py export decisions/ decisions.csv --classification YES
+"""
+
+import argparse
+import atexit
+import csv
+import json
+import os
+import re
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, Iterable, List, Any, Optional
+
+import numpy as np
+
+from verdicts import UNKNOWN, VERDICTS, parse_verdict
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking, single writer only
+    fcntl = None
+
+STORE_VERSION = 1
+MIN_CAPACITY = 1024
+FLUSH_ROWS = int(os.getenv('DECISION_STORE_FLUSH_ROWS', '256'))
+FLUSH_SECONDS = float(os.getenv('DECISION_STORE_FLUSH_SECONDS', '2'))
+EPOCH = datetime(1970, 1, 1)
+
+ROW_COLUMNS = {
+    'timestamp': np.int64,
+    'month': np.uint16,
+    'classification': np.uint8,
+    'confidence': np.int8,
+    'analysis_mode': np.uint8,
+    'cost_usd': np.float64,
+}
+
+# Canonical regulation IDs, matched against the REGULATIONS section of an audit record
+REGULATION_PATTERNS = {
+    'DSA': r'digital services act|\bdsa\b',
+    'CA_KIDS': r'california|protecting our kids|\bsb[ -]?976\b',
+    'FL_MINORS': r'florida|\bhb[ -]?3\b',
+    'UT_MINORS': r'\butah\b',
+    'NCMEC': r'ncmec|child sexual abuse',
+    'GDPR': r'\bgdpr\b|general data protection',
+    'COPPA': r'\bcoppa\b|children.s online privacy',
+    'DATA_LOCALIZATION': r'data locali[sz]ation',
+    'CHILD_PROTECTION_ID': r'indonesia',
+    'COPYRIGHT': r'copyright',
+}
+_REGULATION_REGEXES = {reg_id: re.compile(pattern, re.IGNORECASE) for reg_id, pattern in REGULATION_PATTERNS.items()}
+_NO_REGULATION = re.compile(r'^\s*(none|n/?a|not applicable)\b', re.IGNORECASE)
+
+# Free-form CLASSIFICATION text is reduced to one of these (parse_verdict) before encoding
+CLASSIFICATIONS = VERDICTS + (UNKNOWN,)
+
+GROUP_BY_OPTIONS = ('classification', 'regulation', 'month', 'analysis_mode')
+METRICS = ('count', 'mean_confidence', 'total_cost_usd')
+
+
+def regulation_ids(regulations_text: str) -> List[str]:
+    """Canonical IDs cited in a REGULATIONS section; unmatched citations become OTHER"""
+    text = regulations_text or ''
+    if not text.strip() or _NO_REGULATION.match(text):
+        return []
+    found = [reg_id for reg_id, regex in _REGULATION_REGEXES.items() if regex.search(text)]
+    return found or ['OTHER']
+
+
+def to_epoch_seconds(value) -> int:
+    """ISO string or datetime -> seconds since 1970-01-01 in the same (naive) clock"""
+    moment = datetime.fromisoformat(value) if isinstance(value, str) else value
+    return int((moment.replace(tzinfo=None) - EPOCH).total_seconds())
+
+
+def _parse_confidence(value) -> int:
+    match = re.search(r'\d+', str(value or ''))
+    return min(int(match.group()), 10) if match else -1
+
+
+def _month_key(seconds: int) -> str:
+    return str(np.datetime64(int(seconds), 's').astype('datetime64[M]'))
+
+
+def _is_month_start(value) -> bool:
+    if value is None:
+        return True
+    moment = datetime.fromisoformat(value) if isinstance(value, str) else value
+    return moment.day == 1 and moment.time() == datetime.min.time()
+
+
+class DecisionStore:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        self._meta_path = os.path.join(path, 'meta.json')
+        self._lock_file = open(os.path.join(path, '.lock'), 'a+b')
+
+        self.meta = {
+            'version': STORE_VERSION, 'rows': 0, 'reg_entries': 0,
+            'row_capacity': MIN_CAPACITY, 'reg_capacity': MIN_CAPACITY,
+            'dictionaries': {'classification': [], 'analysis_mode': [], 'regulation': []},
+            'rollups': {}
+        }
+        self._meta_stamp = None
+        self._columns: Dict[str, np.memmap] = {}
+        self._code_maps: Dict[str, Dict[str, int]] = {}
+        self._row_of_entry: Optional[np.ndarray] = None
+        self._pending: List[Dict[str, Any]] = []
+        self._pending_lock = threading.Lock()
+        self._flush_timer: Optional[threading.Timer] = None
+        self._registered_atexit = False
+        with self._lock, self._file_lock(exclusive=False):
+            self._refresh()
+        if not self._columns:
+            self._map_columns()
+
+    # -- storage -----------------------------------------------------------------
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool):
+        """Cross-process lock on the store directory (no-op without fcntl)"""
+        if fcntl is None:
+            yield
+            return
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _refresh(self):
+        """Reload meta.json if another process (or instance) has written it since we last did"""
+        try:
+            stat = os.stat(self._meta_path)
+        except FileNotFoundError:
+            return
+        stamp = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if stamp == self._meta_stamp:
+            return
+        with open(self._meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('version') != STORE_VERSION:
+            raise ValueError(f"Unsupported decision store version {meta.get('version')} in {self.path}")
+        remap = (not self._columns or meta['row_capacity'] != self.meta['row_capacity'] or
+                 meta['reg_capacity'] != self.meta['reg_capacity'])
+        self.meta = meta
+        self._meta_stamp = stamp
+        self._code_maps.clear()
+        self._row_of_entry = None
+        if remap:
+            self._columns.clear()
+            self._map_columns()
+
+    def _column_path(self, name: str) -> str:
+        return os.path.join(self.path, f"{name}.bin")
+
+    def _map(self, name: str, dtype, length: int) -> np.memmap:
+        path = self._column_path(name)
+        size = length * np.dtype(dtype).itemsize
+        # Growing the file is a sparse truncate; existing data stays in place
+        with open(path, 'ab') as f:
+            if f.tell() < size:
+                f.truncate(size)
+        return np.memmap(path, dtype=dtype, mode='r+', shape=(length,))
+
+    def _map_columns(self):
+        row_capacity, reg_capacity = self.meta['row_capacity'], self.meta['reg_capacity']
+        for name, dtype in ROW_COLUMNS.items():
+            self._columns[name] = self._map(name, dtype, row_capacity)
+        self._columns['reg_offsets'] = self._map('reg_offsets', np.int64, row_capacity + 1)
+        self._columns['reg_codes'] = self._map('reg_codes', np.uint16, reg_capacity)
+
+    def _ensure_capacity(self, rows: int, reg_entries: int):
+        row_capacity, reg_capacity = self.meta['row_capacity'], self.meta['reg_capacity']
+        if rows <= row_capacity and reg_entries <= reg_capacity:
+            return
+        for column in self._columns.values():
+            column.flush()
+        self._columns.clear()
+        if rows > row_capacity:
+            self.meta['row_capacity'] = max(rows, 2 * row_capacity)
+        if reg_entries > reg_capacity:
+            self.meta['reg_capacity'] = max(reg_entries, 2 * reg_capacity)
+        self._map_columns()
+
+    def _save_meta(self):
+        tmp_path = f"{self._meta_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f, separators=(',', ':'))
+        os.replace(tmp_path, self._meta_path)
+        stat = os.stat(self._meta_path)
+        self._meta_stamp = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _codes(self, dictionary: str) -> Dict[str, int]:
+        codes = self._code_maps.get(dictionary)
+        if codes is None:
+            codes = {value: code for code, value in enumerate(self.meta['dictionaries'][dictionary])}
+            self._code_maps[dictionary] = codes
+        return codes
+
+    def _code(self, dictionary: str, value: str, limit: int) -> int:
+        codes = self._codes(dictionary)
+        code = codes.get(value)
+        if code is None:
+            if len(codes) >= limit:
+                raise ValueError(f"Too many distinct {dictionary} values (max {limit})")
+            code = codes[value] = len(codes)
+            self.meta['dictionaries'][dictionary].append(value)
+        return code
+
+    def _lookup(self, dictionary: str, value: str) -> Optional[int]:
+        return self._codes(dictionary).get(value)
+
+    # -- writing -----------------------------------------------------------------
+
+    def add(self, audit_record: Dict[str, Any]):
+        """Buffer one record for the next batched append (cheap enough for the request path)"""
+        with self._pending_lock:
+            self._pending.append(audit_record)
+            if not self._registered_atexit:
+                atexit.register(self.close)
+                self._registered_atexit = True
+            if len(self._pending) >= FLUSH_ROWS:
+                flush_now = True
+            else:
+                flush_now = False
+                if self._flush_timer is None:
+                    self._flush_timer = threading.Timer(FLUSH_SECONDS, self._flush_quietly)
+                    self._flush_timer.daemon = True
+                    self._flush_timer.start()
+        if flush_now:
+            self.flush()
+
+    def flush(self) -> int:
+        """Append the buffered records; returns how many were written"""
+        with self._pending_lock:
+            records, self._pending = self._pending, []
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+        return self.append(records) if records else 0
+
+    def _flush_quietly(self):
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"⚠️ Decision store flush failed: {e}")
+
+    def close(self):
+        self.flush()
+
+    def append(self, audit_records: Iterable[Dict[str, Any]]) -> int:
+        """Append audit records now, as one batch; returns rows added"""
+        records = list(audit_records)
+        if not records:
+            return 0
+
+        with self._lock, self._file_lock(exclusive=True):
+            # Another process may have appended since our last look: continue after its rows
+            self._refresh()
+            timestamps, classifications, confidences, modes, costs, reg_lists = [], [], [], [], [], []
+            for record in records:
+                timestamps.append(to_epoch_seconds(record.get('timestamp') or datetime.now()))
+                classifications.append(self._code('classification',
+                                                  parse_verdict(record.get('classification')), 255))
+                confidences.append(_parse_confidence(record.get('confidence_score')))
+                modes.append(self._code('analysis_mode', record.get('analysis_mode') or 'unknown', 255))
+                costs.append((record.get('usage') or {}).get('cost_usd', np.nan))
+                reg_lists.append([self._code('regulation', reg_id, 65535)
+                                  for reg_id in regulation_ids(record.get('applicable_regulations'))])
+
+            start, count = self.meta['rows'], len(records)
+            reg_start = self.meta['reg_entries']
+            reg_total = sum(len(regs) for regs in reg_lists)
+            self._ensure_capacity(start + count, reg_start + reg_total)
+
+            columns = self._columns
+            columns['timestamp'][start:start + count] = timestamps
+            columns['month'][start:start + count] = \
+                np.array(timestamps, dtype='datetime64[s]').astype('datetime64[M]').astype(np.int64)
+            columns['classification'][start:start + count] = classifications
+            columns['confidence'][start:start + count] = confidences
+            columns['analysis_mode'][start:start + count] = modes
+            columns['cost_usd'][start:start + count] = costs
+            lengths = np.fromiter((len(regs) for regs in reg_lists), dtype=np.int64, count=count)
+            columns['reg_offsets'][start + 1:start + count + 1] = reg_start + np.cumsum(lengths)
+            if reg_total:
+                columns['reg_codes'][reg_start:reg_start + reg_total] = [code for regs in reg_lists for code in regs]
+            for column in columns.values():
+                column.flush()
+
+            self._update_rollups(timestamps, classifications, confidences, costs, reg_lists)
+            # The row count is published last, so readers never see half-written rows
+            self.meta['rows'] = start + count
+            self.meta['reg_entries'] = reg_start + reg_total
+            self._save_meta()
+            self._row_of_entry = None
+        return count
+
+    def _update_rollups(self, timestamps, classifications, confidences, costs, reg_lists):
+        rollups = self.meta['rollups']
+        labels = self.meta['dictionaries']['classification']
+        regulations = self.meta['dictionaries']['regulation']
+        for seconds, code, confidence, cost, regs in zip(timestamps, classifications, confidences, costs, reg_lists):
+            prefix = f"{_month_key(seconds)}|{labels[code]}|"
+            for regulation in ['*'] + [regulations[reg_code] for reg_code in regs]:
+                # [count, confidence sum, rows with confidence, cost sum]
+                entry = rollups.setdefault(prefix + regulation, [0, 0, 0, 0.0])
+                entry[0] += 1
+                if confidence >= 0:
+                    entry[1] += confidence
+                    entry[2] += 1
+                if cost == cost:
+                    entry[3] += float(cost)
+
+    # -- reading -----------------------------------------------------------------
+
+    def __len__(self) -> int:
+        self.flush()
+        with self._lock, self._file_lock(exclusive=False):
+            self._refresh()
+            return self.meta['rows']
+
+    def _column(self, name: str) -> np.ndarray:
+        if name == 'reg_offsets':
+            return self._columns[name][:self.meta['rows'] + 1]
+        if name == 'reg_codes':
+            return self._columns[name][:self.meta['reg_entries']]
+        return self._columns[name][:self.meta['rows']]
+
+    def _entry_rows(self) -> np.ndarray:
+        """Row index of every reg_codes entry (cached until the next append)"""
+        if self._row_of_entry is None:
+            rows = np.arange(self.meta['rows'], dtype=np.int64)
+            self._row_of_entry = np.repeat(rows, np.diff(self._column('reg_offsets')))
+        return self._row_of_entry
+
+    def _mask(self, classification: Optional[str], regulation: Optional[str], analysis_mode: Optional[str],
+              start, end) -> Optional[np.ndarray]:
+        """Row mask for the filters; None when a filter value was never stored (no rows match)"""
+        mask = np.ones(self.meta['rows'], dtype=bool)
+        for dictionary, value in (('classification', classification), ('analysis_mode', analysis_mode)):
+            if value is not None:
+                code = self._lookup(dictionary, parse_verdict(value) if dictionary == 'classification'
+                                    else value)
+                if code is None:
+                    return None
+                mask &= self._column(dictionary) == code
+        if start is not None:
+            mask &= self._column('timestamp') >= to_epoch_seconds(start)
+        if end is not None:
+            mask &= self._column('timestamp') < to_epoch_seconds(end)
+        if regulation is not None:
+            code = self._lookup('regulation', regulation)
+            if code is None:
+                return None
+            cites = np.zeros(self.meta['rows'], dtype=bool)
+            cites[self._entry_rows()[self._column('reg_codes') == code]] = True
+            mask &= cites
+        return mask
+
+    def query(self, metric: str = 'count', group_by: Optional[str] = None, classification: Optional[str] = None,
+              regulation: Optional[str] = None, analysis_mode: Optional[str] = None, start=None, end=None,
+              use_rollups: bool = True):
+        """
+        Aggregate over the records matching the filters (start inclusive, end exclusive).
+        Returns a number, or {group: number} with group_by. Grouping by regulation counts
+        a record once for every regulation it cites.
+        """
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric: {metric}")
+        if group_by is not None and group_by not in GROUP_BY_OPTIONS:
+            raise ValueError(f"Unknown group_by: {group_by}")
+
+        self.flush()
+        with self._lock, self._file_lock(exclusive=False):
+            self._refresh()
+            if (use_rollups and analysis_mode is None and group_by != 'analysis_mode'
+                    and _is_month_start(start) and _is_month_start(end)):
+                return self._query_rollups(metric, group_by, classification, regulation, start, end)
+            return self._query_columns(metric, group_by, classification, regulation, analysis_mode, start, end)
+
+    def _query_rollups(self, metric, group_by, classification, regulation, start, end):
+        start_month = _month_key(to_epoch_seconds(start)) if start is not None else None
+        end_month = _month_key(to_epoch_seconds(end)) if end is not None else None
+        wanted_regulation = regulation or ('*' if group_by != 'regulation' else None)
+        sums: Dict[str, List[float]] = {}
+        for key, (count, confidence_sum, confidence_count, cost_sum) in self.meta['rollups'].items():
+            month, label, reg = key.split('|')
+            if (start_month and month < start_month) or (end_month and month >= end_month):
+                continue
+            if classification is not None and label != parse_verdict(classification):
+                continue
+            if wanted_regulation is not None and reg != wanted_regulation:
+                continue
+            if wanted_regulation is None and reg == '*':
+                continue
+            group = {'classification': label, 'regulation': reg, 'month': month}.get(group_by, '')
+            entry = sums.setdefault(group, [0, 0, 0, 0.0])
+            for i, value in enumerate((count, confidence_sum, confidence_count, cost_sum)):
+                entry[i] += value
+
+        results = {group: self._metric_from_sums(metric, *entry) for group, entry in sorted(sums.items())}
+        if group_by is None:
+            return results.get('', self._metric_from_sums(metric, 0, 0, 0, 0.0))
+        return results
+
+    @staticmethod
+    def _metric_from_sums(metric, count, confidence_sum, confidence_count, cost_sum):
+        if metric == 'count':
+            return int(count)
+        if metric == 'mean_confidence':
+            return float(confidence_sum) / int(confidence_count) if confidence_count else None
+        return round(float(cost_sum), 8)
+
+    def _query_columns(self, metric, group_by, classification, regulation, analysis_mode, start, end):
+        mask = self._mask(classification, regulation, analysis_mode, start, end)
+        if mask is None:
+            return {} if group_by else self._metric_from_sums(metric, 0, 0, 0, 0.0)
+
+        confidence = self._column('confidence').astype(np.int64)
+        has_confidence = confidence >= 0
+        cost = self._column('cost_usd')
+        cost = np.where(np.isnan(cost), 0.0, cost)
+
+        if group_by is None:
+            return self._metric_from_sums(metric, int(mask.sum()), int(confidence[mask & has_confidence].sum()),
+                                          int((mask & has_confidence).sum()), float(cost[mask].sum()))
+
+        if group_by == 'regulation':
+            rows = self._entry_rows()
+            keep = mask[rows]
+            rows, groups = rows[keep], self._column('reg_codes')[keep].astype(np.int64)
+            names = self.meta['dictionaries']['regulation']
+        elif group_by == 'month':
+            months = self._column('month')
+            rows = np.flatnonzero(mask)
+            first = int(months[rows].min()) if len(rows) else 0
+            groups = months[rows].astype(np.int64) - first
+            names = [str(np.datetime64(first + i, 'M')) for i in range(int(groups.max()) + 1 if len(rows) else 0)]
+        else:
+            rows = np.flatnonzero(mask)
+            groups = self._column(group_by)[rows].astype(np.int64)
+            names = self.meta['dictionaries'][group_by]
+
+        size = len(names)
+        counts = np.bincount(groups, minlength=size)
+        valid = has_confidence[rows]
+        confidence_sums = np.bincount(groups[valid], weights=confidence[rows][valid], minlength=size)
+        confidence_counts = np.bincount(groups[valid], minlength=size)
+        cost_sums = np.bincount(groups, weights=cost[rows], minlength=size)
+        return {
+            names[i]: self._metric_from_sums(metric, counts[i], confidence_sums[i], confidence_counts[i], cost_sums[i])
+            for i in sorted(range(size), key=lambda i: names[i]) if counts[i]
+        }
+
+    def export_csv(self, path: str, classification: Optional[str] = None, regulation: Optional[str] = None,
+                   analysis_mode: Optional[str] = None, start=None, end=None, block_size: int = 100_000) -> int:
+        """Write matching records to CSV in blocks; returns the number of rows written"""
+        self.flush()
+        with self._lock, self._file_lock(exclusive=False):
+            self._refresh()
+            mask = self._mask(classification, regulation, analysis_mode, start, end)
+            rows = np.flatnonzero(mask) if mask is not None else np.zeros(0, dtype=np.int64)
+            dictionaries = self.meta['dictionaries']
+            offsets, codes = self._column('reg_offsets'), self._column('reg_codes')
+
+            with open(path, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(['timestamp', 'classification', 'confidence', 'analysis_mode', 'cost_usd',
+                                 'regulations'])
+                for block_start in range(0, len(rows), block_size):
+                    block = rows[block_start:block_start + block_size]
+                    timestamps = self._column('timestamp')[block].astype('datetime64[s]').astype(str)
+                    labels = self._column('classification')[block]
+                    confidences = self._column('confidence')[block]
+                    modes = self._column('analysis_mode')[block]
+                    costs = self._column('cost_usd')[block]
+                    for i, row in enumerate(block):
+                        regs = '|'.join(dictionaries['regulation'][code]
+                                        for code in codes[offsets[row]:offsets[row + 1]])
+                        writer.writerow([
+                            timestamps[i], dictionaries['classification'][labels[i]],
+                            confidences[i] if confidences[i] >= 0 else '',
+                            dictionaries['analysis_mode'][modes[i]],
+                            '' if np.isnan(costs[i]) else f"{costs[i]:.8f}", regs
+                        ])
+        return len(rows)
+
+
+_store_lock = threading.Lock()
+
+
+@lru_cache(maxsize=1)
+def _open_store(path: str) -> DecisionStore:
+    return DecisionStore(path)
+
+
+def get_decision_store() -> Optional[DecisionStore]:
+    """Process-wide store at DECISION_STORE_PATH (None when unset)"""
+    path = os.getenv('DECISION_STORE_PATH')
+    if not path:
+        return None
+    with _store_lock:
+        return _open_store(path)
+
+
+def record_decision(audit_record: Dict[str, Any]):
+    """Buffer a finished audit record (carrying its analysis_mode) for the process-wide store; never raises"""
+    store = get_decision_store()
+    if store is None:
+        return
+    try:
+        store.add(audit_record)
+    except Exception as e:
+        print(f"⚠️ Decision store append failed: {e}")
+
+
+def load_audit_records(path: str) -> Iterable[Dict[str, Any]]:
+    """Audit records from a PRD scanner manifest, a JSON list or JSONL (one record per line)"""
+    with open(path, encoding='utf-8') as f:
+        if path.endswith('.jsonl'):
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    yield record.get('audit_record', record)
+            return
+        data = json.load(f)
+    if isinstance(data, dict) and 'entries' in data:
+        for entry in data['entries'].values():
+            yield entry['audit_record']
+    else:
+        yield from data
+
+
+def _filter_args(parser: argparse.ArgumentParser):
+    parser.add_argument('--classification')
+    parser.add_argument('--regulation', help=f"One of {', '.join(REGULATION_PATTERNS)}, OTHER")
+    parser.add_argument('--analysis-mode')
+    parser.add_argument('--start', help='ISO date/time, inclusive')
+    parser.add_argument('--end', help='ISO date/time, exclusive')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    ingest_parser = subparsers.add_parser('ingest', help='Append audit records from files')
+    ingest_parser.add_argument('store')
+    ingest_parser.add_argument('files', nargs='+')
+
+    query_parser = subparsers.add_parser('query', help='Aggregate query')
+    query_parser.add_argument('store')
+    query_parser.add_argument('--metric', choices=METRICS, default='count')
+    query_parser.add_argument('--group-by', choices=GROUP_BY_OPTIONS)
+    query_parser.add_argument('--no-rollups', action='store_true', help='Always scan the columns')
+    _filter_args(query_parser)
+
+    export_parser = subparsers.add_parser('export', help='Export matching records to CSV')
+    export_parser.add_argument('store')
+    export_parser.add_argument('output')
+    _filter_args(export_parser)
+    args = parser.parse_args()
+
+    store = DecisionStore(args.store)
+    filters = {'classification': args.classification, 'regulation': args.regulation,
+               'analysis_mode': args.analysis_mode, 'start': args.start, 'end': args.end} \
+        if args.command != 'ingest' else {}
+
+    if args.command == 'ingest':
+        for path in args.files:
+            added = store.append(load_audit_records(path))
+            print(f"📥 {path}: {added} records")
+        print(f"🗄️  {len(store)} records in {args.store}")
+    elif args.command == 'query':
+        result = store.query(args.metric, group_by=args.group_by, use_rollups=not args.no_rollups, **filters)
+        print(json.dumps(result, indent=2))
+    elif args.command == 'export':
+        written = store.export_csv(args.output, **filters)
+        print(f"📤 Exported {written} records to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+"""
+Tolerant parsing of numeric settings from the environment
+
+A malformed value (e.g. RERANK_WINDOW_SIZE=twenty) prints a warning and falls
+back to the default instead of crashing the app at import or construction time.
+"""
+
+import os
+from typing import Optional
+
+
+def env_int(name: str, default: int) -> int:
+    value = os.getenv(name, '').strip()
+    try:
+        return int(value) if value else default
+    except ValueError:
+        print(f"⚠️  Invalid {name}={value!r}, using {default}")
+        return default
+
+
+def env_float(name: str, default: Optional[float]) -> Optional[float]:
+    value = os.getenv(name, '').strip()
+    try:
+        return float(value) if value else default
+    except ValueError:
+        print(f"⚠️  Invalid {name}={value!r}, using {default}")
+        return default
@@ -0,0 +1,289 @@
+"""
+Quality-versus-latency evaluation over a labeled feature set
+
+Runs the full pipeline (analysis, gated or full reranking, parsing) for every
+labeled feature under each configuration and reports, side by side: accuracy,
+agreement with the first (baseline) configuration, confusion matrix, latency
+percentiles and cost. Configurations run in parallel on one shared worker pool,
+so they see the same backend contention.
+
+A configuration overrides attributes of fresh clients:
+    {"fanout": {"ragflow": {"analysis_mode": "fanout"},
+                "reranker": {"gating_enabled": true},
+                "rerank": true,
+                "cost_ceiling": 0.002}}
+
+Backends: local stubs (default, offline), a replay cassette (offline, real
+recorded answers) or the live services. Record the cassette once against the
+live services with CASSETTE_MODE=record; a configuration whose prompts were not
+recorded (e.g. fan-out when only monolithic was recorded) shows up as errors.
+
+Usage:
+    python evaluation_harness.py                                   # stubs, built-in configurations
+    CASSETTE_MODE=record CASSETTE_PATH=cassettes/eval.json.gz python evaluation_harness.py --backend live
+    python evaluation_harness.py --backend cassette --cassette cassettes/eval.json.gz
+    python evaluation_harness.py --configs my_configs.json --report eval.json --min-accuracy 0.8
+"""
+
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Any, Optional, Tuple
+
+from cassette import TIMING_MODES, Cassette, create_clients, get_cassette
+from cost_accounting import BatchBudget, UsageMeter
+from reranking_utils import wait_for_shadow_reranks
+from stub_backends import create_stub_clients
+from verdicts import UNKNOWN, VERDICTS, parse_verdict
+
+LABELS = VERDICTS
+CONFIG_KEYS = ('ragflow', 'reranker', 'rerank', 'cost_ceiling')
+
+DEFAULT_CONFIGURATIONS = {
+    'baseline': {'ragflow': {'analysis_mode': 'monolithic'}, 'reranker': {'gating_enabled': False}},
+    'gated_rerank': {'ragflow': {'analysis_mode': 'monolithic'}, 'reranker': {'gating_enabled': True}},
+    'no_rerank': {'ragflow': {'analysis_mode': 'monolithic'}, 'rerank': False},
+    'fanout': {'ragflow': {'analysis_mode': 'fanout', 'fanout_confidence_threshold': 8}},
+    # A threshold above 10 never triggers the early exit
+    'fanout_no_early_stop': {'ragflow': {'analysis_mode': 'fanout', 'fanout_confidence_threshold': 11}},
+}
+
+
+def load_dataset(path: str) -> List[Dict[str, str]]:
+    """Labeled features: one {"id", "description", "expected"} object per line"""
+    examples = []
+    with open(path, encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            example = json.loads(line)
+            if example.get('expected') not in LABELS:
+                raise ValueError(f"{path}:{line_number}: expected must be one of {LABELS}")
+            example.setdefault('id', str(line_number))
+            examples.append(example)
+    return examples
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[int(q * (len(ordered) - 1))]
+
+
+def _configure(ragflow_client, reranker, config: Dict[str, Any]):
+    unknown = set(config) - set(CONFIG_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown configuration keys: {sorted(unknown)}")
+    for target, overrides in ((ragflow_client, config.get('ragflow', {})), (reranker, config.get('reranker', {}))):
+        for attribute, value in overrides.items():
+            if not hasattr(target, attribute):
+                raise ValueError(f"{type(target).__name__} has no setting '{attribute}'")
+            setattr(target, attribute, value)
+
+
+class EvaluationHarness:
+    def __init__(self, backend: str = 'stub', cassette_path: Optional[str] = None, timing: str = 'recorded',
+                 token_delay: float = 0.0, chat_latency: float = 0.0, workers: int = 8):
+        if backend == 'cassette' and not cassette_path:
+            raise ValueError("The cassette backend needs a cassette path")
+        self.backend = backend
+        if backend == 'cassette':
+            self.cassette = Cassette(cassette_path, mode='replay', timing=timing)
+        else:
+            # Live runs honour CASSETTE_MODE=record, to capture a cassette for offline evaluation
+            self.cassette = get_cassette() if backend == 'live' else None
+        self.token_delay = token_delay
+        self.chat_latency = chat_latency
+        self.workers = workers
+
+    def _create_clients(self):
+        if self.backend == 'stub':
+            return create_stub_clients(token_delay=self.token_delay, chat_latency=self.chat_latency)
+        return create_clients(self.cassette)
+
+    def _run_example(self, clients, config: Dict[str, Any], budget: BatchBudget,
+                     example: Dict[str, str]) -> Dict[str, Any]:
+        ragflow_client, reranker = clients
+        feature = example['description']
+        meter = UsageMeter(ceiling=config.get('cost_ceiling'), batch=budget)
+        start_time = time.time()
+
+        gate = None
+        try:
+            result = ragflow_client.run_analysis(feature, meter=meter)
+            if result['mode'] != 'error' and config.get('rerank', True):
+                # An ungated configuration reranks every request, so it is a true full-rerank baseline
+                if reranker.gating_enabled:
+                    _, gate = reranker.rerank_evidence_gated(feature, result['evidence'], max_chunks=5, meter=meter)
+                else:
+                    reranker.rerank_evidence(feature, result['evidence'], max_chunks=5, meter=meter)
+        except Exception as e:
+            print(f"❌ {example['id']}: {e}")
+            result = {'mode': 'error'}
+
+        usage = meter.summary()
+        if result['mode'] == 'error':
+            predicted = 'ERROR'
+        else:
+            audit_record = ragflow_client.process_compliance_response(
+                result['answer'], result['evidence'], usage=usage, analysis_mode=result.get('analysis_mode')
+            )
+            # '[YES]' or 'No.' is a verdict; only an answer with no recognizable verdict is UNPARSED
+            verdict = parse_verdict(audit_record['classification'])
+            predicted = 'UNPARSED' if verdict == UNKNOWN else verdict
+
+        return {
+            'id': example['id'],
+            'expected': example['expected'],
+            'predicted': predicted,
+            'latency_seconds': time.time() - start_time,
+            'cost_usd': usage['cost_usd'],
+            'stage_costs_usd': {stage: entry['cost_usd'] for stage, entry in usage['stages'].items()},
+            'analysis_mode': result.get('analysis_mode'),
+            'rerank_decision': gate['decision'] if gate else None
+        }
+
+    def run(self, examples: List[Dict[str, str]], configurations: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        runs = {}
+        for name, config in configurations.items():
+            clients = self._create_clients()
+            _configure(*clients, config)
+            runs[name] = (clients, config, BatchBudget())
+
+        outcomes: Dict[str, List[Dict[str, Any]]] = {name: [] for name in configurations}
+        start_time = time.time()
+        # Interleave configurations so they share the pool (and backend load) evenly
+        tasks: List[Tuple[str, Dict[str, str]]] = [(name, example) for example in examples for name in configurations]
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {
+                executor.submit(self._run_example, *runs[name], example): name
+                for name, example in tasks
+            }
+            for future in as_completed(futures):
+                outcomes[futures[future]].append(future.result())
+        # Shadow reranks finish in the background; their spend is reported apart from the pipeline cost
+        wait_for_shadow_reranks()
+        print(f"⏱️  Evaluated {len(examples)} features x {len(configurations)} configurations "
+              f"in {time.time() - start_time:.1f}s")
+
+        baseline = next(iter(configurations))
+        baseline_predictions = {outcome['id']: outcome['predicted'] for outcome in outcomes[baseline]}
+        return {
+            'backend': self.backend,
+            'examples': len(examples),
+            'baseline': baseline,
+            'configurations': {
+                name: self._summarize(outcomes[name], baseline_predictions, runs[name][2],
+                                      runs[name][0][1].shadow_cost_usd)
+                for name in configurations
+            }
+        }
+
+    def _summarize(self, outcomes: List[Dict[str, Any]], baseline_predictions: Dict[str, str],
+                   budget: BatchBudget, shadow_cost: float) -> Dict[str, Any]:
+        outcomes.sort(key=lambda outcome: outcome['id'])
+        columns = LABELS + ('UNPARSED', 'ERROR')
+        confusion = {expected: {predicted: 0 for predicted in columns} for expected in LABELS}
+        for outcome in outcomes:
+            confusion[outcome['expected']][outcome['predicted']] += 1
+
+        latencies = [outcome['latency_seconds'] for outcome in outcomes]
+        count = len(outcomes)
+        correct = sum(1 for outcome in outcomes if outcome['predicted'] == outcome['expected'])
+        agreeing = sum(1 for outcome in outcomes if outcome['predicted'] == baseline_predictions.get(outcome['id']))
+        stage_costs = {}
+        for outcome in outcomes:
+            for stage, cost in outcome['stage_costs_usd'].items():
+                stage_costs[stage] = stage_costs.get(stage, 0.0) + cost
+        return {
+            'accuracy': correct / count if count else None,
+            'baseline_agreement': agreeing / count if count else None,
+            'errors': sum(1 for outcome in outcomes if outcome['predicted'] in ('ERROR', 'UNPARSED')),
+            'confusion_matrix': confusion,
+            'p50_seconds': percentile(latencies, 0.5),
+            'p95_seconds': percentile(latencies, 0.95),
+            'p99_seconds': percentile(latencies, 0.99),
+            'mean_cost_usd': budget.spent / count if count else None,
+            'total_cost_usd': budget.spent,
+            'stage_costs_usd': {stage: round(cost, 8) for stage, cost in sorted(stage_costs.items())},
+            # Background shadow reranks measure the gate; they are not part of the configuration's cost
+            'shadow_cost_usd': round(shadow_cost, 8),
+            'outcomes': outcomes
+        }
+
+
+def _fmt(value, width: int, decimals: int = 3) -> str:
+    return f"{'-':>{width}}" if value is None else f"{value:>{width}.{decimals}f}"
+
+
+def _print_report(report: Dict[str, Any]):
+    print(f"\n📊 {report['examples']} labeled features, {report['backend']} backend "
+          f"(agreement is against '{report['baseline']}')\n")
+    print(f"{'configuration':<22}{'accuracy':>9}{'agree':>7}{'errors':>7}{'p50 s':>8}{'p95 s':>8}{'p99 s':>8}"
+          f"{'$/feature':>11}{'$ total':>10}{'$ shadow':>10}")
+    for name, summary in report['configurations'].items():
+        print(f"{name:<22}{_fmt(summary['accuracy'], 9)}{_fmt(summary['baseline_agreement'], 7, 2)}"
+              f"{summary['errors']:>7}{_fmt(summary['p50_seconds'], 8)}{_fmt(summary['p95_seconds'], 8)}"
+              f"{_fmt(summary['p99_seconds'], 8)}{_fmt(summary['mean_cost_usd'], 11, 6)}"
+              f"{_fmt(summary['total_cost_usd'], 10, 4)}{_fmt(summary['shadow_cost_usd'], 10, 4)}")
+
+    for name, summary in report['configurations'].items():
+        stages = ', '.join(f"{stage} ${cost:.4f}" for stage, cost in summary['stage_costs_usd'].items())
+        print(f"{name}: {stages or 'no metered stages'}")
+
+    for name, summary in report['configurations'].items():
+        columns = list(next(iter(summary['confusion_matrix'].values())))
+        print(f"\n{name}: expected (rows) vs predicted (columns)")
+        print(f"{'':<11}" + ''.join(f"{column:>10}" for column in columns))
+        for expected, row in summary['confusion_matrix'].items():
+            print(f"{expected:<11}" + ''.join(f"{row[column]:>10}" for column in columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dataset', default='evaluation_dataset.jsonl')
+    parser.add_argument('--configs', help='JSON file of named configurations (default: built-in set)')
+    parser.add_argument('--only', nargs='+', help='Run only these configurations (first is the baseline)')
+    parser.add_argument('--backend', choices=['stub', 'cassette', 'live'], default='stub')
+    parser.add_argument('--cassette', help='Replay cassette for --backend cassette')
+    parser.add_argument('--timing', choices=TIMING_MODES, default='recorded',
+                        help='Cassette replay timing; "recorded" keeps latencies comparable')
+    parser.add_argument('--token-delay', type=float, default=0.01, help='Stub delay per streamed message')
+    parser.add_argument('--chat-latency', type=float, default=0.05, help='Stub OpenAI call latency')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--report', help='Write the JSON report (with per-feature outcomes) to this path')
+    parser.add_argument('--min-accuracy', type=float, help='Exit 1 if any configuration scores below this')
+    args = parser.parse_args()
+
+    configurations = DEFAULT_CONFIGURATIONS
+    if args.configs:
+        with open(args.configs, encoding='utf-8') as f:
+            configurations = json.load(f)
+    if args.only:
+        missing = [name for name in args.only if name not in configurations]
+        if missing:
+            parser.error(f"unknown configurations: {', '.join(missing)}")
+        configurations = {name: configurations[name] for name in args.only}
+
+    harness = EvaluationHarness(backend=args.backend, cassette_path=args.cassette, timing=args.timing,
+                                token_delay=args.token_delay, chat_latency=args.chat_latency, workers=args.workers)
+    report = harness.run(load_dataset(args.dataset), configurations)
+    _print_report(report)
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    if args.min_accuracy is not None:
+        failing = [name for name, summary in report['configurations'].items()
+                   if (summary['accuracy'] or 0.0) < args.min_accuracy]
+        for name in failing:
+            print(f"❌ {name} accuracy {report['configurations'][name]['accuracy']:.3f} < {args.min_accuracy}")
+        sys.exit(1 if failing else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,12 @@
 import streamlit as st
 from datetime import datetime
-from ragflow_client import RAGFlowClient
-from reranking_utils import EvidenceReranker
+from cassette import create_clients, get_cassette
+from cost_accounting import UsageMeter, get_ledger
+from decision_store import record_decision
+from profiler import profile_request, should_profile
+from reranking_utils import get_gate_stats
 import base64
+import uuid
 
 # TikTok page config
 st.set_page_config(
@@ -371,10 +375,18 @@ if 'search_results' not in st.session_state:
     st.session_state.search_results = None
 if 'search_query' not in st.session_state:
     st.session_state.search_query = ""
-if 'ragflow_client' not in st.session_state:
-    st.session_state.ragflow_client = RAGFlowClient()
-if 'reranker' not in st.session_state:
-    st.session_state.reranker = EvidenceReranker()
+if 'ragflow_client' not in st.session_state or 'reranker' not in st.session_state:
+    # Honors CASSETTE_MODE=record/replay for network-free development runs
+    st.session_state.ragflow_client, st.session_state.reranker = create_clients(get_cassette())
+
+def get_query_params():
+    # st.experimental_get_query_params was removed in newer Streamlit releases
+    if hasattr(st, 'query_params'):
+        return {key: st.query_params.get_all(key) for key in st.query_params}
+    return st.experimental_get_query_params()
+
+def format_rate(rate):
+    return 'n/a' if rate is None else f"{rate:.0%}"
 
 def main():
     st.markdown('<div class="main-container">', unsafe_allow_html=True)
@@ -425,7 +437,7 @@ def main():
     st.markdown('</div>', unsafe_allow_html=True)
     
     # Use JavaScript communication or check for URL parameters
-    query_params = st.experimental_get_query_params()
+    query_params = get_query_params()
     if 'q' in query_params:
         search_query = query_params['q'][0]
         st.session_state.search_query = search_query
@@ -450,19 +462,24 @@ def main():
         with st.spinner(""):
             try:
                 print(f"🚀 Starting analysis for: {search_query}")
-                result = st.session_state.ragflow_client.analyze_feature(search_query)
+                meter = UsageMeter()
+                result = st.session_state.ragflow_client.run_analysis(search_query, meter=meter)
                 print(f"✅ Got result: {len(result.get('answer', ''))} char answer")
                 
-                processed_result = st.session_state.ragflow_client.process_compliance_response(
-                    result['answer'], result['evidence']
+                # Rerank evidence (the gate may skip the LLM when retrieval is decisive)
+                reranked_evidence, rerank_gate = st.session_state.reranker.rerank_evidence_gated(
+                    search_query, result['evidence'], max_chunks=5, meter=meter
                 )
-                print(f"✅ Processed result: {processed_result['classification']}")
+                print(f"✅ Reranked evidence: {len(reranked_evidence)} chunks ({rerank_gate['decision']})")
                 
-                # Rerank evidence
-                reranked_evidence = st.session_state.reranker.rerank_evidence(
-                    search_query, result['evidence'], max_chunks=5
+                usage = meter.summary()
+                processed_result = st.session_state.ragflow_client.process_compliance_response(
+                    result['answer'], result['evidence'], usage=usage, analysis_mode=result.get('analysis_mode')
                 )
-                print(f"✅ Reranked evidence: {len(reranked_evidence)} chunks")
+                print(f"✅ Processed result: {processed_result['classification']} (${usage['cost_usd']:.5f})")
+                if result.get('mode') != 'error':
+                    get_ledger().record(usage, result.get('analysis_mode'))
+                    record_decision(processed_result)
                 
                 st.session_state.search_results = {
                     'query': search_query,
@@ -471,6 +488,8 @@ def main():
                     'reasoning': processed_result['reasoning'],
                     'regulations': processed_result['applicable_regulations'],
                     'evidence': reranked_evidence,
+                    'rerank_gate': rerank_gate,
+                    'usage': usage,
                     'mode': result.get('mode', 'ragflow'),
                     'timestamp': datetime.now()
                 }
@@ -541,6 +560,16 @@ def main():
             </div>
             """, unsafe_allow_html=True)
             
+            # Gate stats are process-wide, so every session sees the same skip / agreement rates
+            gate_stats = get_gate_stats()
+            with st.expander(f"🚦 Rerank gate: {results['rerank_gate']['decision']} ({results['rerank_gate']['reason']})"):
+                st.markdown(f"""
+                - **Skip rate:** {format_rate(gate_stats['skip_rate'])} of {gate_stats['total']} requests
+                - **Downgrade rate:** {format_rate(gate_stats['downgrade_rate'])}
+                - **Shadow top-1 agreement:** {format_rate(gate_stats['shadow_top1_agreement_rate'])} of {gate_stats['shadow_samples']} samples
+                - **Shadow spend today:** ${gate_stats['shadow_cost_today_usd']:.4f} of ${gate_stats['shadow_budget_usd']:.2f}
+                """)
+            
             st.markdown('</div>', unsafe_allow_html=True)
         
         with left_col:
@@ -589,4 +618,7 @@ def main():
     st.markdown('</div>', unsafe_allow_html=True)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # ?profile=1 (or PROFILE_SAMPLE_RATE) samples this script run, including rendering
+    profile_requested = get_query_params().get('profile', [''])[0].lower() in ('1', 'true', 'yes')
+    with profile_request(f"app-{uuid.uuid4().hex[:12]}", enabled=should_profile(profile_requested)):
+        main()
\ No newline at end of file
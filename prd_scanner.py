@@ -0,0 +1,268 @@
+"""
+Incremental compliance scanning for a repository of feature / PRD files
+
+Every .md / .txt file is one feature description; every .jsonl file holds one
+feature per line ({"id": ..., "description": ...}). A manifest maps each entry to
+the hash of its content, the prompt fingerprint it was analyzed with and the
+resulting audit record. Only new or modified entries (or all entries, after a
+prompt change) are sent through the pipeline, in parallel, and the report lists
+the deltas against the previous scan, such as a classification flipping NO -> YES.
+
+Usage:
+    python prd_scanner.py features/ --manifest compliance_manifest.json --workers 8
+    python prd_scanner.py features/ --fail-on YES      # non-zero exit if anything newly became YES
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+
+from cassette import create_clients, get_cassette
+from cost_accounting import BatchBudget, UsageMeter, get_ledger
+from decision_store import record_decision
+from stub_backends import create_stub_clients
+from verdicts import parse_verdict
+
+MANIFEST_VERSION = 1
+TEXT_EXTENSIONS = ('.md', '.txt')
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+
+def discover_features(root: str, warnings: Optional[List[str]] = None) -> Dict[str, str]:
+    """
+    Map entry key (relative path, plus '#id' for JSONL lines) to feature description.
+    Malformed JSONL lines are skipped; a repeated id in the same file keeps its first
+    line and later ones get '#id@line' keys. Both are logged and appended to warnings.
+    """
+    def warn(message):
+        print(f"⚠️  {message}")
+        if warnings is not None:
+            warnings.append(message)
+
+    features = {}
+    for directory, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith('.'))
+        for filename in sorted(filenames):
+            path = os.path.join(directory, filename)
+            relative = os.path.relpath(path, root).replace(os.sep, '/')
+
+            if filename.endswith(TEXT_EXTENSIONS):
+                with open(path, encoding='utf-8') as f:
+                    text = f.read().strip()
+                if text:
+                    features[relative] = text
+
+            elif filename.endswith('.jsonl'):
+                with open(path, encoding='utf-8') as f:
+                    for line_number, line in enumerate(f, 1):
+                        if not line.strip():
+                            continue
+                        try:
+                            record = json.loads(line)
+                        except json.JSONDecodeError as e:
+                            warn(f"{relative}:{line_number}: skipping malformed line ({e})")
+                            continue
+                        if not isinstance(record, dict):
+                            warn(f"{relative}:{line_number}: skipping line, not a JSON object")
+                            continue
+                        entry_id = record.get('id', line_number)
+                        description = record.get('description') or ''
+                        if not isinstance(description, str) or not description.strip():
+                            continue
+                        key = f"{relative}#{entry_id}"
+                        if key in features:
+                            key = f"{key}@{line_number}"
+                            warn(f"{relative}:{line_number}: duplicate id {entry_id!r}, keyed as {key}")
+                        features[key] = description.strip()
+    return features
+
+
+def load_manifest(path: str) -> Dict[str, Any]:
+    if not os.path.exists(path):
+        return {'version': MANIFEST_VERSION, 'entries': {}}
+    with open(path, encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('version') != MANIFEST_VERSION:
+        print(f"⚠️  Manifest version {manifest.get('version')} not supported, rescanning everything")
+        return {'version': MANIFEST_VERSION, 'entries': {}}
+    return manifest
+
+
+def save_manifest(path: str, manifest: Dict[str, Any]):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+class PRDScanner:
+    def __init__(self, ragflow_client, workers: int = 8, cost_ceiling: Optional[float] = None):
+        self.ragflow_client = ragflow_client
+        self.workers = workers
+        self.cost_ceiling = cost_ceiling
+
+    def _analyze(self, description: str, budget: BatchBudget) -> Optional[Dict[str, Any]]:
+        meter = UsageMeter(batch=budget)
+        result = self.ragflow_client.run_analysis(description, meter=meter)
+        if result['mode'] == 'error':
+            return None
+        usage = meter.summary()
+        audit_record = self.ragflow_client.process_compliance_response(
+            result['answer'], result['evidence'], usage=usage, analysis_mode=result.get('analysis_mode')
+        )
+        get_ledger().record(usage, result.get('analysis_mode'))
+        record_decision(audit_record)
+        return audit_record
+
+    def scan(self, root: str, manifest_path: str) -> Dict[str, Any]:
+        start_time = time.time()
+        manifest = load_manifest(manifest_path)
+        previous = manifest['entries']
+        prompt_hash = self.ragflow_client.prompt_fingerprint()
+        discovery_warnings = []
+        features = discover_features(root, discovery_warnings)
+
+        pending = {}
+        unchanged = []
+        for key, description in features.items():
+            digest = content_hash(description)
+            entry = previous.get(key)
+            if entry is None:
+                pending[key] = (description, digest, 'added')
+            elif entry['content_hash'] != digest:
+                pending[key] = (description, digest, 'modified')
+            elif entry['prompt_hash'] != prompt_hash:
+                pending[key] = (description, digest, 'prompt_changed')
+            else:
+                unchanged.append(key)
+
+        removed = sorted(set(previous) - set(features))
+        print(f"🔎 {len(features)} features: {len(pending)} to analyze, {len(unchanged)} unchanged, {len(removed)} removed")
+
+        changes, errors = [], []
+        entries = {key: previous[key] for key in unchanged}
+        budget = BatchBudget(self.cost_ceiling)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {executor.submit(self._analyze, description, budget): key
+                       for key, (description, _, _) in pending.items()}
+            for future in as_completed(futures):
+                key = futures[future]
+                description, digest, reason = pending[key]
+                try:
+                    audit_record = future.result()
+                except Exception as e:
+                    print(f"❌ {key}: {e}")
+                    audit_record = None
+
+                if audit_record is None:
+                    errors.append(key)
+                    # Keep the previous verdict so the entry is retried on the next scan
+                    if key in previous:
+                        entries[key] = previous[key]
+                    continue
+
+                # Compare verdicts, not raw answers: '[YES]' after 'YES.' is not a flip
+                before = previous.get(key, {}).get('audit_record', {}).get('classification')
+                before = parse_verdict(before) if before is not None else None
+                after = parse_verdict(audit_record['classification'])
+                entries[key] = {
+                    'content_hash': digest,
+                    # A verdict downgraded to the monolithic prompt by the cost ceiling gets that
+                    # prompt's fingerprint, so the next scan re-analyzes it in the configured mode
+                    'prompt_hash': self.ragflow_client.prompt_fingerprint(audit_record['analysis_mode']),
+                    'scanned_at': datetime.now().isoformat(),
+                    'audit_record': audit_record
+                }
+                changes.append({
+                    'entry': key,
+                    'reason': reason,
+                    'previous_classification': before,
+                    'classification': after,
+                    'confidence': audit_record['confidence_score'],
+                    'flipped': before is not None and before != after
+                })
+
+        manifest['entries'] = entries
+        save_manifest(manifest_path, manifest)
+
+        changes.sort(key=lambda change: change['entry'])
+        return {
+            'root': root,
+            'prompt_hash': prompt_hash,
+            'total_entries': len(features),
+            'analyzed': len(changes),
+            'unchanged': len(unchanged),
+            'removed': removed,
+            'errors': sorted(errors),
+            'discovery_warnings': discovery_warnings,
+            'flips': [change for change in changes if change['flipped']],
+            'changes': changes,
+            'cost_usd': round(budget.spent, 6),
+            'elapsed_seconds': round(time.time() - start_time, 3)
+        }
+
+
+def newly_classified(report: Dict[str, Any], classification: str) -> List[Dict[str, Any]]:
+    """Changed entries that now have the given classification but did not before"""
+    classification = parse_verdict(classification)
+    return [
+        change for change in report['changes']
+        if parse_verdict(change['classification']) == classification and
+        parse_verdict(change['previous_classification']) != classification
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('root', help='Directory of feature / PRD files')
+    parser.add_argument('--manifest', default='compliance_manifest.json')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--fail-on', choices=['YES', 'UNCERTAIN'], help='Exit 1 if any entry newly has this classification')
+    parser.add_argument('--report', help='Write the JSON report to this path')
+    parser.add_argument('--stub', action='store_true', help='Use local stub backends')
+    parser.add_argument('--cost-ceiling', type=float,
+                        help='USD for the whole scan (default COST_CEILING_PER_BATCH_USD); '
+                             'past it, fan-out falls back to the single prompt')
+    args = parser.parse_args()
+
+    ragflow_client = create_stub_clients()[0] if args.stub else create_clients(get_cassette())[0]
+    scanner = PRDScanner(ragflow_client, workers=args.workers, cost_ceiling=args.cost_ceiling)
+    report = scanner.scan(args.root, args.manifest)
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    print(f"\n📋 Scanned {report['total_entries']} entries in {report['elapsed_seconds']}s: "
+          f"{report['analyzed']} analyzed, {report['unchanged']} unchanged, "
+          f"{len(report['removed'])} removed, {len(report['errors'])} errors, ${report['cost_usd']:.4f}")
+    for change in report['changes']:
+        arrow = f"{change['previous_classification'] or 'new'} -> {change['classification']}"
+        marker = '🔁' if change['flipped'] else '•'
+        print(f"{marker} {change['entry']}: {arrow} ({change['reason']})")
+    for key in report['removed']:
+        print(f"🗑️  {key}: removed")
+    for warning in report['discovery_warnings']:
+        print(f"⚠️  {warning}")
+
+    failed = bool(report['errors'])
+    if args.fail_on:
+        offending = newly_classified(report, args.fail_on)
+        for change in offending:
+            print(f"❌ {change['entry']} is now {args.fail_on}")
+        failed = failed or bool(offending)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
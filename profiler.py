@@ -0,0 +1,276 @@
+"""
+On-demand sampling profiler for individual requests
+
+A background thread samples the Python stacks of the threads working on one
+request every few milliseconds (wall clock, so time blocked on the network shows
+up under the socket / SSL frames that were waiting) and writes them in
+collapsed-stack format to PROFILE_DIR/<request_id>.collapsed, ready for
+flamegraph.pl or speedscope.
+
+Only attached threads are sampled: the thread that opened profile_request()
+(unless attach_current_thread=False), worker threads running a function wrapped
+by sampler.wrap(), and pool threads running work submitted through propagate()
+from an attached thread. Concurrent requests and other sessions stay out.
+
+Profiling is opt-in per request (API header / query param, app query param) or
+by PROFILE_SAMPLE_RATE; when a request is not profiled no sampler thread exists,
+so the only cost is the should_profile() check.
+
+Usage:
+    python profiler.py summarize profiles/<request_id>.collapsed --top 15
+"""
+
+import argparse
+import contextvars
+import os
+import random
+import re
+import sys
+import sysconfig
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, List, Any, Optional, Tuple
+
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', '5'))
+
+# A thread whose innermost frame is one of these is waiting for work, not doing it
+IDLE_FRAMES = (
+    ('_worker', 'concurrent/futures/thread.py'),
+    ('select', 'selectors.py'),
+)
+
+# Checked from the innermost frame outwards; the first match owns the sample
+COMPONENTS = (
+    ('network', ('socket.py', 'ssl.py', 'http/client.py', 'urllib3/', 'httpcore/', 'anyio/')),
+    ('json', ('json/',)),
+    ('ragflow_sdk', ('ragflow_sdk/', 'requests/')),
+    ('openai_sdk', ('openai/', 'httpx/')),
+    ('ragflow_client', ('ragflow_client.py',)),
+    ('reranking', ('reranking_utils.py',)),
+    ('streamlit', ('streamlit/', 'tornado/')),
+)
+
+_STDLIB_DIR = sysconfig.get_paths()['stdlib']
+
+# The sampler of the request the current thread is working on
+_current_sampler: contextvars.ContextVar = contextvars.ContextVar('current_sampler', default=None)
+
+
+def should_profile(requested: bool = False, sample_rate: Optional[float] = None) -> bool:
+    """Profile when explicitly requested, otherwise for a random fraction of requests"""
+    if requested:
+        return True
+    rate = PROFILE_SAMPLE_RATE if sample_rate is None else sample_rate
+    return rate > 0 and random.random() < rate
+
+
+def _short_path(filename: str) -> str:
+    if 'site-packages' in filename:
+        return filename.split('site-packages', 1)[1].lstrip(os.sep).replace(os.sep, '/')
+    if filename.startswith(_STDLIB_DIR):
+        return os.path.relpath(filename, _STDLIB_DIR).replace(os.sep, '/')
+    return os.path.basename(filename)
+
+
+class StackSampler:
+    """Samples the attached threads' stacks at a fixed interval into collapsed-stack counts"""
+
+    def __init__(self, interval: Optional[float] = None):
+        self.interval = interval if interval is not None else PROFILE_INTERVAL_MS / 1000
+        self.counts: Counter = Counter()
+        self.samples = 0
+        self.sampling_seconds = 0.0
+        self.started_at = None
+        self.duration = 0.0
+        self._labels: Dict[Any, Tuple[str, str]] = {}
+        self._threads: Counter = Counter()
+        self._threads_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @contextmanager
+    def attach(self):
+        """Sample the calling thread until the block exits"""
+        ident = threading.get_ident()
+        with self._threads_lock:
+            self._threads[ident] += 1
+        token = _current_sampler.set(self)
+        try:
+            yield
+        finally:
+            _current_sampler.reset(token)
+            with self._threads_lock:
+                self._threads[ident] -= 1
+                if self._threads[ident] <= 0:
+                    del self._threads[ident]
+
+    def wrap(self, func):
+        """func, sampled on whichever thread ends up running it"""
+        def attached(*args, **kwargs):
+            with self.attach():
+                return func(*args, **kwargs)
+        return attached
+
+    def _label(self, code) -> Tuple[str, str]:
+        label = self._labels.get(code)
+        if label is None:
+            path = _short_path(code.co_filename)
+            label = (f"{code.co_name} ({path}:{code.co_firstlineno})", path)
+            self._labels[code] = label
+        return label
+
+    def start(self):
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.time() - self.started_at
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            sample_start = time.perf_counter()
+            with self._threads_lock:
+                attached = list(self._threads)
+            frames = sys._current_frames()
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id in attached:
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                if (frame.f_code.co_name, self._label(frame.f_code)[1]) in IDLE_FRAMES:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._label(frame.f_code)[0])
+                    frame = frame.f_back
+                # Pool threads are numbered per worker; merge them by pool name
+                thread_name = re.sub(r'_\d+$', '', names.get(thread_id, f"thread-{thread_id}"))
+                stack.append(thread_name)
+                self.counts[';'.join(reversed(stack))] += 1
+            self.samples += 1
+            self.sampling_seconds += time.perf_counter() - sample_start
+
+    def write(self, path: str) -> str:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in sorted(self.counts.items()):
+                f.write(f"{stack} {count}\n")
+        return path
+
+
+def profile_path(request_id: str, output_dir: Optional[str] = None) -> str:
+    safe_id = re.sub(r'[^A-Za-z0-9_.-]', '_', request_id)[:100]
+    return os.path.join(output_dir or PROFILE_DIR, f"{safe_id}.collapsed")
+
+
+def propagate(func):
+    """Wrap work handed to a thread pool so it is sampled with the submitting request"""
+    sampler = _current_sampler.get()
+    return sampler.wrap(func) if sampler is not None else func
+
+
+@contextmanager
+def profile_request(request_id: str, enabled: bool = True, output_dir: Optional[str] = None,
+                    attach_current_thread: bool = True):
+    """
+    Sample the request's threads for the duration of the block; yields the sampler (None when
+    disabled). Callers on a shared thread (an event loop) pass attach_current_thread=False and
+    attach the workers with sampler.wrap().
+    """
+    if not enabled:
+        yield None
+        return
+
+    sampler = StackSampler()
+    sampler.start()
+    try:
+        if attach_current_thread:
+            with sampler.attach():
+                yield sampler
+        else:
+            yield sampler
+    finally:
+        sampler.stop()
+        sampler.path = sampler.write(profile_path(request_id, output_dir))
+        overhead = sampler.sampling_seconds / sampler.duration * 100 if sampler.duration else 0.0
+        print(f"🔥 Profile for {request_id}: {sampler.samples} samples over {sampler.duration:.2f}s "
+              f"({overhead:.1f}% sampling overhead) -> {sampler.path}")
+
+
+def load_collapsed(path: str) -> List[Tuple[List[str], int]]:
+    stacks = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            stack, _, count = line.rstrip('\n').rpartition(' ')
+            if stack:
+                stacks.append((stack.split(';'), int(count)))
+    return stacks
+
+
+def _frame_path(frame: str) -> str:
+    match = re.search(r'\(([^()]*):\d+\)$', frame)
+    return match.group(1) if match else ''
+
+
+def summarize(path: str, top: int = 15) -> Dict[str, Any]:
+    """Time per component, plus the frames with the most self and inclusive samples"""
+    stacks = load_collapsed(path)
+    total = sum(count for _, count in stacks)
+    components: Counter = Counter()
+    self_counts: Counter = Counter()
+    inclusive_counts: Counter = Counter()
+
+    for frames, count in stacks:
+        component = 'other'
+        for frame in reversed(frames[1:]):
+            frame_path = _frame_path(frame)
+            owner = next((name for name, patterns in COMPONENTS if any(p in frame_path for p in patterns)), None)
+            if owner:
+                component = owner
+                break
+        components[component] += count
+        self_counts[frames[-1]] += count
+        for frame in set(frames[1:]):
+            inclusive_counts[frame] += count
+
+    return {
+        'total_samples': total,
+        'components': components.most_common(),
+        'self': self_counts.most_common(top),
+        'inclusive': inclusive_counts.most_common(top)
+    }
+
+
+def _print_summary(summary: Dict[str, Any]):
+    total = summary['total_samples'] or 1
+    print(f"📊 {summary['total_samples']} samples (threads of the request)\n")
+    print("Time by component:")
+    for name, count in summary['components']:
+        print(f"  {name:<20} {count:>7}  {count / total * 100:5.1f}%")
+    for title, key in (('Top self time', 'self'), ('Top inclusive time', 'inclusive')):
+        print(f"\n{title}:")
+        for frame, count in summary[key]:
+            print(f"  {count:>7}  {count / total * 100:5.1f}%  {frame}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    summarize_parser = subparsers.add_parser('summarize', help='Break a collapsed-stack profile down by component')
+    summarize_parser.add_argument('path')
+    summarize_parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    if args.command == 'summarize':
+        _print_summary(summarize(args.path, top=args.top))
+
+
+if __name__ == "__main__":
+    main()
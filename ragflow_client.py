@@ -1,18 +1,83 @@
 from ragflow_sdk import RAGFlow
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-from typing import Dict, List, Any, Optional
+from typing import Callable, Dict, List, Any, Optional, Tuple
+import hashlib
 import os
+import re
+import threading
+import time
 from dotenv import load_dotenv
 
+from cost_accounting import UsageMeter, estimate_tokens
+from env_settings import env_int
+from profiler import propagate
+from ragflow_router import EndpointRouter
+from verdicts import parse_verdict
+
 load_dotenv()
 
+COMPLIANCE_PROMPT_TEMPLATE = """Analyze this TikTok feature for geo-specific compliance needs: {feature_description}
+
+IMPORTANT: Only flag features that require geo-specific logic due to LEGAL/REGULATORY requirements, NOT business decisions.
+
+Examples:
+✅ LEGAL: "Age gates for Indonesia Child Protection Law" - requires compliance logic
+✅ LEGAL: "Location-based content blocking for France copyright rules" - requires compliance logic  
+❌ BUSINESS: "Geofence rollout in US for market testing" - business decision, not legal requirement
+❓ UNCLEAR: "Feature disabled in KR" without specifying legal reason - needs human review
+
+ALWAYS respond in this exact format:
+CLASSIFICATION: [YES/NO/UNCERTAIN]
+CONFIDENCE: [1-10]
+REASONING: [detailed explanation - distinguish between legal compliance vs business decisions]  
+REGULATIONS: [specific laws that apply, or "None identified" if business-driven]
+EVIDENCE: [quote relevant chunks]
+
+Focus on: DSA, California Kids Act, Florida/Utah Minor Protection, NCMEC reporting requirements, GDPR, data localization laws."""
+
+# Regulations covered by the monolithic prompt, split out for fan-out mode
+REGULATION_SCOPES = {
+    'DSA': 'the EU Digital Services Act (DSA)',
+    'CA_KIDS': 'the California Protecting Our Kids from Social Media Addiction Act',
+    'FL_UT_MINORS': 'the Florida Online Protections for Minors law or the Utah Social Media Regulation Act',
+    'NCMEC': 'the US reporting requirements for child sexual abuse content to NCMEC',
+    'GDPR': 'the EU General Data Protection Regulation (GDPR)',
+    'DATA_LOCALIZATION': 'data localization laws (e.g. Brazil, Indonesia, China)',
+}
+
+FANOUT_PROMPT_TEMPLATE = """Does this TikTok feature need geo-specific compliance logic because of {regulation}? Feature: {feature_description}
+
+Only answer YES for LEGAL/REGULATORY requirements under this regulation, NOT business decisions. Answer UNCERTAIN if a geo restriction is mentioned without a legal reason.
+
+Respond briefly in this exact format:
+CLASSIFICATION: [YES/NO/UNCERTAIN]
+CONFIDENCE: [1-10]
+REASONING: [one sentence]
+REGULATIONS: [specific provisions that apply, or "None identified"]"""
+
+
 class RAGFlowClient:
-    def __init__(self):
+    def __init__(self, assistant=None):
         self.api_key = os.getenv('RAGFLOW_API_KEY')
         self.base_url = os.getenv('RAGFLOW_BASE_URL', 'http://localhost')
         self.assistant_id = os.getenv('RAGFLOW_ASSISTANT_ID')
+        self.analysis_mode = os.getenv('RAGFLOW_ANALYSIS_MODE', 'monolithic')
+        self.fanout_confidence_threshold = env_int('RAGFLOW_FANOUT_CONFIDENCE_THRESHOLD', 8)
         self.rag_client = None
         self.assistant = None
+        self.router = None
+        
+        # An injected assistant (e.g. a cassette replay or test stub) skips the live connection
+        if assistant is not None:
+            self.assistant = assistant
+            return
+        
+        # RAGFLOW_ENDPOINTS configures a routed pool instead of the single base URL / assistant
+        self.router = EndpointRouter.from_env()
+        if self.router is not None:
+            print(f"✅ Routing across {len(self.router.endpoints)} RAGFlow endpoints ({self.router.policy})")
+            return
         
         try:
             # Initialize RAGFlow client
@@ -31,32 +96,206 @@ class RAGFlowClient:
             self.rag_client = None
             self.assistant = None
     
-    def create_chat_session(self) -> Optional[str]:
+    def is_connected(self) -> bool:
+        """Whether a RAGFlow assistant (or at least one routed endpoint) is usable"""
+        if self.router is not None:
+            return self.router.has_healthy_endpoint()
+        return self.assistant is not None
+    
+    def get_endpoint_stats(self) -> List[Dict[str, Any]]:
+        """Per-endpoint load, latency and health (empty without RAGFLOW_ENDPOINTS)"""
+        return self.router.stats() if self.router is not None else []
+    
+    def create_chat_session(self, assistant=None) -> Optional[str]:
         """Create a new chat session using RAGFlow SDK"""
-        if not self.assistant:
+        assistant = assistant or self.assistant
+        if not assistant:
             return None
             
         try:
             session_name = f"Compliance Analysis - {datetime.now().strftime('%Y-%m-%d %H:%M')}"
-            session = self.assistant.create_session(name=session_name)
+            session = assistant.create_session(name=session_name)
             print(f"✅ Created session: {session.id}")
             return session
         except Exception as e:
             print(f"Error creating chat session: {e}")
             return None
     
-    def analyze_feature(self, feature_description: str, session = None) -> Dict[str, Any]:
+    def _stream_answer(self, session, prompt: str, stop_event: Optional[threading.Event] = None,
+                       on_content: Optional[Callable[[str], None]] = None) -> Tuple[str, Any, int, bool]:
+        """
+        Stream a prompt through a session, returning (answer, last_message, message_count, cancelled).
+        on_content, if given, receives the cumulative content after every message.
+        """
+        response_iter = session.ask(prompt, stream=True)
+        
+        print("📥 Receiving streaming response...")
+        
+        # Collect the full response from the generator
+        full_content = ""
+        last_message = None
+        message_count = 0
+        cancelled = False
+        
+        try:
+            for message in response_iter:
+                # Stop reading (and close the stream) once another branch has decided
+                if stop_event is not None and stop_event.is_set():
+                    cancelled = True
+                    break
+                
+                message_count += 1
+                last_message = message
+                print(f"📨 Message #{message_count}: {type(message)}")
+                
+                # Debug message type
+                if hasattr(message, 'content'):
+                    full_content = message.content  # This gets the complete content
+                    print(f"✅ Content length: {len(full_content)} chars")
+                    if len(full_content) < 200:
+                        print(f"Content preview: {full_content}")
+                    if on_content is not None:
+                        on_content(full_content)
+                else:
+                    print(f"⚠️  Unexpected message type: {type(message)}")
+                    print(f"Message attributes: {dir(message)}")
+                    print(f"Message: {message}")
+                    continue
+        finally:
+            # Close the stream explicitly so a cancelled branch stops generating now, not at garbage collection
+            close = getattr(response_iter, 'close', None)
+            if close is not None:
+                close()
+        
+        print(f"🏁 Finished processing {message_count} messages")
+        return full_content.strip(), last_message, message_count, cancelled
+    
+    def _ask(self, prompt: str, session=None, stop_event: Optional[threading.Event] = None,
+             on_content: Optional[Callable[[str], None]] = None) -> Tuple[str, Any, Any, bool]:
+        """
+        Stream a prompt on the given session, or route it to one of the RAGFlow endpoints,
+        failing over to another endpoint if the chosen one errors before the first token.
+        Returns (answer, last_message, session, cancelled).
+        """
+        if session is not None:
+            print(f"📤 Sending prompt to RAGFlow session {session.id}...")
+            answer, last_message, _, cancelled = self._stream_answer(session, prompt, stop_event, on_content)
+            return answer, last_message, session, cancelled
+        
+        tried = set()
+        last_error = None
+        for _ in range(self.router.max_attempts):
+            endpoint = self.router.acquire(exclude=tried)
+            if endpoint is None:
+                break
+            tried.add(endpoint.name)
+            
+            start_time = time.time()
+            first_token_at = []
+            
+            def track_first_token(content: str):
+                if not first_token_at:
+                    first_token_at.append(time.time())
+                if on_content is not None:
+                    on_content(content)
+            
+            try:
+                session = self.create_chat_session(endpoint.assistant)
+                if not session:
+                    raise RuntimeError("Could not create RAGFlow session")
+                print(f"📤 Sending prompt to {endpoint.name} session {session.id}...")
+                answer, last_message, _, cancelled = self._stream_answer(session, prompt, stop_event, track_first_token)
+            except Exception as e:
+                self.router.release(endpoint, failed=True, error=str(e))
+                # Once tokens have reached the caller the request can no longer move
+                if first_token_at:
+                    raise
+                print(f"🔀 Failing over from {endpoint.name}: {e}")
+                last_error = e
+                continue
+            
+            if not answer and not cancelled:
+                self.router.release(endpoint, failed=True, error='empty response')
+                print(f"🔀 Failing over from {endpoint.name}: empty response")
+                last_error = RuntimeError('empty response')
+                continue
+            
+            ttft = first_token_at[0] - start_time if first_token_at else None
+            self.router.release(endpoint, ttft=ttft)
+            return answer, last_message, session, cancelled
+        
+        raise RuntimeError(f"No RAGFlow endpoint available (last error: {last_error})")
+    
+    def _extract_evidence(self, last_message) -> List[Dict]:
+        """Convert the reference chunks attached to the final message into evidence dicts"""
+        evidence_chunks = []
+        if last_message and hasattr(last_message, 'reference') and last_message.reference:
+            for ref in last_message.reference:
+                # Handle both dict and object formats for references
+                if isinstance(ref, dict):
+                    evidence_chunks.append({
+                        'content': ref.get('content', ''),
+                        'source': ref.get('document_name', 'Unknown'),
+                        'chunk_id': ref.get('id', ''),
+                        'similarity_score': ref.get('similarity', 0.0)
+                    })
+                else:
+                    # Object format
+                    evidence_chunks.append({
+                        'content': getattr(ref, 'content', ''),
+                        'source': getattr(ref, 'document_name', 'Unknown'),
+                        'chunk_id': getattr(ref, 'id', ''),
+                        'similarity_score': getattr(ref, 'similarity', 0.0)
+                    })
+        return evidence_chunks
+    
+    def prompt_fingerprint(self, analysis_mode: Optional[str] = None) -> str:
+        """
+        Hash of the prompt template(s) of an analysis mode (default: the configured one);
+        changes invalidate cached verdicts
+        """
+        analysis_mode = analysis_mode or self.analysis_mode
+        if analysis_mode == 'fanout':
+            material = [analysis_mode, FANOUT_PROMPT_TEMPLATE, sorted(REGULATION_SCOPES.items())]
+        else:
+            material = [analysis_mode, COMPLIANCE_PROMPT_TEMPLATE]
+        return hashlib.sha256(repr(material).encode('utf-8')).hexdigest()[:16]
+    
+    def run_analysis(self, feature_description: str, on_content: Optional[Callable[[str], None]] = None,
+                     meter: Optional[UsageMeter] = None) -> Dict[str, Any]:
+        """
+        Analyze a feature using the configured analysis mode (RAGFLOW_ANALYSIS_MODE).
+        on_content only streams partial content in monolithic mode; fan-out merges at the end.
+        Token usage is recorded on meter; once its cost budget is spent, fan-out falls back
+        to the single monolithic prompt.
+        """
+        if self.analysis_mode == 'fanout':
+            if meter is None or meter.remaining() > 0:
+                return self.analyze_feature_fanout(feature_description, meter=meter)
+            meter.record_downgrade('analysis', 'fanout->monolithic')
+        return self.analyze_feature(feature_description, on_content=on_content, meter=meter)
+    
+    def _record_generation(self, meter: UsageMeter, prompt: str, answer: str, evidence_chunks: List[Dict]):
+        """RAGFlow reports no usage: estimate our prompt plus the retrieved chunks it injects, and the answer"""
+        context_tokens = sum(estimate_tokens(chunk['content']) for chunk in evidence_chunks)
+        meter.record('analysis', 'ragflow', estimate_tokens(prompt) + context_tokens, estimate_tokens(answer),
+                     estimated=True)
+    
+    def analyze_feature(self, feature_description: str, session = None,
+                        on_content: Optional[Callable[[str], None]] = None,
+                        meter: Optional[UsageMeter] = None) -> Dict[str, Any]:
         """Analyze a feature for compliance using the RAGFlow assistant"""
         
         print(f"🔍 Analyzing feature: {feature_description[:100]}...")
+        start_time = time.time()
         
-        # Try RAGFlow integration first
-        if not session:
+        # Try RAGFlow integration first (routed requests get their session from the chosen endpoint)
+        if not session and self.router is None:
             print("📝 Creating new chat session...")
             session = self.create_chat_session()
         
         # If RAGFlow connection fails, return error
-        if not session:
+        if not session and self.router is None:
             print("❌ No session available")
             return {
                 'answer': 'Error: Could not create RAGFlow session',
@@ -68,79 +307,19 @@ class RAGFlowClient:
             }
         
         try:
-            compliance_prompt = f"""Analyze this TikTok feature for geo-specific compliance needs: {feature_description}
-
-IMPORTANT: Only flag features that require geo-specific logic due to LEGAL/REGULATORY requirements, NOT business decisions.
-
-Examples:
-✅ LEGAL: "Age gates for Indonesia Child Protection Law" - requires compliance logic
-✅ LEGAL: "Location-based content blocking for France copyright rules" - requires compliance logic  
-❌ BUSINESS: "Geofence rollout in US for market testing" - business decision, not legal requirement
-❓ UNCLEAR: "Feature disabled in KR" without specifying legal reason - needs human review
-
-ALWAYS respond in this exact format:
-CLASSIFICATION: [YES/NO/UNCERTAIN]
-CONFIDENCE: [1-10]
-REASONING: [detailed explanation - distinguish between legal compliance vs business decisions]  
-REGULATIONS: [specific laws that apply, or "None identified" if business-driven]
-EVIDENCE: [quote relevant chunks]
-
-Focus on: DSA, California Kids Act, Florida/Utah Minor Protection, NCMEC reporting requirements, GDPR, data localization laws."""
+            compliance_prompt = COMPLIANCE_PROMPT_TEMPLATE.format(feature_description=feature_description)
 
-            print(f"📤 Sending prompt to RAGFlow session {session.id}...")
             print(f"Prompt preview: {compliance_prompt[:200]}...")
 
             # Use streaming mode as it works better with RAGFlow SDK
-            response_iter = session.ask(compliance_prompt, stream=True)
-            
-            print("📥 Receiving streaming response...")
-            
-            # Collect the full response from the generator
-            full_content = ""
-            evidence_chunks = []
-            last_message = None
-            message_count = 0
-            
-            for message in response_iter:
-                message_count += 1
-                last_message = message
-                print(f"📨 Message #{message_count}: {type(message)}")
-                
-                # Debug message type
-                if hasattr(message, 'content'):
-                    full_content = message.content  # This gets the complete content
-                    print(f"✅ Content length: {len(full_content)} chars")
-                    if len(full_content) < 200:
-                        print(f"Content preview: {full_content}")
-                else:
-                    print(f"⚠️  Unexpected message type: {type(message)}")
-                    print(f"Message attributes: {dir(message)}")
-                    print(f"Message: {message}")
-                    continue
-                
-            print(f"🏁 Finished processing {message_count} messages")
-            answer = full_content.strip()
+            answer, last_message, session, _ = self._ask(compliance_prompt, session=session, on_content=on_content)
             print(f"📝 Final answer length: {len(answer)} chars")
             
             # Process reference chunks from the final message
-            if last_message and hasattr(last_message, 'reference') and last_message.reference:
-                for ref in last_message.reference:
-                    # Handle both dict and object formats for references
-                    if isinstance(ref, dict):
-                        evidence_chunks.append({
-                            'content': ref.get('content', ''),
-                            'source': ref.get('document_name', 'Unknown'),
-                            'chunk_id': ref.get('id', ''),
-                            'similarity_score': ref.get('similarity', 0.0)
-                        })
-                    else:
-                        # Object format
-                        evidence_chunks.append({
-                            'content': getattr(ref, 'content', ''),
-                            'source': getattr(ref, 'document_name', 'Unknown'),
-                            'chunk_id': getattr(ref, 'id', ''),
-                            'similarity_score': getattr(ref, 'similarity', 0.0)
-                        })
+            evidence_chunks = self._extract_evidence(last_message)
+            
+            meter = meter if meter is not None else UsageMeter()
+            self._record_generation(meter, compliance_prompt, answer, evidence_chunks)
             
             # If we got an empty response, return error
             if not answer:
@@ -160,7 +339,12 @@ Focus on: DSA, California Kids Act, Florida/Utah Minor Protection, NCMEC reporti
                 'session_id': session.id,
                 'feature_input': feature_description,
                 'timestamp': datetime.now().isoformat(),
-                'mode': 'ragflow'
+                'mode': 'ragflow',
+                'analysis_mode': 'monolithic',
+                'latency_seconds': round(time.time() - start_time, 3),
+                'generated_chars': len(answer),
+                'estimated_tokens': estimate_tokens(compliance_prompt) + estimate_tokens(answer),
+                'usage': meter.summary()
             }
             
         except Exception as e:
@@ -174,9 +358,217 @@ Focus on: DSA, California Kids Act, Florida/Utah Minor Protection, NCMEC reporti
                 'mode': 'error'
             }
     
+    def _new_branch(self, regulation_id: str) -> Dict[str, Any]:
+        """Empty fan-out branch result; stays 'cancelled' unless the sub-query completes"""
+        return {
+            'regulation_id': regulation_id,
+            'status': 'cancelled',
+            'classification': None,
+            'confidence': None,
+            'reasoning': '',
+            'regulations': '',
+            'evidence': [],
+            'session_id': None,
+            'prompt_chars': 0,
+            'generated_chars': 0,
+            'estimated_tokens': 0,
+            'latency_seconds': 0.0
+        }
     
-    def process_compliance_response(self, response_text: str, evidence_chunks: List[Dict]) -> Dict[str, Any]:
-        """Parse structured response from LLM"""
+    def _analyze_regulation(self, feature_description: str, regulation_id: str, stop_event: threading.Event,
+                            meter: UsageMeter) -> Dict[str, Any]:
+        """Run one short-form sub-query of the fan-out for a single regulation"""
+        start_time = time.time()
+        branch = self._new_branch(regulation_id)
+        
+        if stop_event.is_set():
+            return branch
+        
+        session = None
+        if self.router is None:
+            session = self.create_chat_session()
+            if not session:
+                branch['status'] = 'error'
+                return branch
+        
+        try:
+            prompt = FANOUT_PROMPT_TEMPLATE.format(
+                regulation=REGULATION_SCOPES[regulation_id],
+                feature_description=feature_description
+            )
+            print(f"📤 [{regulation_id}] Sending sub-query...")
+            answer, last_message, session, cancelled = self._ask(prompt, session=session, stop_event=stop_event)
+            
+            branch['session_id'] = session.id
+            branch['prompt_chars'] = len(prompt)
+            branch['generated_chars'] = len(answer)
+            branch['estimated_tokens'] = estimate_tokens(prompt) + estimate_tokens(answer)
+            branch['latency_seconds'] = round(time.time() - start_time, 3)
+            
+            # Cancelled branches were still billed for the prompt and whatever was generated
+            evidence = self._extract_evidence(last_message)
+            self._record_generation(meter, prompt, answer, evidence)
+            
+            if cancelled:
+                print(f"⏹️  [{regulation_id}] Cancelled after early exit")
+                return branch
+            if not answer:
+                branch['status'] = 'error'
+                return branch
+            
+            parsed = self._parse_sections(answer)
+            branch.update({
+                'status': 'completed',
+                'classification': parse_verdict(parsed['classification']),
+                'confidence': self._parse_confidence(parsed['confidence']),
+                'reasoning': parsed['reasoning'],
+                'regulations': parsed['regulations'],
+                'evidence': evidence
+            })
+            print(f"✅ [{regulation_id}] {branch['classification']} ({branch['confidence']}/10)")
+            return branch
+            
+        except Exception as e:
+            print(f"❌ [{regulation_id}] RAGFlow SDK error: {e}")
+            branch['status'] = 'error'
+            return branch
+    
+    def analyze_feature_fanout(self, feature_description: str, confidence_threshold: Optional[int] = None,
+                               max_workers: Optional[int] = None,
+                               meter: Optional[UsageMeter] = None) -> Dict[str, Any]:
+        """
+        Analyze a feature with one concurrent short-form sub-query per regulation.
+        As soon as a branch answers YES at or above the confidence threshold, the
+        remaining branches are cancelled and the merged verdict is returned.
+        """
+        print(f"🔍 Fan-out analysis of feature: {feature_description[:100]}...")
+        start_time = time.time()
+        
+        if confidence_threshold is None:
+            confidence_threshold = self.fanout_confidence_threshold
+        
+        if self.router is None and not self.assistant:
+            print("❌ No session available")
+            return {
+                'answer': 'Error: Could not create RAGFlow session',
+                'evidence': [],
+                'session_id': 'no_session',
+                'feature_input': feature_description,
+                'timestamp': datetime.now().isoformat(),
+                'mode': 'error'
+            }
+        
+        stop_event = threading.Event()
+        branches = []
+        meter = meter if meter is not None else UsageMeter()
+        
+        with ThreadPoolExecutor(max_workers=max_workers or len(REGULATION_SCOPES)) as executor:
+            futures = [
+                executor.submit(propagate(self._analyze_regulation), feature_description, regulation_id, stop_event, meter)
+                for regulation_id in REGULATION_SCOPES
+            ]
+            for future in as_completed(futures):
+                if future.cancelled():
+                    continue
+                branch = future.result()
+                branches.append(branch)
+                
+                if (branch['status'] == 'completed' and branch['classification'] == 'YES'
+                        and (branch['confidence'] or 0) >= confidence_threshold):
+                    print(f"⚡ Early exit on {branch['regulation_id']}: YES ({branch['confidence']}/10)")
+                    stop_event.set()
+                    for pending in futures:
+                        pending.cancel()
+        
+        # Branches cancelled before they started still count towards the summary
+        seen = {branch['regulation_id'] for branch in branches}
+        for regulation_id in REGULATION_SCOPES:
+            if regulation_id not in seen:
+                branches.append(self._new_branch(regulation_id))
+        branches.sort(key=lambda b: list(REGULATION_SCOPES).index(b['regulation_id']))
+        
+        completed = [b for b in branches if b['status'] == 'completed']
+        if not completed:
+            print("⚠️  No fan-out branch completed")
+            return {
+                'answer': 'Error: RAGFlow returned empty response',
+                'evidence': [],
+                'session_id': 'error',
+                'feature_input': feature_description,
+                'timestamp': datetime.now().isoformat(),
+                'mode': 'error'
+            }
+        
+        answer = self._merge_branches(completed)
+        
+        # Union of references across branches, best similarity first
+        evidence_chunks = {}
+        for branch in completed:
+            for chunk in branch['evidence']:
+                key = chunk['chunk_id'] or chunk['content']
+                if key not in evidence_chunks or chunk['similarity_score'] > evidence_chunks[key]['similarity_score']:
+                    evidence_chunks[key] = chunk
+        evidence = sorted(evidence_chunks.values(), key=lambda c: c['similarity_score'], reverse=True)
+        
+        return {
+            'answer': answer,
+            'evidence': evidence,
+            'session_id': ','.join(b['session_id'] for b in completed),
+            'feature_input': feature_description,
+            'timestamp': datetime.now().isoformat(),
+            'mode': 'ragflow',
+            'analysis_mode': 'fanout',
+            'latency_seconds': round(time.time() - start_time, 3),
+            'generated_chars': sum(b['generated_chars'] for b in branches),
+            'estimated_tokens': sum(b['estimated_tokens'] for b in branches),
+            'usage': meter.summary(),
+            'branches': [
+                {key: value for key, value in b.items() if key != 'evidence'}
+                for b in branches
+            ]
+        }
+    
+    def _merge_branches(self, completed: List[Dict]) -> str:
+        """Merge per-regulation verdicts into the monolithic CLASSIFICATION/... response format"""
+        verdicts = {b['regulation_id']: parse_verdict(b['classification']) for b in completed}
+        yes = [b for b in completed if verdicts[b['regulation_id']] == 'YES']
+        # Branches with no recognizable verdict count as uncertain
+        uncertain = [b for b in completed if verdicts[b['regulation_id']] not in ('YES', 'NO')]
+        
+        if yes:
+            classification = 'YES'
+            relevant = yes
+            confidence = max(b['confidence'] or 0 for b in yes)
+            regulations = '; '.join(
+                b['regulations'] for b in yes
+                if b['regulations'] and not b['regulations'].lower().startswith('none')
+            ) or ', '.join(b['regulation_id'] for b in yes)
+        elif uncertain:
+            classification = 'UNCERTAIN'
+            relevant = uncertain
+            confidence = max(b['confidence'] or 0 for b in uncertain)
+            regulations = 'None identified'
+        else:
+            # Overall NO is only as confident as the least confident branch
+            classification = 'NO'
+            relevant = completed
+            confidence = min(b['confidence'] or 0 for b in completed)
+            regulations = 'None identified'
+        
+        reasoning = ' '.join(f"[{b['regulation_id']}] {b['reasoning']}" for b in relevant)
+        
+        return (f"CLASSIFICATION: {classification}\n"
+                f"CONFIDENCE: {confidence}\n"
+                f"REASONING: {reasoning}\n"
+                f"REGULATIONS: {regulations}")
+    
+    def _parse_confidence(self, value: str) -> Optional[int]:
+        """Extract the 1-10 confidence score from a CONFIDENCE section"""
+        match = re.search(r'\d+', value or '')
+        return int(match.group()) if match else None
+    
+    def _parse_sections(self, response_text: str) -> Dict[str, str]:
+        """Split a CLASSIFICATION/CONFIDENCE/REASONING/REGULATIONS response into its sections"""
         lines = response_text.split('\n')
         parsed = {
             'classification': 'UNCERTAIN',
@@ -226,6 +618,17 @@ Focus on: DSA, California Kids Act, Florida/Utah Minor Protection, NCMEC reporti
         if current_section and content_buffer:
             parsed[current_section] = ' '.join(content_buffer).strip()
         
+        return parsed
+    
+    def process_compliance_response(self, response_text: str, evidence_chunks: List[Dict],
+                                    usage: Optional[Dict[str, Any]] = None,
+                                    analysis_mode: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Parse structured response from LLM; usage (a UsageMeter summary) and the analysis mode
+        that produced the answer are kept on the audit record
+        """
+        parsed = self._parse_sections(response_text)
+        
         # Create audit record
         audit_record = {
             'timestamp': datetime.now().isoformat(),
@@ -244,5 +647,9 @@ Focus on: DSA, California Kids Act, Florida/Utah Minor Protection, NCMEC reporti
             ],
             'total_evidence_chunks': len(evidence_chunks)
         }
+        if usage is not None:
+            audit_record['usage'] = usage
+        if analysis_mode is not None:
+            audit_record['analysis_mode'] = analysis_mode
         
         return audit_record
\ No newline at end of file
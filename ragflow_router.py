@@ -0,0 +1,208 @@
+"""
+Latency-aware routing across multiple RAGFlow endpoints
+
+RAGFLOW_ENDPOINTS lists the backend pool as comma-separated
+"base_url|assistant_id[|api_key]" entries (api_key defaults to RAGFLOW_API_KEY).
+Requests go to the endpoint with the fewest outstanding requests or the lowest
+load-weighted EWMA time-to-first-token (endpoints without a measurement are
+scored with the pool's mean EWMA, or RAGFLOW_DEFAULT_TTFT). Failures are tracked
+passively: after consecutive failures an endpoint is ejected for a cool-down that
+doubles on each repeated ejection. Endpoints without a connection are reconnected
+on a background thread once their cool-down expires, never on the request path.
+"""
+
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Any, Optional
+
+from ragflow_sdk import RAGFlow
+
+ROUTING_POLICIES = ('least_outstanding', 'ewma')
+
+
+class RAGFlowEndpoint:
+    def __init__(self, base_url: str, assistant_id: str, api_key: Optional[str], assistant=None):
+        self.base_url = base_url
+        self.assistant_id = assistant_id
+        self.api_key = api_key
+        self.name = f"{base_url}#{assistant_id}"
+        self.assistant = assistant
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        self.ewma_ttft: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.reconnecting = False
+
+    def connect(self, assistant_wrapper: Optional[Callable] = None) -> bool:
+        """(Re)connect to the endpoint's assistant; returns whether it is usable"""
+        if self.assistant is not None:
+            return True
+        try:
+            chats = RAGFlow(api_key=self.api_key, base_url=self.base_url).list_chats(id=self.assistant_id)
+            if not chats:
+                self.last_error = f"Assistant {self.assistant_id} not found"
+                print(f"⚠️  [{self.name}] {self.last_error}")
+                return False
+            self.assistant = assistant_wrapper(chats[0]) if assistant_wrapper else chats[0]
+            print(f"✅ Connected to RAGFlow endpoint {self.name}")
+            return True
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"⚠️  [{self.name}] RAGFlow connection failed: {e}")
+            return False
+
+    def is_ejected(self, now: float) -> bool:
+        return now < self.ejected_until
+
+    def stats(self, now: float) -> Dict[str, Any]:
+        return {
+            'endpoint': self.name,
+            'connected': self.assistant is not None,
+            'ejected': self.is_ejected(now),
+            'ejected_for_seconds': round(max(0.0, self.ejected_until - now), 1),
+            'outstanding': self.outstanding,
+            'requests': self.requests,
+            'failures': self.failures,
+            'ewma_ttft_seconds': round(self.ewma_ttft, 3) if self.ewma_ttft is not None else None,
+            'last_error': self.last_error
+        }
+
+
+class EndpointRouter:
+    def __init__(self, endpoints: List[RAGFlowEndpoint], policy: str = 'least_outstanding',
+                 ewma_alpha: float = 0.3, failure_threshold: int = 3, ejection_seconds: float = 30.0,
+                 max_attempts: Optional[int] = None, default_ttft: float = 1.0):
+        if policy not in ROUTING_POLICIES:
+            raise ValueError(f"Unknown routing policy: {policy}")
+        self.endpoints = endpoints
+        self.policy = policy
+        self.ewma_alpha = ewma_alpha
+        self.default_ttft = default_ttft
+        self.failure_threshold = failure_threshold
+        self.ejection_seconds = ejection_seconds
+        self.max_attempts = max_attempts or len(endpoints)
+        self.assistant_wrapper: Optional[Callable] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> Optional['EndpointRouter']:
+        """Router for RAGFLOW_ENDPOINTS, or None when a single endpoint is configured"""
+        spec = os.getenv('RAGFLOW_ENDPOINTS', '').strip()
+        if not spec:
+            return None
+
+        default_key = os.getenv('RAGFLOW_API_KEY')
+        endpoints = []
+        for item in spec.split(','):
+            parts = [part.strip() for part in item.strip().split('|')]
+            if len(parts) < 2 or not parts[0] or not parts[1]:
+                raise ValueError(f"Invalid RAGFLOW_ENDPOINTS entry (expected base_url|assistant_id[|api_key]): {item}")
+            endpoints.append(RAGFlowEndpoint(parts[0], parts[1], parts[2] if len(parts) > 2 else default_key))
+
+        router = cls(
+            endpoints,
+            policy=os.getenv('RAGFLOW_ROUTING_POLICY', 'least_outstanding'),
+            ewma_alpha=float(os.getenv('RAGFLOW_EWMA_ALPHA', '0.3')),
+            failure_threshold=int(os.getenv('RAGFLOW_EJECT_AFTER_FAILURES', '3')),
+            ejection_seconds=float(os.getenv('RAGFLOW_EJECT_SECONDS', '30')),
+            default_ttft=float(os.getenv('RAGFLOW_DEFAULT_TTFT', '1.0'))
+        )
+        for endpoint in endpoints:
+            if not endpoint.connect():
+                router._eject(endpoint, time.time())
+        return router
+
+    def set_assistant_wrapper(self, wrapper: Callable):
+        """Wrap current and future assistants (e.g. for cassette recording)"""
+        self.assistant_wrapper = wrapper
+        for endpoint in self.endpoints:
+            if endpoint.assistant is not None:
+                endpoint.assistant = wrapper(endpoint.assistant)
+
+    def _score(self, endpoint: RAGFlowEndpoint, prior: float) -> float:
+        if self.policy == 'ewma':
+            # Load scales the expected wait; an unmeasured endpoint is assumed to be average,
+            # so it is probed without being flooded while its first request is in flight
+            ttft = endpoint.ewma_ttft if endpoint.ewma_ttft is not None else prior
+            return ttft * (endpoint.outstanding + 1)
+        return endpoint.outstanding
+
+    def _prior_ttft(self) -> float:
+        measured = [e.ewma_ttft for e in self.endpoints if e.ewma_ttft is not None]
+        return sum(measured) / len(measured) if measured else self.default_ttft
+
+    def _start_reconnects(self, now: float):
+        """Reconnect endpoints whose cool-down expired without a live connection, off the request path"""
+        for endpoint in self.endpoints:
+            if endpoint.assistant is None and not endpoint.reconnecting and not endpoint.is_ejected(now):
+                endpoint.reconnecting = True
+                threading.Thread(target=self._reconnect, args=(endpoint,), name='ragflow-reconnect',
+                                 daemon=True).start()
+
+    def _reconnect(self, endpoint: RAGFlowEndpoint):
+        connected = endpoint.connect(self.assistant_wrapper)
+        with self._lock:
+            endpoint.reconnecting = False
+            if not connected:
+                self._eject(endpoint, time.time())
+
+    def acquire(self, exclude=()) -> Optional[RAGFlowEndpoint]:
+        """Pick an endpoint for a request and count it as outstanding"""
+        with self._lock:
+            now = time.time()
+            self._start_reconnects(now)
+            candidates = [e for e in self.endpoints if e.name not in exclude and e.assistant is not None]
+            healthy = [e for e in candidates if not e.is_ejected(now)]
+            # With every node ejected, retrying the one closest to recovery beats failing outright
+            pool = healthy or sorted(candidates, key=lambda e: e.ejected_until)[:1]
+            if not pool:
+                return None
+
+            prior = self._prior_ttft()
+            endpoint = min(pool, key=lambda e: (self._score(e, prior), e.outstanding, e.requests))
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+            return endpoint
+
+    def release(self, endpoint: RAGFlowEndpoint, ttft: Optional[float] = None, failed: bool = False,
+                error: Optional[str] = None):
+        """Record a request outcome; repeated failures eject the endpoint"""
+        now = time.time()
+        with self._lock:
+            endpoint.outstanding = max(0, endpoint.outstanding - 1)
+            if failed:
+                endpoint.failures += 1
+                endpoint.consecutive_failures += 1
+                endpoint.last_error = error
+                if endpoint.consecutive_failures >= self.failure_threshold:
+                    self._eject(endpoint, now)
+                return
+
+            endpoint.consecutive_failures = 0
+            endpoint.ejections = 0
+            if ttft is not None:
+                if endpoint.ewma_ttft is None:
+                    endpoint.ewma_ttft = ttft
+                else:
+                    endpoint.ewma_ttft = self.ewma_alpha * ttft + (1 - self.ewma_alpha) * endpoint.ewma_ttft
+
+    def _eject(self, endpoint: RAGFlowEndpoint, now: float):
+        endpoint.ejections += 1
+        cool_down = self.ejection_seconds * (2 ** min(endpoint.ejections - 1, 5))
+        endpoint.ejected_until = now + cool_down
+        endpoint.consecutive_failures = 0
+        print(f"🚫 Ejected RAGFlow endpoint {endpoint.name} for {cool_down:.0f}s")
+
+    def has_healthy_endpoint(self) -> bool:
+        now = time.time()
+        return any(e.assistant is not None and not e.is_ejected(now) for e in self.endpoints)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            return [endpoint.stats(now) for endpoint in self.endpoints]
@@ -4,36 +4,326 @@ Reranks evidence chunks by relevance using OpenAI GPT
 """
 
 import openai
+import math
 import os
-from typing import List, Dict, Any
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import List, Dict, Any, Optional, Tuple
 from dotenv import load_dotenv
 import json
 
+from cost_accounting import UsageMeter, estimate_tokens, get_ledger, token_cost
+from env_settings import env_float, env_int
+from profiler import propagate
+
 load_dotenv()
 
+# Shadow reranks run off the request path; shared so per-session rerankers don't each hold a thread
+_SHADOW_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix='shadow-rerank')
+_SHADOW_FUTURES = set()
+
+# Gate decisions and shadow agreement are process-wide: every Streamlit session builds its own
+# reranker, and per-instance counters would split the rates across sessions
+_GATE_STATS = {}
+_GATE_LOCK = threading.Lock()
+# Shadow reranks are extra OpenAI spend outside any request; capped per UTC day (0 disables them)
+SHADOW_BUDGET_USD = env_float('RERANK_SHADOW_BUDGET_USD', 1.0)
+
+
+def reset_gate_stats():
+    with _GATE_LOCK:
+        _GATE_STATS.clear()
+        _GATE_STATS.update({'total': 0, 'skip': 0, 'downgrade': 0, 'full': 0, 'shadow_samples': 0,
+                            'shadow_top1_agreements': 0, 'shadow_topk_overlap_sum': 0.0,
+                            'shadow_cost_usd': 0.0, 'shadow_budget_skips': 0,
+                            'shadow_day': None, 'shadow_day_cost_usd': 0.0, 'shadow_reserved_usd': 0.0})
+
+
+reset_gate_stats()
+
+
+def _reserve_shadow(estimated_cost: float, budget: float) -> bool:
+    """Reserve the expected cost of a shadow rerank against today's shadow budget"""
+    today = time.strftime('%Y-%m-%d', time.gmtime())
+    with _GATE_LOCK:
+        if _GATE_STATS['shadow_day'] != today:
+            _GATE_STATS['shadow_day'] = today
+            _GATE_STATS['shadow_day_cost_usd'] = 0.0
+        committed = _GATE_STATS['shadow_day_cost_usd'] + _GATE_STATS['shadow_reserved_usd']
+        if committed + estimated_cost > budget:
+            _GATE_STATS['shadow_budget_skips'] += 1
+            return False
+        _GATE_STATS['shadow_reserved_usd'] += estimated_cost
+        return True
+
+
+def _forget_shadow(future):
+    with _GATE_LOCK:
+        _SHADOW_FUTURES.discard(future)
+
+
+def wait_for_shadow_reranks(timeout: Optional[float] = None) -> bool:
+    """Block until the submitted shadow reranks finish (e.g. before a batch reports its spend)"""
+    with _GATE_LOCK:
+        pending = set(_SHADOW_FUTURES)
+    return not wait(pending, timeout=timeout).not_done
+
+
+def get_gate_stats() -> Dict[str, Any]:
+    """Process-wide skip rate, shadow agreement rate and shadow spend, for tuning the gate thresholds"""
+    with _GATE_LOCK:
+        stats = dict(_GATE_STATS)
+    total = stats['total']
+    samples = stats['shadow_samples']
+    return {
+        'total': total,
+        'skipped': stats['skip'],
+        'downgraded': stats['downgrade'],
+        'full': stats['full'],
+        'skip_rate': stats['skip'] / total if total else None,
+        'downgrade_rate': stats['downgrade'] / total if total else None,
+        'shadow_samples': samples,
+        'shadow_top1_agreement_rate': stats['shadow_top1_agreements'] / samples if samples else None,
+        'shadow_mean_topk_overlap': stats['shadow_topk_overlap_sum'] / samples if samples else None,
+        'shadow_cost_usd': round(stats['shadow_cost_usd'], 6),
+        'shadow_cost_today_usd': round(stats['shadow_day_cost_usd'], 6),
+        'shadow_budget_usd': SHADOW_BUDGET_USD,
+        'shadow_budget_skips': stats['shadow_budget_skips']
+    }
+
+# Tokens of the ranking prompt around the evidence, and per "Evidence N: ...\n" entry
+RANK_PROMPT_OVERHEAD_TOKENS = 130
+RANK_ENTRY_OVERHEAD_TOKENS = 5
+# Explanation prompt (~300 chars of evidence) plus up to 100 completion tokens
+EXPLANATION_ESTIMATED_COST = token_cost('openai', 150, 100)
+
 class EvidenceReranker:
-    def __init__(self):
+    def __init__(self, client=None):
         self.api_key = os.getenv('OPEN_AI_KEY')
-        if self.api_key:
+        if client is not None:
+            # Injected chat client (e.g. a cassette replay or test stub)
+            self.client = client
+        elif self.api_key:
             openai.api_key = self.api_key
             self.client = openai.OpenAI(api_key=self.api_key)
         else:
             self.client = None
+        
+        # Candidate sets larger than one window use tournament-style windowed reranking
+        self.window_size = env_int('RERANK_WINDOW_SIZE', 20)
+        self.window_overlap = env_int('RERANK_WINDOW_OVERLAP', 5)
+        self.max_workers = env_int('RERANK_MAX_WORKERS', 4)
+        
+        # Gating policy: skip or shrink LLM reranking when retrieval is already decisive
+        self.gating_enabled = os.getenv('RERANK_GATING', '1') == '1'
+        self.gate_min_chunks = env_int('RERANK_GATE_MIN_CHUNKS', 2)
+        self.gate_skip_margin = env_float('RERANK_GATE_SKIP_MARGIN', 0.15)
+        self.gate_max_entropy = env_float('RERANK_GATE_MAX_ENTROPY', 0.5)
+        self.gate_downgrade_margin = env_float('RERANK_GATE_DOWNGRADE_MARGIN', 0.05)
+        self.gate_temperature = env_float('RERANK_GATE_TEMPERATURE', 0.05)
+        self.shadow_rate = env_float('RERANK_SHADOW_RATE', 0.1)
+        self.shadow_budget = SHADOW_BUDGET_USD
+        # This reranker's share of the shadow spend, which is charged to no request or batch
+        self.shadow_cost_usd = 0.0
             
-    def rerank_evidence(self, query: str, evidence_chunks: List[Dict], max_chunks: int = 5) -> List[Dict]:
+    def rerank_evidence(self, query: str, evidence_chunks: List[Dict], max_chunks: int = 5,
+                        meter: Optional[UsageMeter] = None) -> List[Dict]:
         """
         Rerank evidence chunks using OpenAI for relevance to the compliance query
         """
+        if self.gating_enabled:
+            return self.rerank_evidence_gated(query, evidence_chunks, max_chunks, meter=meter)[0]
+        return self._llm_rerank(query, evidence_chunks, max_chunks, meter=meter)
+    
+    def rerank_evidence_gated(self, query: str, evidence_chunks: List[Dict], max_chunks: int = 5,
+                              meter: Optional[UsageMeter] = None) -> Tuple[List[Dict], Dict[str, Any]]:
+        """
+        Rerank behind the gating policy: skip the LLM when retrieval is already decisive,
+        rerank only the head when the benefit is moderate. Returns (evidence, gate decision);
+        each returned chunk also carries the decision under 'rerank_gate'. With a meter,
+        token usage is recorded and the decision is downgraded to stay within its cost ceiling.
+        """
+        if not self.client or not evidence_chunks:
+            gate = {'decision': 'skip', 'reason': 'no_client' if evidence_chunks else 'no_evidence',
+                    'chunk_count': len(evidence_chunks), 'margin': None, 'entropy': None}
+            return [dict(chunk, rerank_gate='skip') for chunk in evidence_chunks[:max_chunks]], gate
+        
+        gate = self.gate_reranking(evidence_chunks)
+        by_similarity = sorted(evidence_chunks, key=lambda c: c.get('similarity_score') or 0.0, reverse=True)
+        # Only the head of the retrieval list can plausibly change the top-k
+        head = by_similarity[:max(2 * max_chunks, 2)]
+        if meter is not None and gate['decision'] != 'skip':
+            gate = self._apply_cost_ceiling(query, gate, evidence_chunks, head, meter)
+        
+        if gate['decision'] == 'skip':
+            result = [chunk.copy() for chunk in by_similarity[:max_chunks]]
+        elif gate['decision'] == 'downgrade':
+            result = self._llm_rerank(query, head, max_chunks, meter=meter)
+        else:
+            result = self._llm_rerank(query, evidence_chunks, max_chunks, meter=meter)
+        
+        for chunk in result:
+            chunk['rerank_gate'] = gate['decision']
+        
+        with _GATE_LOCK:
+            _GATE_STATS['total'] += 1
+            _GATE_STATS[gate['decision']] += 1
+        
+        # Shadow-sample skipped/downgraded requests to measure how often gating changed the answer
+        if gate['decision'] != 'full' and gate['chunk_count'] > 1 and random.random() < self.shadow_rate:
+            estimated_cost = self.estimate_rerank_cost(query, evidence_chunks)
+            if meter is not None and not meter.allows(estimated_cost):
+                meter.record_downgrade('shadow_rerank', 'skipped')
+            elif _reserve_shadow(estimated_cost, self.shadow_budget):
+                future = _SHADOW_EXECUTOR.submit(self._shadow_rerank, query, evidence_chunks, max_chunks, result,
+                                                 estimated_cost)
+                with _GATE_LOCK:
+                    _SHADOW_FUTURES.add(future)
+                future.add_done_callback(_forget_shadow)
+        
+        print(f"🚦 Rerank gate: {gate['decision']} ({gate['reason']})")
+        return result, gate
+    
+    def gate_reranking(self, evidence_chunks: List[Dict]) -> Dict[str, Any]:
+        """
+        Estimate whether LLM reranking can change the outcome from the retrieval scores:
+        chunk count, top-1 vs top-2 similarity margin and normalized entropy of the
+        softmaxed similarity distribution (0 = one clear winner, 1 = all tied).
+        """
+        scores = sorted((float(c.get('similarity_score') or 0.0) for c in evidence_chunks), reverse=True)
+        count = len(scores)
+        margin = scores[0] - scores[1] if count > 1 else 1.0
+        
+        if count > 1:
+            weights = [math.exp((score - scores[0]) / self.gate_temperature) for score in scores]
+            total = sum(weights)
+            entropy = -sum((w / total) * math.log(w / total) for w in weights if w > 0) / math.log(count)
+        else:
+            entropy = 0.0
+        
+        if count <= self.gate_min_chunks:
+            decision, reason = 'skip', 'too_few_chunks'
+        elif margin >= self.gate_skip_margin and entropy <= self.gate_max_entropy:
+            decision, reason = 'skip', 'decisive_retrieval'
+        elif margin >= self.gate_downgrade_margin:
+            decision, reason = 'downgrade', 'moderate_margin'
+        else:
+            decision, reason = 'full', 'ambiguous_retrieval'
+        
+        return {
+            'decision': decision,
+            'reason': reason,
+            'chunk_count': count,
+            'margin': round(margin, 4),
+            'entropy': round(entropy, 4)
+        }
+    
+    def _apply_cost_ceiling(self, query: str, gate: Dict[str, Any], evidence_chunks: List[Dict],
+                            head: List[Dict], meter: UsageMeter) -> Dict[str, Any]:
+        """Downgrade full -> head-only -> skip until the expected rerank cost fits the remaining budget"""
+        if gate['decision'] == 'full' and meter.allows(self.estimate_rerank_cost(query, evidence_chunks)):
+            return gate
+        if meter.allows(self.estimate_rerank_cost(query, head)):
+            if gate['decision'] == 'downgrade':
+                return gate
+            decision = 'downgrade'
+        else:
+            decision = 'skip'
+        meter.record_downgrade('rerank', f"{gate['decision']}->{decision}")
+        return dict(gate, decision=decision, reason='cost_ceiling')
+    
+    def estimate_rerank_cost(self, query: str, evidence_chunks: List[Dict]) -> float:
+        """Expected OpenAI cost of an LLM rerank of these chunks (one prompt, or the windowed tournament)"""
+        count = len(evidence_chunks)
+        if count == 0:
+            return 0.0
+        chunk_tokens = sum(estimate_tokens(chunk.get('content', '')[:500]) + RANK_ENTRY_OVERHEAD_TOKENS
+                           for chunk in evidence_chunks)
+        calls = 1
+        if count > self.window_size:
+            # Overlapping windows rank each chunk ~window/stride times; later rounds add about one window
+            stride = max(1, self.window_size - self.window_overlap)
+            calls = math.ceil(count / stride) + 1
+            chunk_tokens = chunk_tokens * self.window_size / stride + chunk_tokens / count * self.window_size
+        prompt_tokens = calls * (RANK_PROMPT_OVERHEAD_TOKENS + estimate_tokens(query)) + int(chunk_tokens)
+        completion_tokens = 4 * min(count, self.window_size) * calls
+        return token_cost('openai', prompt_tokens, completion_tokens)
+    
+    def _shadow_rerank(self, query: str, evidence_chunks: List[Dict], max_chunks: int, gated_result: List[Dict],
+                       estimated_cost: float):
+        """Run the full rerank in the background and record whether the gated result agreed"""
+        # Not part of any request or batch cost; capped by the shadow budget and booked under its own ledger mode
+        meter = UsageMeter()
+        try:
+            full_result = self._llm_rerank(query, evidence_chunks, max_chunks, meter=meter)
+        except Exception as e:
+            print(f"Shadow rerank failed: {e}")
+            full_result = None
+        usage = meter.summary()
+        with _GATE_LOCK:
+            _GATE_STATS['shadow_reserved_usd'] = max(0.0, _GATE_STATS['shadow_reserved_usd'] - estimated_cost)
+            _GATE_STATS['shadow_cost_usd'] += usage['cost_usd']
+            _GATE_STATS['shadow_day_cost_usd'] += usage['cost_usd']
+            self.shadow_cost_usd += usage['cost_usd']
+        if full_result is None:
+            return
+        get_ledger().record(usage, 'shadow_rerank')
+        
+        gated_ids = [c.get('chunk_id') for c in gated_result]
+        full_ids = [c.get('chunk_id') for c in full_result]
+        top1_agrees = bool(gated_ids) and bool(full_ids) and gated_ids[0] == full_ids[0]
+        union = set(gated_ids) | set(full_ids)
+        overlap = len(set(gated_ids) & set(full_ids)) / len(union) if union else 1.0
+        
+        with _GATE_LOCK:
+            _GATE_STATS['shadow_samples'] += 1
+            _GATE_STATS['shadow_top1_agreements'] += int(top1_agrees)
+            _GATE_STATS['shadow_topk_overlap_sum'] += overlap
+    
+    def get_gate_stats(self) -> Dict[str, Any]:
+        """Process-wide gate stats (shared by every reranker in this process)"""
+        return get_gate_stats()
+    
+    def _llm_rerank(self, query: str, evidence_chunks: List[Dict], max_chunks: int = 5,
+                    meter: Optional[UsageMeter] = None) -> List[Dict]:
+        """LLM listwise reranking of all given chunks (windowed for large sets)"""
         if not self.client or not evidence_chunks:
             return evidence_chunks[:max_chunks]
             
         try:
-            # Prepare evidence for ranking
-            evidence_text = []
-            for i, chunk in enumerate(evidence_chunks):
-                evidence_text.append(f"Evidence {i+1}: {chunk.get('content', '')[:500]}...")
+            # Large candidate sets are ranked in overlapping windows to keep each prompt small
+            if len(evidence_chunks) > self.window_size:
+                order = self._rerank_windowed(query, evidence_chunks, max_chunks, meter=meter)
+            else:
+                order = self._rank_window(query, evidence_chunks, meter=meter)
+            
+            # Reorder evidence based on ranking
+            reranked_evidence = []
+            for position, index in enumerate(order[:max_chunks]):
+                chunk = evidence_chunks[index].copy()
+                chunk['ai_relevance_score'] = len(evidence_chunks) - position
+                reranked_evidence.append(chunk)
             
-            ranking_prompt = f"""You are an expert compliance analyst. Rank the following evidence chunks by their relevance to this TikTok feature compliance query: "{query}"
+            return reranked_evidence
+                
+        except Exception as e:
+            print(f"Reranking failed: {e}")
+            return evidence_chunks[:max_chunks]
+    
+    def _rank_window(self, query: str, evidence_chunks: List[Dict], meter: Optional[UsageMeter] = None) -> List[int]:
+        """
+        Ask the LLM for a listwise ranking of one window of chunks.
+        Returns a full permutation of 0-based indices into evidence_chunks.
+        """
+        # Prepare evidence for ranking
+        evidence_text = []
+        for i, chunk in enumerate(evidence_chunks):
+            evidence_text.append(f"Evidence {i+1}: {chunk.get('content', '')[:500]}...")
+        
+        ranking_prompt = f"""You are an expert compliance analyst. Rank the following evidence chunks by their relevance to this TikTok feature compliance query: "{query}"
 
 Consider:
 1. Direct regulatory applicability
@@ -48,45 +338,126 @@ Respond with only a JSON array of numbers representing the ranking order (most r
 For example: [3, 1, 5, 2, 4] means Evidence 3 is most relevant, then Evidence 1, etc.
 """
 
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "user", "content": ranking_prompt}
-                ],
-                temperature=0.1,
-                max_tokens=100
-            )
-            
-            ranking_text = response.choices[0].message.content.strip()
-            
-            # Parse the ranking
-            try:
-                ranking = json.loads(ranking_text)
-                
-                # Reorder evidence based on ranking
-                reranked_evidence = []
-                for rank in ranking[:max_chunks]:
-                    if 1 <= rank <= len(evidence_chunks):
-                        chunk = evidence_chunks[rank - 1].copy()
-                        chunk['ai_relevance_score'] = len(ranking) - ranking.index(rank)
-                        reranked_evidence.append(chunk)
+        response = self.client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=[
+                {"role": "user", "content": ranking_prompt}
+            ],
+            temperature=0.1,
+            # ~4 tokens per "12, " entry; the original 100 truncates beyond ~25 chunks
+            max_tokens=max(100, 4 * len(evidence_chunks))
+        )
+        if meter is not None:
+            meter.record_response('rerank', response, ranking_prompt)
+        
+        ranking_text = response.choices[0].message.content.strip()
+        return self._parse_ranking(ranking_text, len(evidence_chunks))
+    
+    def _parse_ranking(self, ranking_text: str, count: int) -> List[int]:
+        """
+        Validate a 1-based ranking from the LLM and turn it into a 0-based permutation.
+        Malformed output (code fences, prose, truncated arrays, duplicates, out of range
+        numbers) is recovered as far as possible; unranked chunks keep their original order.
+        """
+        try:
+            ranking = json.loads(ranking_text)
+            if not isinstance(ranking, list):
+                raise ValueError("ranking is not a list")
+        except (json.JSONDecodeError, ValueError):
+            ranking = []
+        
+        order, seen = self._valid_ranks(ranking, count)
+        if not order:
+            # JSON that yields nothing usable (an object, words) may still contain the ranks
+            order, seen = self._valid_ranks(re.findall(r'\d+', ranking_text), count)
+        
+        if not order:
+            print("Failed to parse ranking, using original order")
+        elif len(order) < count:
+            print(f"Recovered partial ranking ({len(order)}/{count} chunks)")
+        
+        order.extend(i for i in range(count) if i + 1 not in seen)
+        return order
+    
+    @staticmethod
+    def _valid_ranks(ranking: List[Any], count: int) -> Tuple[List[int], set]:
+        """0-based order of the in-range, first-seen ranks; digit strings such as "3" count as 3"""
+        order = []
+        seen = set()
+        for rank in ranking:
+            if isinstance(rank, str) and rank.strip().isdigit():
+                rank = int(rank)
+            if isinstance(rank, int) and not isinstance(rank, bool) and 1 <= rank <= count and rank not in seen:
+                seen.add(rank)
+                order.append(rank - 1)
+        return order, seen
+    
+    def _rerank_windowed(self, query: str, evidence_chunks: List[Dict], top_k: int,
+                         meter: Optional[UsageMeter] = None) -> List[int]:
+        """
+        Tournament-style listwise reranking for large candidate sets: rank overlapping
+        windows in parallel, advance each window's best chunks, and repeat until the
+        survivors fit in one final window. Returns a permutation of 0-based indices.
+        """
+        window_size = self.window_size
+        stride = max(1, window_size - self.window_overlap)
+        # Advancing fewer chunks than the stride guarantees every round shrinks the pool
+        advance = max(1, min(top_k, stride - 1, window_size // 2))
+        candidates = list(range(len(evidence_chunks)))
+        round_number = 0
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while len(candidates) > window_size:
+                round_number += 1
+                windows = []
+                for start in range(0, len(candidates), stride):
+                    windows.append(candidates[start:start + window_size])
+                    if start + window_size >= len(candidates):
+                        break
+                print(f"🏆 Rerank round {round_number}: {len(candidates)} chunks in {len(windows)} windows")
                 
-                return reranked_evidence
+                futures = [
+                    executor.submit(propagate(self._rank_window), query, [evidence_chunks[i] for i in window], meter)
+                    for window in windows
+                ]
                 
-            except (json.JSONDecodeError, IndexError):
-                print("Failed to parse ranking, using original order")
-                return evidence_chunks[:max_chunks]
+                # Best local position per chunk; overlapping chunks keep their better result
+                best_position = {}
+                for window, future in zip(windows, futures):
+                    try:
+                        local_order = future.result()
+                    except Exception as e:
+                        print(f"Window ranking failed, keeping window order: {e}")
+                        local_order = list(range(len(window)))
+                    for position, local_index in enumerate(local_order[:advance]):
+                        index = window[local_index]
+                        best_position[index] = min(position, best_position.get(index, position))
                 
-        except Exception as e:
-            print(f"Reranking failed: {e}")
-            return evidence_chunks[:max_chunks]
+                prior = {index: i for i, index in enumerate(candidates)}
+                survivors = sorted(best_position, key=lambda index: (best_position[index], prior[index]))
+                if len(survivors) >= len(candidates):
+                    survivors = survivors[:window_size]
+                candidates = survivors
+        
+        final_order = self._rank_window(query, [evidence_chunks[i] for i in candidates], meter=meter)
+        ranked = [candidates[i] for i in final_order]
+        
+        # Chunks eliminated in earlier rounds follow in their original order
+        finalists = set(ranked)
+        ranked.extend(i for i in range(len(evidence_chunks)) if i not in finalists)
+        return ranked
     
-    def get_relevance_explanation(self, query: str, evidence_chunk: Dict) -> str:
+    def get_relevance_explanation(self, query: str, evidence_chunk: Dict, meter: Optional[UsageMeter] = None) -> str:
         """
         Get an AI explanation of why this evidence is relevant
         """
         if not self.client:
             return "Relevance assessment not available"
+        
+        # Explanations are optional; past the cost ceiling fall back to the source name
+        if meter is not None and not meter.allows(EXPLANATION_ESTIMATED_COST):
+            meter.record_downgrade('explanation', 'skipped')
+            return f"Related to {evidence_chunk.get('source', 'compliance requirements')}"
             
         try:
             explanation_prompt = f"""Explain in 1-2 sentences why this evidence is relevant to the TikTok compliance query: "{query}"
@@ -103,6 +474,8 @@ Be specific about which regulations or compliance requirements it addresses."""
                 temperature=0.3,
                 max_tokens=100
             )
+            if meter is not None:
+                meter.record_response('explanation', response, explanation_prompt)
             
             return response.choices[0].message.content.strip()
             
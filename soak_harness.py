@@ -0,0 +1,247 @@
+"""
+Headless multi-session soak test for the Streamlit app
+
+Keeps many simulated browser sessions of fixed_tiktok_app.py alive at once
+through Streamlit's AppTest, each with its own stubbed RAGFlowClient /
+EvidenceReranker in session state, and submits queries to them in a loop.
+Process RSS, per-session state size, rerun latency and live object counts are
+sampled after every round. Exits non-zero when growth past the warmup rounds
+exceeds the configured bounds.
+
+AppTest swaps a process-wide Streamlit runtime in and out around each run, so
+reruns are interleaved round-robin across sessions rather than executed in
+parallel threads; all sessions' state stays resident concurrently, which is
+what the memory measurements need.
+
+Usage:
+    python soak_harness.py --sessions 20 --rounds 50 --max-rss-growth-mb 50
+"""
+
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Dict, List, Any, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+from streamlit.testing.v1 import AppTest
+
+from cassette import Cassette, create_clients
+from stub_backends import create_stub_clients
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixed_tiktok_app.py')
+
+SOAK_QUERIES = [
+    "Feature reads user location to enforce France's copyright rules (download blocking)",
+    "Age gates specific to Indonesia's Child Protection Law",
+    "Geofences feature rollout in US for market testing",
+    "Video filter feature available globally except KR",
+    "Live streaming with age verification for users under 16 in Indonesia",
+]
+
+TRACKED_TYPES = ('RAGFlowClient', 'EvidenceReranker', 'AppTest', 'StubSession', 'ReplaySession')
+
+
+def process_rss_mb() -> Optional[float]:
+    """Current resident set size; falls back to psutil, then peak RSS, where /proc is unavailable.
+    None when the platform offers none of them (RSS sampling is skipped)"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS, kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def deep_sizeof(obj, seen=None) -> int:
+    """Approximate retained size of an object graph (containers and instance dicts)"""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj, 0)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    elif hasattr(obj, '__dict__') and not isinstance(obj, type):
+        size += deep_sizeof(vars(obj), seen)
+    return size
+
+
+def count_tracked_objects() -> Dict[str, int]:
+    counts = {name: 0 for name in TRACKED_TYPES}
+    total = 0
+    for obj in gc.get_objects():
+        total += 1
+        name = type(obj).__name__
+        if name in counts:
+            counts[name] += 1
+    counts['total'] = total
+    return counts
+
+
+class SoakSession:
+    """One simulated browser session of the app"""
+
+    def __init__(self, index: int, cassette=None, token_delay: float = 0.0, timeout: float = 60):
+        self.index = index
+        self.app = AppTest.from_file(APP_PATH, default_timeout=timeout)
+        if cassette is not None:
+            ragflow_client, reranker = create_clients(cassette)
+        else:
+            ragflow_client, reranker = create_stub_clients(token_delay=token_delay)
+        # Pre-seeding session state keeps the app from building live clients
+        self.app.session_state['ragflow_client'] = ragflow_client
+        self.app.session_state['reranker'] = reranker
+        self.app.run()
+        self.latencies: List[float] = []
+        self.errors = 0
+
+    def submit(self, query: str, verbose: bool = False) -> float:
+        # The pipeline logs every streamed message; keep soak output readable
+        output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+        start_time = time.perf_counter()
+        with output:
+            self.app.text_input[0].input(query)
+            self.app.button[0].click()
+            self.app.run()
+        elapsed = time.perf_counter() - start_time
+
+        if self.app.exception or not self.app.session_state['search_results']:
+            self.errors += 1
+        self.latencies.append(elapsed)
+        return elapsed
+
+    def state_size(self) -> int:
+        return sum(deep_sizeof(value) for value in self.app.session_state.values())
+
+
+def run_soak(sessions: int = 10, rounds: int = 20, warmup_rounds: int = 3, cassette=None,
+             token_delay: float = 0.0, verbose: bool = False) -> Dict[str, Any]:
+    print(f"🧪 Starting soak: {sessions} sessions x {rounds} rounds")
+    soak_sessions = [SoakSession(i, cassette=cassette, token_delay=token_delay) for i in range(sessions)]
+    samples = []
+
+    for round_index in range(rounds):
+        latencies = [
+            s.submit(SOAK_QUERIES[(round_index + s.index) % len(SOAK_QUERIES)], verbose=verbose)
+            for s in soak_sessions
+        ]
+
+        gc.collect()
+        rss_mb = process_rss_mb()
+        state_sizes = [s.state_size() for s in soak_sessions]
+        sample = {
+            'round': round_index + 1,
+            'rss_mb': round(rss_mb, 2) if rss_mb is not None else None,
+            'mean_session_state_kb': round(statistics.mean(state_sizes) / 1024, 2),
+            'max_session_state_kb': round(max(state_sizes) / 1024, 2),
+            'p50_rerun_seconds': round(statistics.median(latencies), 4),
+            'max_rerun_seconds': round(max(latencies), 4),
+            'objects': count_tracked_objects()
+        }
+        samples.append(sample)
+        rss = f"{sample['rss_mb']} MB" if sample['rss_mb'] is not None else 'n/a'
+        print(f"📈 Round {sample['round']}: RSS {rss}, "
+              f"session state {sample['mean_session_state_kb']} KB, "
+              f"p50 rerun {sample['p50_rerun_seconds']}s, objects {sample['objects']['total']}")
+
+    baseline = samples[min(warmup_rounds, len(samples)) - 1] if warmup_rounds else samples[0]
+    final = samples[-1]
+    rss_growth = None
+    if final['rss_mb'] is not None and baseline['rss_mb'] is not None:
+        rss_growth = round(final['rss_mb'] - baseline['rss_mb'], 2)
+    return {
+        'sessions': sessions,
+        'rounds': rounds,
+        'warmup_rounds': warmup_rounds,
+        'errors': sum(s.errors for s in soak_sessions),
+        'rss_growth_mb': rss_growth,
+        'session_state_growth_kb': round(final['max_session_state_kb'] - baseline['max_session_state_kb'], 2),
+        'object_growth': final['objects']['total'] - baseline['objects']['total'],
+        'rerun_latency_drift_seconds': round(final['p50_rerun_seconds'] - baseline['p50_rerun_seconds'], 4),
+        'samples': samples
+    }
+
+
+def check_bounds(report: Dict[str, Any], max_rss_growth_mb: float, max_session_growth_kb: float,
+                 max_object_growth: int, max_latency_drift_seconds: float) -> List[str]:
+    failures = []
+    if report['errors']:
+        failures.append(f"{report['errors']} reruns failed")
+    if report['rss_growth_mb'] is None:
+        print("⚠️ RSS could not be sampled on this platform; skipping the RSS bound")
+    elif report['rss_growth_mb'] > max_rss_growth_mb:
+        failures.append(f"RSS grew {report['rss_growth_mb']} MB (limit {max_rss_growth_mb} MB)")
+    if report['session_state_growth_kb'] > max_session_growth_kb:
+        failures.append(f"Session state grew {report['session_state_growth_kb']} KB (limit {max_session_growth_kb} KB)")
+    if report['object_growth'] > max_object_growth:
+        failures.append(f"Live objects grew by {report['object_growth']} (limit {max_object_growth})")
+    if report['rerun_latency_drift_seconds'] > max_latency_drift_seconds:
+        failures.append(f"p50 rerun latency drifted {report['rerun_latency_drift_seconds']}s "
+                        f"(limit {max_latency_drift_seconds}s)")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, default=10)
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--warmup-rounds', type=int, default=3)
+    parser.add_argument('--token-delay', type=float, default=0.0, help='Stub delay per streamed message')
+    parser.add_argument('--cassette', help='Replay a recorded cassette instead of the keyword stubs')
+    parser.add_argument('--max-rss-growth-mb', type=float, default=50.0)
+    parser.add_argument('--max-session-growth-kb', type=float, default=64.0)
+    parser.add_argument('--max-object-growth', type=int, default=50000)
+    parser.add_argument('--max-latency-drift-seconds', type=float, default=1.0)
+    parser.add_argument('--report', help='Write the full JSON report (with samples) to this path')
+    parser.add_argument('--verbose', action='store_true', help='Show the pipeline log of every rerun')
+    args = parser.parse_args()
+
+    cassette = Cassette(args.cassette, mode='replay', timing='none') if args.cassette else None
+    report = run_soak(args.sessions, args.rounds, args.warmup_rounds, cassette=cassette,
+                      token_delay=args.token_delay, verbose=args.verbose)
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    summary = {key: value for key, value in report.items() if key != 'samples'}
+    print(json.dumps(summary, indent=2))
+
+    failures = check_bounds(report, args.max_rss_growth_mb, args.max_session_growth_kb, args.max_object_growth,
+                            args.max_latency_drift_seconds)
+    if failures:
+        for failure in failures:
+            print(f"❌ {failure}")
+        sys.exit(1)
+    print("✅ Soak passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Local stand-ins for the RAGFlow assistant and OpenAI client
+
+The stubs answer deterministically from keywords in the feature description, so
+soak tests, load tests and offline evaluation can exercise the real pipeline
+(streaming, parsing, reranking) without any network access.
+"""
+
+import json
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+from typing import List, Optional
+
+from ragflow_client import RAGFlowClient
+from reranking_utils import EvidenceReranker
+
+LEGAL_KEYWORDS = ('law', 'act', 'regulation', 'gdpr', 'dsa', 'ncmec', 'compliance', 'copyright', 'minor', 'child')
+BUSINESS_KEYWORDS = ('market testing', 'a/b', 'experiment', 'rollout', 'business')
+
+STUB_DOCUMENTS = [
+    'EU Digital Services Act (DSA)',
+    'California - Protecting Our Kids from Social Media Addiction Act',
+    'Florida - Online Protections for Minors',
+    'Utah - Utah Social Media Regulation Act',
+    'US - Reporting requirements for child sexual abuse content to NCMEC',
+]
+
+
+def stub_answer(prompt: str) -> str:
+    """Structured compliance answer derived from keywords in the prompt's feature text"""
+    # Judge only the feature, not the instructions and examples around it
+    match = re.search(r'(?:compliance needs|Feature): (.*?)(?:\n|$)', prompt)
+    feature = (match.group(1) if match else prompt).lower()
+
+    if any(re.search(rf'\b{re.escape(keyword)}(s|ren)?\b', feature) for keyword in LEGAL_KEYWORDS):
+        classification, confidence = 'YES', 9
+        regulations = 'Utah Social Media Regulation Act; EU Digital Services Act'
+        reasoning = 'The feature implements a legal obligation that applies in specific jurisdictions.'
+    elif any(keyword in feature for keyword in BUSINESS_KEYWORDS):
+        classification, confidence = 'NO', 8
+        regulations = 'None identified'
+        reasoning = 'The geographic restriction is a business decision, not a legal requirement.'
+    else:
+        classification, confidence = 'UNCERTAIN', 5
+        regulations = 'None identified'
+        reasoning = 'A geographic restriction is described without a stated legal reason.'
+
+    return (f"CLASSIFICATION: {classification}\n"
+            f"CONFIDENCE: {confidence}\n"
+            f"REASONING: {reasoning}\n"
+            f"REGULATIONS: {regulations}\n"
+            f"EVIDENCE: See referenced chunks.")
+
+
+class StubSession:
+    def __init__(self, session_id: str, assistant: 'StubAssistant'):
+        self.id = session_id
+        self._assistant = assistant
+
+    def ask(self, question: str = "", stream: bool = False, **kwargs):
+        answer = stub_answer(question)
+        rng = random.Random(question)
+        references = [
+            {
+                'content': f"{STUB_DOCUMENTS[i % len(STUB_DOCUMENTS)]} section {i + 1}: obligations for online platforms. " * 4,
+                'document_name': STUB_DOCUMENTS[i % len(STUB_DOCUMENTS)],
+                'id': f"chunk-{i:04d}",
+                'similarity': round(rng.uniform(0.3, 0.9), 3)
+            }
+            for i in range(self._assistant.reference_count)
+        ]
+
+        chunks = self._assistant.stream_chunks
+        for i in range(1, chunks + 1):
+            if self._assistant.token_delay:
+                time.sleep(self._assistant.token_delay)
+            # RAGFlow streams cumulative content; references arrive on the final message
+            yield SimpleNamespace(
+                content=answer[:len(answer) * i // chunks],
+                reference=references if i == chunks else None,
+                role='assistant'
+            )
+
+
+class StubAssistant:
+    """Stands in for a RAGFlow chat assistant"""
+
+    def __init__(self, token_delay: float = 0.0, stream_chunks: int = 8, reference_count: int = 8):
+        self.name = 'stub-assistant'
+        self.token_delay = token_delay
+        self.stream_chunks = stream_chunks
+        self.reference_count = reference_count
+        self._session_count = 0
+        self._lock = threading.Lock()
+
+    def create_session(self, **kwargs):
+        with self._lock:
+            self._session_count += 1
+            session_id = f"stub-{self._session_count}"
+        return StubSession(session_id, self)
+
+
+class _StubCompletions:
+    def __init__(self, latency: float):
+        self._latency = latency
+
+    def create(self, model: str = '', messages: Optional[List] = None, **kwargs):
+        if self._latency:
+            time.sleep(self._latency)
+        prompt = messages[-1]['content'] if messages else ''
+        count = len(re.findall(r'^Evidence \d+:', prompt, flags=re.MULTILINE))
+        if count:
+            # Deterministic shuffle so reranking visibly reorders
+            ranking = list(range(1, count + 1))
+            random.Random(prompt).shuffle(ranking)
+            content = json.dumps(ranking)
+        else:
+            content = 'This evidence describes platform obligations that apply to the feature.'
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(role='assistant', content=content))],
+            usage=SimpleNamespace(
+                prompt_tokens=len(prompt) // 4,
+                completion_tokens=len(content) // 4,
+                total_tokens=len(prompt) // 4 + len(content) // 4
+            )
+        )
+
+
+class StubChatClient:
+    """Stands in for openai.OpenAI; only chat.completions.create is implemented"""
+
+    def __init__(self, latency: float = 0.0):
+        self.chat = SimpleNamespace(completions=_StubCompletions(latency))
+
+
+def create_stub_clients(token_delay: float = 0.0, chat_latency: float = 0.0,
+                        reference_count: int = 8):
+    """Pipeline clients wired to the local stubs"""
+    return (RAGFlowClient(assistant=StubAssistant(token_delay=token_delay, reference_count=reference_count)),
+            EvidenceReranker(client=StubChatClient(latency=chat_latency)))
@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+from api_server import ComplianceAPI, MAX_CHUNKS_LIMIT
+from stub_backends import create_stub_clients
+
+
+def request(method, path, **kwargs):
+    """Run one request against a fresh API wired to the stubs; returns (status, json body)"""
+    async def run():
+        api = ComplianceAPI(*create_stub_clients(), max_concurrency=2)
+        async with TestClient(TestServer(api.build_app())) as client:
+            response = await client.request(method, path, **kwargs)
+            return response.status, await response.json()
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize('body', [
+    {'feature': 123},
+    {'feature': '   '},
+    {},
+    {'feature': 'x', 'max_chunks': 'abc'},
+    {'feature': 'x', 'max_chunks': 0},
+    {'feature': 'x', 'max_chunks': -3},
+    {'feature': 'x', 'max_chunks': MAX_CHUNKS_LIMIT + 1},
+    {'feature': 'x', 'max_chunks': True},
+    {'feature': 'x', 'rerank': 'yes'},
+    ['feature'],
+])
+def test_analyze_rejects_invalid_bodies(body):
+    status, payload = request('POST', '/analyze', json=body)
+    assert status == 400
+    assert 'error' in payload
+
+
+def test_invalid_json_is_rejected():
+    status, payload = request('POST', '/analyze', data='{not json', headers={'Content-Type': 'application/json'})
+    assert status == 400 and payload == {'error': 'Body must be JSON'}
+
+
+@pytest.mark.parametrize('evidence', [
+    'chunks', [1, 2], [{'content': 5}],
+    [{'content': 'c', 'similarity_score': 'high'}],
+    [{'content': 'c', 'similarity_score': True}],
+])
+def test_rerank_rejects_invalid_evidence(evidence):
+    status, _ = request('POST', '/rerank', json={'query': 'q', 'evidence': evidence})
+    assert status == 400
+
+
+def test_analyze_returns_audit_record():
+    status, payload = request('POST', '/analyze', json={'feature': '  Curfew for Utah minors ', 'max_chunks': 3})
+    assert status == 200
+    assert payload['feature'] == 'Curfew for Utah minors'
+    assert payload['audit_record']['classification'] == 'YES'
+    assert len(payload['evidence']) == 3
+
+
+def test_rerank_accepts_valid_evidence():
+    evidence = [{'content': f"chunk {i}", 'similarity_score': 0.5 + i / 100, 'chunk_id': str(i)} for i in range(6)]
+    status, payload = request('POST', '/rerank', json={'query': 'q', 'evidence': evidence, 'max_chunks': 2})
+    assert status == 200
+    assert len(payload['evidence']) == 2
+
+
+def test_rerank_gate_reads_similarity_scores():
+    evidence = [{'content': f"chunk {i}", 'similarity_score': 0.9 if i == 0 else 0.3, 'chunk_id': str(i)}
+                for i in range(6)]
+    status, payload = request('POST', '/rerank', json={'query': 'q', 'evidence': evidence, 'max_chunks': 2})
+    assert status == 200
+    assert payload['rerank_gate']['reason'] == 'decisive_retrieval'
+    assert payload['evidence'][0]['chunk_id'] == '0'
+
+
+def test_decisions_counts_recorded_analyses(tmp_path, monkeypatch):
+    monkeypatch.setenv('DECISION_STORE_PATH', str(tmp_path / 'decisions'))
+
+    async def run():
+        api = ComplianceAPI(*create_stub_clients(), max_concurrency=2)
+        async with TestClient(TestServer(api.build_app())) as client:
+            await client.post('/analyze', json={'feature': 'Curfew for Utah minors'})
+            response = await client.get('/decisions', params={'group_by': 'classification'})
+            return response.status, await response.json()
+
+    status, payload = asyncio.run(run())
+    assert status == 200
+    assert payload == {'records': 1, 'result': {'YES': 1}}
+    assert request('GET', '/decisions?metric=median')[0] == 400
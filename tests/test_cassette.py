@@ -0,0 +1,47 @@
+from types import SimpleNamespace
+
+import pytest
+
+from cassette import (Cassette, CassetteMiss, RecordingSession, ReplaySession, FLUSH_EVERY, request_hash)
+
+
+class FakeSession:
+    id = 'live-1'
+
+    def ask(self, question, stream=False, **kwargs):
+        for content in ('YES', 'YES because', 'YES because Utah'):
+            yield SimpleNamespace(content=content, reference=[{'content': 'c', 'document_name': 'd',
+                                                               'id': '1', 'similarity': 0.9}])
+
+
+def test_complete_stream_replays_identically(tmp_path):
+    path = str(tmp_path / 'c.json.gz')
+    cassette = Cassette(path, mode='record', timing='none')
+    live = [m.content for m in RecordingSession(FakeSession(), cassette).ask('q', stream=True)]
+    cassette.close()
+
+    replay = Cassette(path, mode='replay', timing='none')
+    messages = list(ReplaySession('r', replay).ask('q', stream=True))
+    assert [m.content for m in messages] == live
+    assert messages[-1].reference[0]['document_name'] == 'd'
+
+
+def test_stream_closed_early_is_not_recorded(tmp_path):
+    cassette = Cassette(str(tmp_path / 'c.json.gz'), mode='record', timing='none')
+    stream = RecordingSession(FakeSession(), cassette).ask('q', stream=True)
+    next(stream)
+    stream.close()
+    assert cassette.size() == 0
+    with pytest.raises(CassetteMiss):
+        cassette.lookup(request_hash('ragflow.ask', 'q'))
+
+
+def test_flushes_append_and_reload(tmp_path):
+    path = str(tmp_path / 'c.json.gz')
+    cassette = Cassette(path, mode='record', timing='none')
+    for i in range(FLUSH_EVERY + 3):
+        cassette.record(f"k{i}", {'kind': 'openai.chat', 'content': str(i), 'usage': None, 'latency': 0})
+    # The first FLUSH_EVERY interactions are on disk before close()
+    assert Cassette(path, mode='replay').size() == FLUSH_EVERY
+    cassette.close()
+    assert Cassette(path, mode='replay').size() == FLUSH_EVERY + 3
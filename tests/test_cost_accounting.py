@@ -0,0 +1,82 @@
+import json
+
+import pytest
+
+from cost_accounting import BatchBudget, CostLedger, UsageMeter, token_cost
+from stub_backends import create_stub_clients
+
+
+def chunks(*scores):
+    return [{'content': f"chunk {i} " * 20, 'similarity_score': score, 'chunk_id': str(i)}
+            for i, score in enumerate(scores)]
+
+
+def test_meter_charges_batch_and_enforces_both_ceilings():
+    batch = BatchBudget(ceiling=0.001)
+    meter = UsageMeter(ceiling=0.0005, batch=batch)
+    cost = meter.record('rerank', 'openai', 1000, 100)
+    assert cost == pytest.approx(token_cost('openai', 1000, 100))
+    assert batch.spent == pytest.approx(cost)
+    assert meter.remaining() == pytest.approx(0.0005 - cost)
+    assert meter.allows(0.0005 - cost) and not meter.allows(0.0005)
+
+    # The batch ceiling binds once other requests have spent most of it
+    batch.charge(0.0009)
+    assert meter.remaining() == pytest.approx(0.001 - 0.0009 - cost)
+
+
+def test_invalid_ceilings_are_ignored(monkeypatch):
+    monkeypatch.setenv('COST_CEILING_PER_REQUEST_USD', '$0.05')
+    monkeypatch.setenv('COST_CEILING_PER_BATCH_USD', '2.5')
+    batch = BatchBudget()
+    meter = UsageMeter(batch=batch)
+    assert (meter.ceiling, batch.ceiling) == (None, 2.5)
+
+
+def test_rerank_downgrades_under_the_ceiling():
+    _, reranker = create_stub_clients()
+    reranker.shadow_rate = 0.0
+    evidence = chunks(0.9, 0.89, 0.88, 0.87, 0.86, 0.85)
+    full_cost = reranker.estimate_rerank_cost('q', evidence)
+    head_cost = reranker.estimate_rerank_cost('q', evidence[:4])
+
+    meter = UsageMeter(ceiling=(full_cost + head_cost) / 2)
+    _, gate = reranker.rerank_evidence_gated('q', evidence, max_chunks=2, meter=meter)
+    assert (gate['decision'], gate['reason']) == ('downgrade', 'cost_ceiling')
+
+    meter = UsageMeter(ceiling=head_cost / 2)
+    result, gate = reranker.rerank_evidence_gated('q', evidence, max_chunks=2, meter=meter)
+    assert gate['decision'] == 'skip'
+    assert [c['chunk_id'] for c in result] == ['0', '1']
+    assert meter.summary()['downgrades'] == [{'stage': 'rerank', 'change': 'full->skip'}]
+    assert meter.summary()['cost_usd'] == 0
+
+
+def test_spent_budget_falls_back_from_fanout():
+    ragflow_client, _ = create_stub_clients()
+    ragflow_client.analysis_mode = 'fanout'
+    batch = BatchBudget(ceiling=0.0)
+    meter = UsageMeter(batch=batch)
+    result = ragflow_client.run_analysis('Curfew login blocker for Utah minors', meter=meter)
+    assert result.get('analysis_mode') == 'monolithic'
+    assert {'stage': 'analysis', 'change': 'fanout->monolithic'} in meter.summary()['downgrades']
+
+
+def test_ledger_totals_survive_a_reload(tmp_path):
+    path = tmp_path / 'ledger.jsonl'
+    ledger = CostLedger(str(path))
+    meter = UsageMeter()
+    meter.record('analysis', 'ragflow', 400, 100, estimated=True)
+    meter.record('rerank', 'openai', 200, 20)
+    meter.record_downgrade('explanation', 'skipped')
+    ledger.record(meter.summary(), 'monolithic', timestamp='2026-10-19T10:00:00')
+    ledger.record(meter.summary(), None, timestamp='2026-10-19T11:00:00')
+
+    totals = ledger.totals()['2026-10-19']
+    assert set(totals) == {'monolithic', 'unknown'}
+    assert totals['monolithic']['requests'] == 1
+    assert totals['monolithic']['downgrades'] == 1
+    assert totals['monolithic']['stages']['rerank'] == {'calls': 1, 'tokens': 220,
+                                                        'cost_usd': pytest.approx(token_cost('openai', 200, 20))}
+    assert len(path.read_text().splitlines()) == 2
+    assert json.loads(json.dumps(CostLedger.load(str(path)).totals())) == ledger.totals()
@@ -0,0 +1,76 @@
+from multiprocessing import get_context
+
+from decision_store import DecisionStore
+
+
+def audit_record(classification='YES', regulations='Utah Social Media Regulation Act', timestamp='2026-10-01T10:00:00',
+                 confidence='8', cost=0.001):
+    return {'timestamp': timestamp, 'classification': classification, 'confidence_score': confidence,
+            'applicable_regulations': regulations, 'usage': {'cost_usd': cost}}
+
+
+def _append_many(path, classification, count):
+    store = DecisionStore(path)
+    for _ in range(count):
+        store.append([audit_record(classification)])
+
+
+def test_instances_continue_after_each_others_rows(tmp_path):
+    first, second = DecisionStore(str(tmp_path)), DecisionStore(str(tmp_path))
+    first.append([audit_record('YES')] * 10)
+    second.append([audit_record('NO')] * 5)
+    assert len(first) == len(second) == 15
+    assert DecisionStore(str(tmp_path)).query(group_by='classification', use_rollups=False) == {'NO': 5, 'YES': 10}
+
+
+def test_concurrent_processes_do_not_lose_rows(tmp_path):
+    context = get_context('spawn')
+    processes = [context.Process(target=_append_many, args=(str(tmp_path), label, 50)) for label in ('YES', 'NO')]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    store = DecisionStore(str(tmp_path))
+    assert store.query(group_by='classification') == {'NO': 50, 'YES': 50}
+    assert store.query(group_by='classification', use_rollups=False) == {'NO': 50, 'YES': 50}
+
+
+def test_add_buffers_until_flush(tmp_path):
+    writer, reader = DecisionStore(str(tmp_path)), DecisionStore(str(tmp_path))
+    for _ in range(3):
+        writer.add(audit_record())
+    assert len(reader) == 0
+    # A query on the writing instance sees its own buffered records
+    assert writer.query() == 3
+    assert len(reader) == 3
+
+
+def test_classifications_are_normalized(tmp_path):
+    store = DecisionStore(str(tmp_path))
+    labels = ['[YES]', 'Yes.', 'no', 'UNCERTAIN - needs review', 'Probably', '', None]
+    labels += [f"free text {i}" for i in range(300)]
+    store.append([audit_record(label) for label in labels])
+    assert store.query(group_by='classification') == {'NO': 1, 'UNCERTAIN': 1, 'UNKNOWN': 303, 'YES': 2}
+    assert store.meta['dictionaries']['classification'] == ['YES', 'NO', 'UNCERTAIN', 'UNKNOWN']
+    assert store.query(classification='yes') == 2
+
+
+def test_cost_totals_match_between_rollups_and_scans(tmp_path):
+    store = DecisionStore(str(tmp_path))
+    store.append([audit_record(cost=0.000123457 + i * 1e-9, timestamp=f"2026-{1 + i % 12:02d}-15T08:00:00")
+                  for i in range(5000)])
+    for group_by in (None, 'classification', 'regulation', 'month'):
+        assert store.query('total_cost_usd', group_by=group_by) == \
+            store.query('total_cost_usd', group_by=group_by, use_rollups=False)
+
+
+def test_record_decision_reads_the_mode_from_the_audit_record(tmp_path, monkeypatch):
+    from decision_store import get_decision_store, record_decision
+    from stub_backends import create_stub_clients
+
+    monkeypatch.setenv('DECISION_STORE_PATH', str(tmp_path))
+    ragflow_client = create_stub_clients()[0]
+    result = ragflow_client.run_analysis('Curfew login blocker for Utah minors')
+    record_decision(ragflow_client.process_compliance_response(result['answer'], result['evidence'],
+                                                               analysis_mode=result['analysis_mode']))
+    assert get_decision_store().query(group_by='analysis_mode') == {'monolithic': 1}
@@ -0,0 +1,18 @@
+from env_settings import env_float, env_int
+
+
+def test_env_int(monkeypatch):
+    assert env_int('TEST_ENV_SETTING', 3) == 3
+    monkeypatch.setenv('TEST_ENV_SETTING', ' 7 ')
+    assert env_int('TEST_ENV_SETTING', 3) == 7
+    monkeypatch.setenv('TEST_ENV_SETTING', '7.5')
+    assert env_int('TEST_ENV_SETTING', 3) == 3
+
+
+def test_env_float(monkeypatch, capsys):
+    assert env_float('TEST_ENV_SETTING', None) is None
+    monkeypatch.setenv('TEST_ENV_SETTING', '0.25')
+    assert env_float('TEST_ENV_SETTING', 1.0) == 0.25
+    monkeypatch.setenv('TEST_ENV_SETTING', 'one dollar')
+    assert env_float('TEST_ENV_SETTING', 1.0) == 1.0
+    assert "Invalid TEST_ENV_SETTING='one dollar'" in capsys.readouterr().out
@@ -0,0 +1,56 @@
+import pytest
+
+from evaluation_harness import EvaluationHarness
+
+EXAMPLES = [
+    {'id': 'curfew', 'description': 'Curfew login blocker with ASL and GH for Utah minors', 'expected': 'YES'},
+    {'id': 'rollout', 'description': 'Geofences feature rollout in US for market testing', 'expected': 'NO'},
+]
+
+
+@pytest.fixture(scope='module')
+def report():
+    configurations = {
+        'baseline': {'reranker': {'gating_enabled': False}},
+        'gated': {'reranker': {'gating_enabled': True, 'shadow_rate': 1.0}},
+    }
+    return EvaluationHarness(workers=2).run(EXAMPLES, configurations)
+
+
+def test_costs_are_broken_down_by_stage(report):
+    for summary in report['configurations'].values():
+        assert 'analysis' in summary['stage_costs_usd']
+        assert sum(summary['stage_costs_usd'].values()) == pytest.approx(summary['total_cost_usd'])
+
+
+def test_shadow_spend_is_reported_separately(report):
+    baseline, gated = report['configurations']['baseline'], report['configurations']['gated']
+    assert baseline['shadow_cost_usd'] == 0
+    assert gated['shadow_cost_usd'] > 0
+    assert gated['total_cost_usd'] == pytest.approx(sum(o['cost_usd'] for o in gated['outcomes']))
+    assert gated['total_cost_usd'] <= baseline['total_cost_usd'] + 1e-12
+
+
+@pytest.mark.parametrize('answer, predicted', [('[{}]', None), ('{}.', None), ('Cannot tell', 'UNPARSED')])
+def test_decorated_verdicts_are_scored(monkeypatch, answer, predicted):
+    harness = EvaluationHarness(workers=2)
+    create_clients = harness._create_clients
+
+    def decorated_clients():
+        ragflow_client, reranker = create_clients()
+        process = ragflow_client.process_compliance_response
+
+        def decorated(*args, **kwargs):
+            audit_record = process(*args, **kwargs)
+            audit_record['classification'] = answer.format(audit_record['classification'].title())
+            return audit_record
+
+        ragflow_client.process_compliance_response = decorated
+        return ragflow_client, reranker
+
+    monkeypatch.setattr(harness, '_create_clients', decorated_clients)
+    summary = harness.run(EXAMPLES, {'baseline': {}})['configurations']['baseline']
+    if predicted is None:
+        assert summary['accuracy'] == 1.0 and summary['errors'] == 0
+    else:
+        assert [o['predicted'] for o in summary['outcomes']] == [predicted] * len(EXAMPLES)
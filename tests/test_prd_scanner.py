@@ -0,0 +1,122 @@
+import json
+
+from prd_scanner import PRDScanner, discover_features, newly_classified
+from stub_backends import create_stub_clients
+
+
+def write(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding='utf-8')
+
+
+def scan(root, manifest, **kwargs):
+    ragflow_client = create_stub_clients()[0]
+    for name, value in kwargs.items():
+        setattr(ragflow_client, name, value)
+    return ragflow_client, PRDScanner(ragflow_client, workers=2).scan(str(root), str(manifest))
+
+
+def test_manifest_diffing(tmp_path):
+    root, manifest = tmp_path / 'features', tmp_path / 'manifest.json'
+    write(root / 'curfew.md', 'Curfew login blocker for Utah minors')
+    write(root / 'theme.txt', 'Dark theme for settings page')
+    write(root / 'batch.jsonl', json.dumps({'id': 'pf', 'description': 'Market testing of a new feed'}) + '\n')
+
+    _, first = scan(root, manifest)
+    assert first['analyzed'] == 3 and first['unchanged'] == 0
+    assert {change['reason'] for change in first['changes']} == {'added'}
+
+    _, second = scan(root, manifest)
+    assert second['analyzed'] == 0 and second['unchanged'] == 3
+
+    write(root / 'theme.txt', 'Dark theme required by the Digital Services Act')
+    (root / 'batch.jsonl').unlink()
+    _, third = scan(root, manifest)
+    assert third['removed'] == ['batch.jsonl#pf']
+    [change] = third['changes']
+    assert change['entry'] == 'theme.txt' and change['reason'] == 'modified'
+    assert change['previous_classification'] == 'UNCERTAIN' and change['classification'] == 'YES'
+    assert third['flips'] == [change]
+    assert newly_classified(third, 'YES') == [change]
+
+
+def test_prompt_change_rescans_everything(tmp_path):
+    root, manifest = tmp_path / 'features', tmp_path / 'manifest.json'
+    write(root / 'a.md', 'Curfew login blocker for Utah minors')
+    scan(root, manifest)
+    _, report = scan(root, manifest, analysis_mode='fanout')
+    assert [change['reason'] for change in report['changes']] == ['prompt_changed']
+
+
+def test_downgraded_verdict_is_rescanned(tmp_path):
+    root, manifest = tmp_path / 'features', tmp_path / 'manifest.json'
+    write(root / 'a.md', 'Curfew login blocker for Utah minors')
+
+    ragflow_client = create_stub_clients()[0]
+    ragflow_client.analysis_mode = 'fanout'
+    # A zero budget downgrades fan-out to the monolithic prompt
+    PRDScanner(ragflow_client, workers=1, cost_ceiling=0.0).scan(str(root), str(manifest))
+    entry = json.loads(manifest.read_text())['entries']['a.md']
+    assert entry['audit_record']['analysis_mode'] == 'monolithic'
+    assert entry['prompt_hash'] == ragflow_client.prompt_fingerprint('monolithic')
+
+    _, report = scan(root, manifest, analysis_mode='fanout')
+    assert [change['reason'] for change in report['changes']] == ['prompt_changed']
+    _, report = scan(root, manifest, analysis_mode='fanout')
+    assert report['analyzed'] == 0
+
+
+def test_discover_features_skips_hidden_and_empty(tmp_path):
+    write(tmp_path / '.git' / 'x.md', 'ignored')
+    write(tmp_path / 'empty.md', '   ')
+    write(tmp_path / 'nested' / 'a.md', 'Feature A')
+    assert discover_features(str(tmp_path)) == {'nested/a.md': 'Feature A'}
+
+
+def test_malformed_lines_and_duplicate_ids(tmp_path):
+    root = tmp_path / 'features'
+    write(root / 'batch.jsonl', '\n'.join([
+        json.dumps({'id': 'a', 'description': 'First feature'}),
+        '{not json',
+        '["a list"]',
+        json.dumps({'id': 'a', 'description': 'Second feature reusing the id'}),
+        json.dumps({'id': 'b', 'description': 'Third feature'}),
+    ]) + '\n')
+
+    warnings = []
+    features = discover_features(str(root), warnings)
+    assert features == {
+        'batch.jsonl#a': 'First feature',
+        'batch.jsonl#a@4': 'Second feature reusing the id',
+        'batch.jsonl#b': 'Third feature',
+    }
+    assert len(warnings) == 3
+    assert any('duplicate id' in warning for warning in warnings)
+
+
+def test_flips_compare_normalized_verdicts(tmp_path):
+    root, manifest = tmp_path / 'features', tmp_path / 'manifest.json'
+    ragflow_client = create_stub_clients()[0]
+    scanner = PRDScanner(ragflow_client, workers=1)
+    process = ragflow_client.process_compliance_response
+    decorations = iter(['{}.', '[{}]', '{}.'])
+
+    def decorated(*args, **kwargs):
+        # The model often wraps its verdict: 'No.', '[YES]'
+        audit_record = process(*args, **kwargs)
+        audit_record['classification'] = next(decorations).format(audit_record['classification'].title())
+        return audit_record
+
+    ragflow_client.process_compliance_response = decorated
+
+    write(root / 'theme.txt', 'Dark theme rollout for market testing')
+    scanner.scan(str(root), str(manifest))
+    write(root / 'theme.txt', 'Dark theme required by the Digital Services Act')
+    report = scanner.scan(str(root), str(manifest))
+    [change] = report['changes']
+    assert (change['previous_classification'], change['classification']) == ('NO', 'YES')
+    assert change['flipped'] and newly_classified(report, 'YES') == [change]
+
+    write(root / 'theme.txt', 'Dark theme required by the EU Digital Services Act')
+    report = scanner.scan(str(root), str(manifest))
+    assert report['flips'] == [] and newly_classified(report, 'YES') == []
@@ -0,0 +1,55 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from profiler import StackSampler, propagate
+
+
+def spin_in_unrelated_request(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def spin_in_profiled_request(seconds):
+    end = time.time() + seconds
+    while time.time() < end:
+        sum(range(1000))
+
+
+def test_only_attached_threads_are_sampled():
+    stop = threading.Event()
+    other = threading.Thread(target=spin_in_unrelated_request, args=(stop,), name='other-request')
+    other.start()
+    sampler = StackSampler(interval=0.002)
+    sampler.start()
+    try:
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix='analysis') as executor:
+            executor.submit(sampler.wrap(spin_in_profiled_request), 0.2).result()
+    finally:
+        sampler.stop()
+        stop.set()
+        other.join()
+
+    stacks = ' '.join(sampler.counts)
+    assert 'spin_in_profiled_request' in stacks
+    assert 'spin_in_unrelated_request' not in stacks
+    assert all(stack.startswith('analysis;') for stack in sampler.counts)
+
+
+def test_propagate_follows_work_into_child_pools():
+    sampler = StackSampler(interval=0.002)
+    sampler.start()
+
+    def request():
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix='fanout') as executor:
+            list(executor.map(propagate(spin_in_profiled_request), [0.15, 0.15]))
+
+    try:
+        with sampler.attach():
+            request()
+        # Outside attach() nothing is propagated
+        assert propagate(spin_in_profiled_request) is spin_in_profiled_request
+    finally:
+        sampler.stop()
+
+    assert any(stack.startswith('fanout;') and 'spin_in_profiled_request' in stack for stack in sampler.counts)
@@ -0,0 +1,93 @@
+import threading
+import time
+
+from ragflow_client import RAGFlowClient
+from stub_backends import StubAssistant
+
+
+def branch(regulation_id, classification, confidence):
+    return {'regulation_id': regulation_id, 'classification': classification, 'confidence': confidence,
+            'reasoning': 'r', 'regulations': 'None identified'}
+
+
+def test_merge_strips_punctuation_and_brackets():
+    client = RAGFlowClient(assistant=StubAssistant())
+    answer = client._merge_branches([branch('GDPR', '[YES]', 9), branch('NCMEC', 'NO.', 8)])
+    assert answer.startswith('CLASSIFICATION: YES\nCONFIDENCE: 9')
+    answer = client._merge_branches([branch('GDPR', 'NO.', 7), branch('NCMEC', '[NO]', 9)])
+    assert answer.startswith('CLASSIFICATION: NO\nCONFIDENCE: 7')
+
+
+def test_invalid_confidence_threshold_falls_back(monkeypatch):
+    monkeypatch.setenv('RAGFLOW_FANOUT_CONFIDENCE_THRESHOLD', 'high')
+    assert RAGFlowClient(assistant=StubAssistant()).fanout_confidence_threshold == 8
+    monkeypatch.setenv('RAGFLOW_FANOUT_CONFIDENCE_THRESHOLD', '6')
+    assert RAGFlowClient(assistant=StubAssistant()).fanout_confidence_threshold == 6
+
+
+def test_cancelled_stream_is_closed():
+    stop_event = threading.Event()
+    closed = []
+
+    class Message:
+        content = 'CLASSIFICATION: NO'
+
+    class Session:
+        id = 'test'
+
+        def ask(self, prompt, stream=False):
+            # Keep a reference so only an explicit close() can finish the generator
+            self.stream = self._stream()
+            return self.stream
+
+        def _stream(self):
+            try:
+                while True:
+                    yield Message()
+                    stop_event.set()
+            finally:
+                closed.append(True)
+
+    client = RAGFlowClient(assistant=StubAssistant())
+    answer, _, count, cancelled = client._stream_answer(Session(), 'prompt', stop_event)
+    assert cancelled and count == 1 and closed == [True]
+
+
+def test_fanout_early_yes_cancels_and_closes_other_branches():
+    fast, slow = StubAssistant(), StubAssistant(token_delay=0.05)
+    streams = {}
+
+    class RoutingSession:
+        # GDPR answers at once; every other regulation streams slowly
+        def __init__(self, session_id):
+            self.id = session_id
+
+        def ask(self, question, stream=False, **kwargs):
+            regulation = 'GDPR' if 'GDPR' in question else question
+            assistant = fast if regulation == 'GDPR' else slow
+            inner = assistant.create_session().ask(question, stream=stream, **kwargs)
+            streams[regulation] = record = {'finished': False, 'closed': False}
+
+            def tracked():
+                try:
+                    yield from inner
+                    record['finished'] = True
+                finally:
+                    record['closed'] = True
+            return tracked()
+
+    class RoutingAssistant(StubAssistant):
+        def create_session(self, **kwargs):
+            return RoutingSession(super().create_session(**kwargs).id)
+
+    client = RAGFlowClient(assistant=RoutingAssistant())
+    start_time = time.time()
+    result = client.analyze_feature_fanout('Curfew login blocker for Utah minors', confidence_threshold=8)
+
+    assert time.time() - start_time < 0.3
+    assert result['answer'].startswith('CLASSIFICATION: YES')
+    statuses = {branch['regulation_id']: branch['status'] for branch in result['branches']}
+    assert statuses.pop('GDPR') == 'completed'
+    assert set(statuses.values()) == {'cancelled'}
+    others = [record for regulation, record in streams.items() if regulation != 'GDPR']
+    assert others and all(record['closed'] and not record['finished'] for record in others)
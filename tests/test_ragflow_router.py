@@ -0,0 +1,97 @@
+import threading
+import time
+
+from ragflow_router import EndpointRouter, RAGFlowEndpoint
+
+
+def endpoint(name, assistant=True):
+    return RAGFlowEndpoint(f"http://{name}", 'assistant', 'key', assistant=object() if assistant else None)
+
+
+def test_least_outstanding_spreads_load():
+    router = EndpointRouter([endpoint('a'), endpoint('b')])
+    first, second = router.acquire(), router.acquire()
+    assert {first.name, second.name} == {'http://a#assistant', 'http://b#assistant'}
+    router.release(first, ttft=0.1)
+    assert router.acquire() is first
+
+
+def test_ewma_prefers_faster_endpoint_under_equal_load():
+    fast, slow = endpoint('fast'), endpoint('slow')
+    fast.ewma_ttft, slow.ewma_ttft = 0.2, 1.0
+    router = EndpointRouter([slow, fast], policy='ewma')
+    assert router.acquire() is fast
+
+
+def test_ewma_does_not_flood_an_unmeasured_endpoint():
+    measured, new = endpoint('measured'), endpoint('new')
+    measured.ewma_ttft = 0.5
+    router = EndpointRouter([measured, new], policy='ewma')
+    picks = [router.acquire() for _ in range(6)]
+    # The new node is assumed average (0.5 s), so in-flight load alternates the picks
+    assert picks.count(new) == 3 and picks.count(measured) == 3
+
+
+def test_ewma_update():
+    node = endpoint('a')
+    router = EndpointRouter([node], policy='ewma', ewma_alpha=0.5)
+    router.release(router.acquire(), ttft=1.0)
+    router.release(router.acquire(), ttft=0.0)
+    assert node.ewma_ttft == 0.5
+
+
+def test_consecutive_failures_eject_with_doubling_cool_down():
+    bad, good = endpoint('bad'), endpoint('good')
+    router = EndpointRouter([bad, good], failure_threshold=2, ejection_seconds=10)
+    for _ in range(2):
+        router.release(router.acquire(exclude=(good.name,)), failed=True, error='boom')
+    assert bad.is_ejected(time.time())
+    assert bad.ejected_until - time.time() > 9
+    assert all(router.acquire() is good for _ in range(3))
+
+    bad.ejected_until = 0
+    for _ in range(2):
+        router.release(router.acquire(exclude=(good.name,)), failed=True)
+    assert bad.ejected_until - time.time() > 19
+
+    # A success resets the back-off
+    bad.ejected_until = 0
+    router.release(router.acquire(exclude=(good.name,)), ttft=0.1)
+    assert bad.ejections == 0 and bad.consecutive_failures == 0
+
+
+def test_all_ejected_falls_back_to_closest_recovery():
+    a, b = endpoint('a'), endpoint('b')
+    now = time.time()
+    a.ejected_until, b.ejected_until = now + 100, now + 10
+    router = EndpointRouter([a, b])
+    assert router.acquire() is b
+    assert router.acquire(exclude=(a.name, b.name)) is None
+
+
+def test_reconnect_happens_off_the_request_path():
+    node, live = endpoint('down', assistant=False), endpoint('live')
+    release_connect = threading.Event()
+    connected = threading.Event()
+
+    def slow_connect(assistant_wrapper=None):
+        release_connect.wait(5)
+        node.assistant = object()
+        connected.set()
+        return True
+
+    node.connect = slow_connect
+    router = EndpointRouter([node, live])
+    started = time.time()
+    assert router.acquire() is live
+    assert time.time() - started < 1
+    assert node.reconnecting
+
+    release_connect.set()
+    assert connected.wait(5)
+    router.release(live, ttft=0.1)
+    for _ in range(50):
+        if not node.reconnecting:
+            break
+        time.sleep(0.01)
+    assert router.acquire() is node
@@ -0,0 +1,143 @@
+import json
+import random
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+
+import reranking_utils
+from reranking_utils import EvidenceReranker, get_gate_stats, reset_gate_stats
+from stub_backends import StubChatClient
+
+
+def chunks(*scores):
+    return [{'content': f"chunk {i}", 'similarity_score': score, 'chunk_id': str(i)} for i, score in enumerate(scores)]
+
+
+@pytest.fixture(autouse=True)
+def fresh_stats(monkeypatch):
+    reset_gate_stats()
+    monkeypatch.setattr(reranking_utils, '_SHADOW_EXECUTOR', ThreadPoolExecutor(max_workers=1))
+    yield
+    reset_gate_stats()
+
+
+def drain_shadows():
+    reranking_utils._SHADOW_EXECUTOR.shutdown(wait=True)
+
+
+@pytest.mark.parametrize('scores, decision, reason', [
+    ((0.9, 0.5), 'skip', 'too_few_chunks'),
+    ((0.9, 0.5, 0.4, 0.3), 'skip', 'decisive_retrieval'),
+    ((0.9, 0.82, 0.8, 0.3), 'downgrade', 'moderate_margin'),
+    ((0.9, 0.89, 0.88, 0.87), 'full', 'ambiguous_retrieval'),
+])
+def test_gate_decisions(scores, decision, reason):
+    gate = EvidenceReranker(client=StubChatClient()).gate_reranking(chunks(*scores))
+    assert (gate['decision'], gate['reason']) == (decision, reason)
+
+
+def test_invalid_settings_fall_back_to_defaults(monkeypatch):
+    monkeypatch.setenv('RERANK_WINDOW_SIZE', 'twenty')
+    monkeypatch.setenv('RERANK_GATE_SKIP_MARGIN', '15%')
+    monkeypatch.setenv('RERANK_MAX_WORKERS', '8')
+    reranker = EvidenceReranker(client=StubChatClient())
+    assert (reranker.window_size, reranker.gate_skip_margin, reranker.max_workers) == (20, 0.15, 8)
+
+
+def test_stats_are_shared_across_rerankers():
+    first, second = EvidenceReranker(client=StubChatClient()), EvidenceReranker(client=StubChatClient())
+    first.shadow_rate = second.shadow_rate = 0.0
+    first.rerank_evidence_gated('q', chunks(0.9, 0.5, 0.4, 0.3), max_chunks=2)
+    second.rerank_evidence_gated('q', chunks(0.9, 0.89, 0.88, 0.87), max_chunks=2)
+
+    stats = second.get_gate_stats()
+    assert stats == get_gate_stats()
+    assert (stats['total'], stats['skipped'], stats['full']) == (2, 1, 1)
+    assert stats['skip_rate'] == 0.5
+
+
+def test_shadow_reranks_are_costed_and_capped():
+    reranker = EvidenceReranker(client=StubChatClient())
+    reranker.shadow_rate = 1.0
+    evidence = chunks(0.9, 0.5, 0.4, 0.3)
+    reranker.shadow_budget = reranker.estimate_rerank_cost('q', evidence) * 2.5
+    # Hold the shadow worker so every submission is checked against reservations, not actual spend
+    release = threading.Event()
+    reranking_utils._SHADOW_EXECUTOR.submit(release.wait)
+    for _ in range(4):
+        reranker.rerank_evidence_gated('q', evidence, max_chunks=2)
+    release.set()
+    drain_shadows()
+
+    stats = get_gate_stats()
+    assert stats['shadow_samples'] == 2
+    assert stats['shadow_budget_skips'] == 2
+    assert 0 < stats['shadow_cost_usd'] == stats['shadow_cost_today_usd']
+    assert stats['shadow_top1_agreement_rate'] is not None
+
+
+@pytest.fixture
+def plain_reranker():
+    return EvidenceReranker(client=None)
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('[3, 1, 2]', [2, 0, 1]),
+    ('["3", "1"]', [2, 0, 1]),
+    ('```json\n[2, 3]\n```', [1, 2, 0]),
+    ('{"ranking": [2, 1]}', [1, 0, 2]),
+    ('[3, 3, 9, 0, 1', [2, 0, 1]),
+    ('[true, 2]', [1, 0, 2]),
+    ('no ranking at all', [0, 1, 2]),
+])
+def test_parse_ranking(plain_reranker, text, expected):
+    assert plain_reranker._parse_ranking(text, 3) == expected
+
+
+def test_parse_ranking_is_always_a_permutation(plain_reranker):
+    assert sorted(plain_reranker._parse_ranking('[5, "2", 2, "x", 7]', 6)) == list(range(6))
+
+
+class OrderedChatClient:
+    """Ranks each window exactly by the score embedded in the chunk text, and counts calls"""
+
+    def __init__(self):
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=self)
+
+    def create(self, messages=None, **kwargs):
+        self.calls += 1
+        prompt = messages[-1]['content']
+        scores = [int(score) for score in re.findall(r'^Evidence \d+: score=(\d+)', prompt, re.MULTILINE)]
+        ranking = sorted(range(1, len(scores) + 1), key=lambda rank: -scores[rank - 1])
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=json.dumps(ranking)))],
+                               usage=None)
+
+
+def scored_chunks(count, seed):
+    scores = list(range(count))
+    random.Random(seed).shuffle(scores)
+    return [{'content': f"score={score}", 'chunk_id': str(score)} for score in scores]
+
+
+@pytest.mark.parametrize('count', [21, 50, 200])
+def test_windowed_rerank_finds_the_exact_top_k(count):
+    client = OrderedChatClient()
+    reranker = EvidenceReranker(client=client)
+    reranker.window_size, reranker.window_overlap = 20, 5
+    result = reranker._llm_rerank('q', scored_chunks(count, seed=count), max_chunks=5)
+    assert [chunk['chunk_id'] for chunk in result] == [str(count - 1 - i) for i in range(5)]
+    assert client.calls > 1
+
+
+@pytest.mark.parametrize('overlap', [20, 25])
+def test_windowed_rerank_terminates_when_overlap_covers_the_window(overlap):
+    client = OrderedChatClient()
+    reranker = EvidenceReranker(client=client)
+    reranker.window_size, reranker.window_overlap = 20, overlap
+    order = reranker._rerank_windowed('q', scored_chunks(50, seed=1), top_k=5)
+    assert sorted(order) == list(range(50))
+    assert client.calls < 100
@@ -0,0 +1,49 @@
+import pytest
+
+pytest.importorskip('streamlit.testing.v1')
+
+import soak_harness
+from soak_harness import check_bounds, run_soak
+
+BOUNDS = dict(max_rss_growth_mb=50, max_session_growth_kb=64, max_object_growth=50000,
+              max_latency_drift_seconds=1.0)
+
+
+def synthetic_report(**overrides):
+    report = {'errors': 0, 'rss_growth_mb': 1.5, 'session_state_growth_kb': 2.0, 'object_growth': 100,
+              'rerun_latency_drift_seconds': 0.01}
+    report.update(overrides)
+    return report
+
+
+def test_check_bounds_passes_within_limits():
+    assert check_bounds(synthetic_report(), **BOUNDS) == []
+
+
+def test_check_bounds_reports_every_exceeded_limit():
+    failures = check_bounds(synthetic_report(errors=2, rss_growth_mb=80, session_state_growth_kb=100,
+                                             object_growth=60000, rerun_latency_drift_seconds=3),
+                            **BOUNDS)
+    assert len(failures) == 5
+    assert failures[0] == '2 reruns failed'
+    assert 'RSS grew 80 MB' in failures[1]
+
+
+def test_check_bounds_skips_rss_when_unsampled():
+    assert check_bounds(synthetic_report(rss_growth_mb=None), **BOUNDS) == []
+
+
+def test_run_soak_one_session_two_rounds():
+    report = run_soak(sessions=1, rounds=2, warmup_rounds=1)
+    assert report['errors'] == 0
+    assert [sample['round'] for sample in report['samples']] == [1, 2]
+    assert report['rss_growth_mb'] is not None
+    assert check_bounds(report, **BOUNDS) == []
+
+
+def test_run_soak_without_rss_sampling(monkeypatch):
+    monkeypatch.setattr(soak_harness, 'process_rss_mb', lambda: None)
+    report = run_soak(sessions=1, rounds=2, warmup_rounds=1)
+    assert report['rss_growth_mb'] is None
+    assert report['samples'][0]['rss_mb'] is None
+    assert check_bounds(report, **BOUNDS) == []
@@ -0,0 +1,11 @@
+import pytest
+
+from verdicts import parse_verdict
+
+
+@pytest.mark.parametrize('value, verdict', [
+    ('YES', 'YES'), ('[YES]', 'YES'), ('YES.', 'YES'), ('**No**', 'NO'), ('yes - geo-specific', 'YES'),
+    ('Uncertain - needs review', 'UNCERTAIN'), ('', 'UNKNOWN'), (None, 'UNKNOWN'), ('MAYBE', 'UNKNOWN'),
+])
+def test_parse_verdict(value, verdict):
+    assert parse_verdict(value) == verdict
@@ -0,0 +1,24 @@
+"""
+Normalization of the model's free-form CLASSIFICATION answers
+
+The model answers YES / NO / UNCERTAIN, but often wrapped in brackets, markdown
+or punctuation ('[YES]', '**No**', 'Yes.'). Every consumer that compares or
+stores verdicts (fan-out merge, scanner diffs, evaluation, decision store)
+reduces them with parse_verdict first.
+"""
+
+import re
+from typing import Optional
+
+VERDICTS = ('YES', 'NO', 'UNCERTAIN')
+# Answers with no recognizable verdict
+UNKNOWN = 'UNKNOWN'
+
+_FIRST_WORD = re.compile(r'[^A-Za-z]*([A-Za-z]+)')
+
+
+def parse_verdict(value: Optional[str]) -> str:
+    """'[YES]', 'Yes.' or 'NO - not regulated' -> YES / NO; anything unrecognized -> UNKNOWN"""
+    match = _FIRST_WORD.match(value or '')
+    word = match.group(1).upper() if match else ''
+    return word if word in VERDICTS else UNKNOWN